@@ -0,0 +1,212 @@
+from collections import deque
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from budgets import percentile
+
+logger = logging.getLogger(__name__)
+
+# Classes in priority order. reserved slots are only ever used by that class;
+# the rest of ADMISSION_CONCURRENCY is shared, and higher classes get it first.
+#   limit    - most requests of the class running at once
+#   queue    - most requests of the class waiting; beyond that they get a 429 at once
+#   max_wait - seconds a request may wait for a slot before it gets a 429
+DEFAULT_CLASSES = {
+    "interactive": {"reserved": 6, "limit": 16, "queue": 32, "max_wait": 5},
+    "heavy": {"reserved": 2, "limit": 6, "queue": 12, "max_wait": 15},
+}
+# Flask endpoint -> class; endpoints not listed are not admission controlled
+DEFAULT_ROUTE_CLASSES = {
+    "explain_sentence": "interactive",
+    "generate_questions": "interactive",
+    "generate_examples": "interactive",
+    "generate_module_questions": "interactive",
+    "generate_goals": "interactive",
+    "generate_roadmap": "heavy",
+    "refresh_roadmap_section": "heavy",
+    "generate_module_content": "heavy",
+    "generate_learning_cards": "heavy",
+    "generate_mini_module": "heavy",
+}
+# Concurrent requests one worker process runs (gunicorn --threads, less those held by session streams)
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', '16'))
+ADMISSION_WINDOW = int(os.getenv('ADMISSION_WINDOW', '500'))
+
+
+def load_classes():
+    """DEFAULT_CLASSES with per-class overrides from ADMISSION_CLASSES (JSON)"""
+    classes = {name: dict(config) for name, config in DEFAULT_CLASSES.items()}
+    for name, config in json.loads(os.getenv('ADMISSION_CLASSES', '{}')).items():
+        classes.setdefault(name, {"reserved": 0, "limit": ADMISSION_CONCURRENCY, "queue": 0, "max_wait": 5})
+        classes[name].update(config)
+    return classes
+
+
+def load_route_classes():
+    routes = dict(DEFAULT_ROUTE_CLASSES)
+    routes.update(json.loads(os.getenv('ADMISSION_ROUTES', '{}')))
+    return routes
+
+
+class Rejected(Exception):
+    """A request turned away because its class is overloaded"""
+
+    def __init__(self, priority_class, reason, retry_after):
+        super().__init__(f"{priority_class} overloaded: {reason}")
+        self.priority_class = priority_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class PriorityClass:
+    def __init__(self, name, rank, reserved, limit, queue, max_wait):
+        self.name = name
+        self.rank = rank
+        self.reserved = reserved
+        self.limit = max(limit, reserved)
+        self.queue = queue
+        self.max_wait = max_wait
+        self.running = 0
+        # Requests of the class holding one of its reserved slots; the rest of running hold shared ones
+        self.reserved_used = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self.waits = deque(maxlen=ADMISSION_WINDOW)
+        self.service_time = None
+
+    def observe_service(self, seconds):
+        self.service_time = seconds if self.service_time is None else 0.8 * self.service_time + 0.2 * seconds
+
+    def retry_after(self):
+        """Seconds until a queued request would likely get a slot"""
+        service = self.service_time or 1.0
+        return max(1, math.ceil(service * (self.waiting + 1) / max(1, self.limit)))
+
+    def snapshot(self):
+        waits = list(self.waits)
+        return {
+            "reserved": self.reserved,
+            "limit": self.limit,
+            "queue": self.queue,
+            "running": self.running,
+            "reserved_used": self.reserved_used,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait_p50_ms": round(percentile(waits, 50) * 1000, 1) if waits else None,
+            "wait_p95_ms": round(percentile(waits, 95) * 1000, 1) if waits else None,
+            "service_s": round(self.service_time, 3) if self.service_time is not None else None,
+        }
+
+
+class Ticket:
+    """A granted slot; release() it when the request is done"""
+
+    def __init__(self, controller, priority_class, waited, shared):
+        self.controller = controller
+        self.priority_class = priority_class
+        self.waited = waited
+        self.shared = shared
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Reserved concurrency, queue-depth limits and priority between request classes.
+
+    Limits apply per worker process; set ADMISSION_CONCURRENCY to the number
+    of threads each worker runs.
+    """
+
+    def __init__(self, classes=None, route_classes=None, concurrency=ADMISSION_CONCURRENCY):
+        classes = classes if classes is not None else load_classes()
+        self.classes = {name: PriorityClass(name, rank, **config)
+                        for rank, (name, config) in enumerate(classes.items())}
+        self.route_classes = route_classes if route_classes is not None else load_route_classes()
+        self.shared = max(0, concurrency - sum(cls.reserved for cls in self.classes.values()))
+        self.shared_used = 0
+        self.condition = threading.Condition()
+
+    def class_for(self, endpoint):
+        name = self.route_classes.get(endpoint)
+        return self.classes.get(name) if name else None
+
+    def _slot(self, cls):
+        """'reserved', 'shared' or None; the caller holds the condition"""
+        if cls.running >= cls.limit:
+            return None
+        if cls.reserved_used < cls.reserved:
+            return 'reserved'
+        if self.shared_used >= self.shared:
+            return None
+        # Leave shared slots to higher classes that are waiting and could use one
+        if any(other.waiting and other.rank < cls.rank and other.running < other.limit
+               for other in self.classes.values()):
+            return None
+        return 'shared'
+
+    def acquire(self, cls):
+        """Wait for a slot in cls; raises Rejected when the class is overloaded"""
+        start = time.monotonic()
+        with self.condition:
+            slot = self._slot(cls) if not cls.waiting else None
+            if slot is None:
+                if cls.waiting >= cls.queue:
+                    cls.rejected["queue_full"] += 1
+                    raise Rejected(cls.name, 'queue full', cls.retry_after())
+                cls.waiting += 1
+                try:
+                    deadline = start + cls.max_wait
+                    while slot is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            cls.rejected["timeout"] += 1
+                            raise Rejected(cls.name, 'timed out waiting for a slot', cls.retry_after())
+                        self.condition.wait(remaining)
+                        slot = self._slot(cls)
+                finally:
+                    cls.waiting -= 1
+            cls.running += 1
+            if slot == 'shared':
+                self.shared_used += 1
+            else:
+                cls.reserved_used += 1
+            cls.admitted += 1
+            waited = time.monotonic() - start
+            cls.waits.append(waited)
+        return Ticket(self, cls, waited, slot == 'shared')
+
+    def _release(self, ticket):
+        cls = ticket.priority_class
+        with self.condition:
+            cls.running -= 1
+            # Back to the pool the slot came from
+            if ticket.shared:
+                self.shared_used -= 1
+            else:
+                cls.reserved_used -= 1
+            cls.observe_service(time.monotonic() - ticket.started)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "concurrency": self.shared + sum(cls.reserved for cls in self.classes.values()),
+                "shared": self.shared,
+                "shared_used": self.shared_used,
+                "classes": {name: cls.snapshot() for name, cls in self.classes.items()},
+                "routes": self.route_classes,
+            }
+
+
+admission = AdmissionController()
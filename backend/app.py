@@ -1,16 +1,39 @@
-from flask import Flask, render_template, request, jsonify, make_response
+from flask import Flask, render_template, request, jsonify, make_response, g, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from exa_py import Exa
 import anthropic
 import os
-from dotenv import load_dotenv
+from dotenv import load_dotenv, set_key
 from datetime import datetime
 import json
 import re
 import logging
-from functools import wraps
+from functools import partial, wraps
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import time
-from utils import validate_request, parse_goals, parse_markdown_content
+import hmac
+from utils import validate_request, parse_goals, parse_markdown_content, extract_json_object, MarkdownStream
+from utils import extract_fundamental_truths, extract_cross_domain_connections
+from budgets import budgets
+from catalog import catalog, goals_key, CATALOG_KINDS
+from http_cache import finalize_response
+from library import library, content_key, LIBRARY_KINDS
+from search_index import search_index, SEARCH_KINDS
+from roadmap_engine import RoadmapEngine, roadmap_store, uses_goals
+from providers import build_router, set_provider_keys
+from hedging import Hedger
+from question_bank import question_bank, QUESTIONS_PREGENERATE
+from admission import admission, Rejected
+from sessions import sessions, conversations, SESSION_STREAM_RETRY
+import tracing
+import quotas
+from quotas import ledger as quota_ledger
+from profiling import sampler, ProfileAlreadyRunning, PROFILE_INTERVAL_MS
+from mini_modules import mini_modules, card_module_id, parse_mini_module, MINI_MODULE_PREGENERATE
+from resource_index import resource_index, RESOURCE_RESULTS
+from review import review_store, parse_grade, REVIEW_KINDS, DEFAULT_QUEUE_SIZE
+from deadlines import Deadline, pending_jobs, MODULE_DEADLINE, PENDING_GRACE, ROADMAP_RESOURCES_DEADLINE
 from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
 import openai
 import requests
@@ -50,18 +73,32 @@ allowed_origins = [
 CORS(app, resources={
     r"/*": {
         "origins": allowed_origins,
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With"],
-        "expose_headers": ["Content-Length", "X-JSON"],
+        "methods": ["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With", "X-Gyaan-User", "X-Admin-Token"],
+        "expose_headers": ["Content-Length", "X-JSON", "ETag", "Retry-After", "X-Queue-Wait-Ms", "X-Trace-Id"],
         "supports_credentials": True,
         "max_age": 600
     }
 })
 
+class TracedJSONProvider(DefaultJSONProvider):
+    """jsonify() with a span around serialization"""
+
+    def dumps(self, obj, **kwargs):
+        with tracing.span('serialize') as span:
+            body = super().dumps(obj, **kwargs)
+            span.set(bytes=len(body))
+            return body
+
+app.json = TracedJSONProvider(app)
+
 # Initialize API clients
 try:
-    client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
-    exa = Exa(api_key=os.getenv('EXA_API_KEY'))
+    exa = Exa(api_key=os.getenv('EXA_API_KEY'), base_url=os.getenv('EXA_BASE_URL', 'https://api.exa.ai'))
+    # Every LLM call goes through the per-endpoint provider routes
+    providers = build_router()
+    # Latency-critical endpoints listed in HEDGE_ENDPOINTS get a backup call when slow to start
+    hedger = Hedger(providers)
 except Exception as e:
     logger.error(f"Error initializing API clients: {str(e)}")
     raise
@@ -71,6 +108,8 @@ HAIKU_MODEL = "claude-3-haiku-20240307"
 SONNET_MODEL = "claude-3-5-sonnet-20241022"
 MAX_RETRIES = 3
 REQUEST_TIMEOUT = 30
+# Shared secret for the /admin routes; they are not served at all without it
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 
 SYSTEM_PROMPT = """You are a clear, concise educational tutor who:
 
@@ -124,7 +163,8 @@ class PromptManager:
     @classmethod
     def get_prompt(cls, name, **kwargs):
         """Get a formatted prompt"""
-        prompt = cls.load_prompt(name)
+        with tracing.span('prompt.render', prompt=name):
+            prompt = cls.load_prompt(name)
         try:
             return prompt.format(**kwargs)
         except KeyError as e:
@@ -145,6 +185,7 @@ def handle_ai_request(retries=MAX_RETRIES):
                     return f(*args, **kwargs)
                 except anthropic.RateLimitError as e:
                     logger.warning(f"Rate limit hit, attempt {attempt + 1}/{retries}")
+                    tracing.add_event('retry', attempt=attempt + 1, error='rate_limited')
                     time.sleep(2 ** attempt)  # Exponential backoff
                     last_error = e
                 except Exception as e:
@@ -154,6 +195,62 @@ def handle_ai_request(retries=MAX_RETRIES):
         return decorated_function
     return decorator
 
+def degrade_for_quota(params):
+    """Accounts over their token budget get Haiku; returns whether the request was degraded"""
+    if not quota_ledger.degrade():
+        return False
+    params['model'] = HAIKU_MODEL
+    return True
+
+def create_message(endpoint, deadline=None, **kwargs):
+    """Generate through the endpoint's providers with its output budget and record the tokens used"""
+    params = budgets.request_params(endpoint)
+    params.update(kwargs)
+    if deadline is not None:
+        params['timeout'] = deadline.upstream_timeout(params.get('timeout'))
+    degraded = degrade_for_quota(params)
+    # A hedge doubles the spend, so degraded requests never get one
+    hedged = hedger.enabled(endpoint) and not degraded
+    with tracing.span('llm.generate', endpoint=endpoint, model=params.get('model'),
+                      max_tokens=params.get('max_tokens'), hedged=hedged, degraded=degraded) as span:
+        if hedged:
+            completion = hedger.generate(endpoint, params)
+        else:
+            completion = providers.generate(endpoint, params)
+        span.set(provider=completion.provider, output_tokens=completion.output_tokens,
+                 truncated=completion.truncated)
+    if completion.output_tokens:
+        budgets.record(endpoint, completion.output_tokens, truncated=completion.truncated)
+    return completion
+
+def stream_message(endpoint, on_text, cancelled=None, **kwargs):
+    """create_message() that streams text deltas to on_text; None if cancelled midway"""
+    params = budgets.request_params(endpoint)
+    params.update(kwargs)
+    degraded = degrade_for_quota(params)
+    with tracing.span('llm.generate', endpoint=endpoint, model=params.get('model'),
+                      max_tokens=params.get('max_tokens'), streaming=True, degraded=degraded):
+        completion = providers.stream_complete(endpoint, params, on_text, cancelled=cancelled)
+    if completion is not None and completion.output_tokens:
+        budgets.record(endpoint, completion.output_tokens, truncated=completion.truncated)
+    return completion
+
+def current_user_id():
+    """Anonymous per-browser id sent by the frontend, if any"""
+    user_id = (request.headers.get('X-Gyaan-User') or '').strip()
+    return user_id[:64] or None
+
+def quota_account():
+    """The learner id, or the client address for requests without one"""
+    user_id = current_user_id()
+    if user_id:
+        return user_id
+    return f"ip:{request.access_route[0] if request.access_route else request.remote_addr}"
+
+def wants_cached(use_cached):
+    """Stored content is served even on a request for a fresh generation once the account is over budget"""
+    return use_cached or quota_ledger.over_budget()
+
 # Dummy mode for testing
 DUMMY_MODE = False
 
@@ -272,6 +369,18 @@ def handle_error(error):
     print(f"Error: {str(error)}")
     return jsonify(error=str(error)), 500
 
+def goals_request(topic, proficiency):
+    """Claude request parameters for learning goals"""
+    prompt = GOALS_PROMPT.format(topic=topic, proficiency=proficiency)
+    return {
+        "model": HAIKU_MODEL,
+        "system": SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": prompt
+        }]
+    }
+
 @app.route('/generate_goals', methods=['POST'])
 @validate_request(['topic', 'proficiency'])
 @handle_ai_request()
@@ -287,107 +396,31 @@ def generate_goals():
     proficiency = data['proficiency']
     
     logger.debug(f"Generating goals for topic: {topic}, proficiency: {proficiency}")
+
+    # Serve precomputed goals first
+    cached = catalog.get('goals', topic, proficiency)
+    if cached is not None:
+        return jsonify(cached)
     
     # Generate goals using Claude
     try:
-        prompt = prompts.get_prompt('goals', topic=topic, proficiency=proficiency)
-        message = client.messages.create(
-            model=HAIKU_MODEL,
-            max_tokens=1000,
-            system=prompts.get_prompt('system'),
-            messages=[{
-                "role": "user", 
-                "content": prompt
-            }]
-        )
-        
         # Get response from Claude
         try:
-            prompt = GOALS_PROMPT.format(topic=topic, proficiency=proficiency)
-            print(f'[DEBUG] Using prompt: {prompt}')
-            
-            message = client.messages.create(
-                model=HAIKU_MODEL,
-                max_tokens=1000,
-                system=SYSTEM_PROMPT,
-                messages=[{
-                    "role": "user", 
-                    "content": prompt
-                }]
-            )
-            print("[DEBUG] Raw Claude response:", message.content)
+            params = goals_request(topic, proficiency)
+            print(f'[DEBUG] Using prompt: {params["messages"][0]["content"]}')
+            message = create_message('generate_goals', **params)
+            print("[DEBUG] Raw Claude response:", message.text)
         except Exception as e:
             print(f"Error calling Claude API: {str(e)}")
             return jsonify({"error": "Failed to generate goals from AI"}), 500
 
         # Parse the response content
-        goals_text = str(message.content)
-        print("[DEBUG] Initial goals text:", goals_text)
-        
-        def extract_goals(text):
-            # Remove any markdown headers
-            lines = text.split('\n')
-            content_lines = []
-            for line in lines:
-                line = line.strip()
-                # Skip empty lines and headers
-                if not line or line.startswith('#'):
-                    continue
-                # If it's a numbered or bullet point, clean it
-                cleaned_line = line.lstrip('- ').lstrip('* ').lstrip('1234567890. ')
-                if cleaned_line:
-                    content_lines.append(cleaned_line)
-            return content_lines
-
-        # Handle TextBlock format first
-        if 'TextBlock' in goals_text:
-            try:
-                import re
-                text_match = re.search(r"text='([\s\S]*?)'", goals_text, re.DOTALL)
-                if text_match:
-                    goals_text = text_match.group(1)
-                    print("[DEBUG] Extracted from TextBlock:", goals_text)
-            except Exception as e:
-                print(f"[DEBUG] Error extracting from TextBlock: {str(e)}")
-        
-        try:
-            # First try to parse as JSON
-            goals_array = json.loads(goals_text)
-            if isinstance(goals_array, list):
-                print("[DEBUG] Successfully parsed JSON array:", goals_array)
-                clean_goals = []
-                for goal in goals_array:
-                    if isinstance(goal, dict) and 'text' in goal:
-                        clean_goals.extend(extract_goals(goal['text']))
-                    else:
-                        clean_goals.extend(extract_goals(str(goal)))
-                if clean_goals:
-                    return jsonify({"goals": clean_goals})
-        except json.JSONDecodeError:
-            print("[DEBUG] Not a JSON response, trying direct text parsing")
-            
-        # If we get here, treat it as plain text
-        goals_array = extract_goals(goals_text)
-        print("[DEBUG] Extracted goals:", goals_array)
-        
+        with tracing.span('parse', parser='goals'):
+            goals_array = parse_goals(message.text)
+        print("[DEBUG] Parsed goals:", goals_array)
         if goals_array:
+            catalog.put_live('goals', topic, proficiency, {"goals": goals_array})
             return jsonify({"goals": goals_array})
-        
-        # If we still have no valid goals, try one last parsing attempt
-        print("[DEBUG] Final fallback parsing attempt")
-        # Split by any obvious goal separators and clean up
-        final_attempt = []
-        for line in goals_text.split('\n'):
-            line = line.strip()
-            if line and not line.startswith('#'):
-                # Remove common list markers and numbers
-                cleaned = line.lstrip('- ').lstrip('* ').lstrip('1234567890. ')
-                if cleaned and len(cleaned) > 10:  # Assuming a valid goal has some minimum length
-                    final_attempt.append(cleaned)
-        
-        if final_attempt:
-            print("[DEBUG] Final parsed goals:", final_attempt)
-            return jsonify({"goals": final_attempt})
             
         print("[DEBUG] Failed to parse any valid goals")
         return jsonify({"error": "Failed to parse goals from AI response"}), 500
@@ -396,6 +429,113 @@ def generate_goals():
         print(f"Unexpected error in generate_goals: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def format_goals_text(goals):
+    """Format a goals list (or pre-formatted string) as markdown bullets"""
+    # Handle both string and list inputs for goals
+    if isinstance(goals, str):
+        return goals
+    return "\n".join([f"- {goal.strip()}" for goal in goals])
+
+def roadmap_section_request(section, topic, proficiency, goals_text):
+    """Claude request parameters for one section of a roadmap"""
+    # Sections shared across goal sets are stored under a hash without the goals, so never see them
+    goals_line = f"Goals: {goals_text}" if uses_goals(section) else "Cover the topic in general, for any learner."
+    return {
+        "model": SONNET_MODEL,
+        "system": SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": f"""Write the "{section}" section of a learning roadmap for {topic} at {proficiency} level.
+                {goals_line}
+                
+                The full roadmap has these sections; cover only "{section}" and do not repeat the others:
+                {chr(10).join(f'- {name}' for name in ROADMAP_SECTIONS)}
+                
+                Include:
+                1. Clear learning objectives
+                2. Core concepts to master
+                3. Practical exercises
+                4. Time estimates
+                5. Success criteria
+                
+                Start with the header "## {section}" and format as markdown with bullet points."""
+        }]
+    }
+
+def generate_roadmap_section(section, topic, proficiency, goals_text):
+    """Markdown for one roadmap section, always under its own header"""
+    message = create_message('roadmap_section', **roadmap_section_request(section, topic, proficiency, goals_text))
+    return roadmap_section_content(section, message.text)
+
+def roadmap_section_content(section, text):
+    with tracing.span('parse', parser='markdown', section=section):
+        content = parse_markdown_content(text)
+    if not content.startswith('#'):
+        content = f"## {section}\n\n{content}"
+    return content
+
+roadmap_engine = RoadmapEngine(roadmap_store, generate_roadmap_section, sections=ROADMAP_SECTIONS)
+
+def search_resources(topic):
+    """Get relevant learning resources for a topic from ExaAI and add them to the resource index"""
+    with tracing.span('exa.search', topic=topic) as span:
+        search_response = exa.search_and_contents(
+            query=f"best learning resources and tutorials for {topic}",
+            num_results=RESOURCE_RESULTS,
+            use_autoprompt=True
+        )
+        span.set(results=len(search_response.results))
+    
+    # Access the results from 'search_response'
+    results = [{
+        "title": result.title,
+        "url": result.url,
+        "author": getattr(result, 'author', None),
+        "published_date": getattr(result, 'published_date', None),
+    } for result in search_response.results]
+    try:
+        return resource_index.add(topic, results)
+    except Exception as e:
+        logger.error(f"Resource indexing failed: {str(e)}")
+        return [{"title": result['title'] or f"Resource {i+1}", "url": result['url'] or ''}
+                for i, result in enumerate(results)]
+
+def refresh_resources(topic):
+    try:
+        search_resources(topic)
+    except Exception as e:
+        logger.error(f"Resource refresh failed for {topic}: {str(e)}")
+    finally:
+        resource_index.release_refresh(topic)
+
+def fetch_resources(topic):
+    """Learning resources for a topic from the resource index; Exa is searched on a miss"""
+    found = resource_index.lookup(topic)
+    if found.hit:
+        return found.resources
+    if found.resources:
+        # Stale: serve them and refresh in the background
+        if resource_index.claim_refresh(topic):
+            pending_jobs.submit(refresh_resources, topic)
+        return found.resources
+    return search_resources(topic)
+
+def fetch_resources_within(topic, pending):
+    """Exa resources if they arrive within ROADMAP_RESOURCES_DEADLINE, otherwise the last ones seen for the topic"""
+    # Counted from the start of the lookup, which has threads of its own
+    deadline = Deadline(ROADMAP_RESOURCES_DEADLINE)
+    future = pending_jobs.submit_lane('resources', fetch_resources, topic)
+    try:
+        return future.result(timeout=deadline.remaining())
+    except FutureTimeoutError:
+        pending['resources'] = pending_jobs.park(future, 'resources')
+    except Exception as e:
+        # One more try in the background, same as a late answer
+        logger.error(f"Resource search failed: {str(e)}")
+        pending['resources'] = pending_jobs.park(pending_jobs.submit_lane('resources', fetch_resources, topic),
+                                                 'resources')
+    return roadmap_store.find_resources(topic)
+
 @app.route('/generate_roadmap', methods=['POST'])
 def generate_roadmap():
     print('[app.py] generate_roadmap starting')
@@ -413,77 +553,45 @@ def generate_roadmap():
         topic = data.get('topic')
         goals = data.get('goals', [])  # Default to empty list if missing
         proficiency = data.get('proficiency')
+        # Set when the learner edits the goals of a roadmap they already have
+        roadmap_id = data.get('roadmapId')
         
         # Validate inputs
         if not topic or not goals or not proficiency:
             return jsonify({'error': 'Missing required fields'}), 400
             
         # Convert goals list to a formatted string
-        # Handle both string and list inputs for goals
-        if isinstance(goals, str):
-            goals_text = goals
-        else:
-            goals_text = "\n".join([f"- {goal.strip()}" for goal in goals])
+        goals_text = format_goals_text(goals)
+        user_id = current_user_id()
+
+        # Precomputed roadmaps are only valid for the goals they were built from
+        cached = None if roadmap_id else catalog.get('roadmap', topic, proficiency, variant=goals_key(goals_text))
+        if cached is not None:
+            adopted_id = roadmap_engine.adopt(topic, proficiency, goals_text, cached, user_id=user_id)
+            return jsonify({**cached, "roadmapId": adopted_id} if adopted_id else cached)
         
         print(f"Generating roadmap for topic: {topic}, goals: {goals_text}")
         
-        # Generate roadmap with Claude
-        message = client.messages.create(
-            model=SONNET_MODEL,  # Using more capable model for better roadmap
-            max_tokens=3000,     # Increased token limit
-            system=SYSTEM_PROMPT,
-            messages=[{
-                "role": "user",
-                "content": f"""Create a comprehensive learning roadmap for {topic} at {proficiency} level.
-                Goals: {goals_text}
-                
-                Your response MUST include ALL of these sections with equal detail:
-                {chr(10).join(f'- {section}' for section in ROADMAP_SECTIONS)}
-                
-                For each section, include:
-                1. Clear learning objectives
-                2. Core concepts to master
-                3. Practical exercises
-                4. Time estimates
-                5. Success criteria
-                
-                Format as markdown with clear headers and bullet points."""
-            }]
+        # Only sections whose inputs changed are sent to Claude, in parallel
+        pending = {}
+        response_data = roadmap_engine.generate(
+            topic, proficiency, goals_text,
+            lambda topic: fetch_resources_within(topic, pending),
+            roadmap_id=roadmap_id, user_id=user_id
         )
-        
-        print("Roadmap generated, fetching resources...")
-        
-        # Get relevant resources from ExaAI
-        search_response = exa.search_and_contents(
-            query=f"best learning resources and tutorials for {topic}",
-            num_results=5,
-            use_autoprompt=True
-        )
-        
-        # Access the results from 'search_response'
-        resources = []
-        for i, result in enumerate(search_response.results):
-            resources.append({
-                "title": result.title if result.title else f"Resource {i+1}",
-                "url": result.url if result.url else ''
-            })
-        
-        roadmap_content = str(message.content)
-        
-        # Handle TextBlock format
-        if 'TextBlock' in roadmap_content:
-            try:
-                import re
-                text_match = re.search(r"text='(.*?)'", roadmap_content, re.DOTALL)
-                if text_match:
-                    roadmap_content = text_match.group(1)
-            except Exception as e:
-                print(f"Error extracting from TextBlock: {str(e)}")
-        
-        response_data = {
-            "roadmap": roadmap_content,  # Now cleaned from TextBlock format
-            "resources": resources
-        }
+        print(f"Roadmap ready, regenerated sections: {response_data['regenerated']}")
+
+        if pending:
+            # Late resources are fetched via /pending; keep the degraded copy out of the catalog
+            response_data.update(status="partial", pending=pending)
+        elif response_data['failed']:
+            # Sections that failed are refreshed later; keep the placeholders out of the catalog
+            response_data["status"] = "partial"
+        else:
+            shared = {key: response_data[key] for key in ('roadmap', 'resources', 'sections')}
+            catalog.put_live('roadmap', topic, proficiency, shared, variant=goals_key(goals_text))
+        if response_data['regenerated']:
+            index_roadmap(response_data, topic, proficiency, user_id)
         
         print("Sending response...")
         return jsonify(response_data)
@@ -491,6 +599,108 @@ def generate_roadmap():
         print("Error in generate_roadmap:", str(e))  # Debug print
         return jsonify({'error': str(e)}), 500
 
+def index_roadmap(response_data, topic, proficiency, user_id):
+    search_index.record(
+        f"roadmap:{response_data['roadmapId']}", 'roadmap',
+        f"{topic} roadmap ({proficiency})", response_data['roadmap'],
+        topic=topic, user_id=user_id, ref=response_data['roadmapId']
+    )
+
+@app.route('/roadmap/<roadmap_id>', methods=['GET'])
+def get_roadmap(roadmap_id):
+    """A stored roadmap with its sections and their input hashes"""
+    response_data = roadmap_engine.get(roadmap_id, current_user_id())
+    if response_data is None:
+        return jsonify({'error': 'Roadmap not found'}), 404
+    return jsonify(response_data)
+
+@app.route('/roadmap/<roadmap_id>/sections/<int:position>/refresh', methods=['POST'])
+def refresh_roadmap_section(roadmap_id, position):
+    """Regenerate a single section of a stored roadmap"""
+    try:
+        user_id = current_user_id()
+        response_data = roadmap_engine.refresh_section(roadmap_id, position, user_id=user_id)
+        if response_data is None:
+            return jsonify({'error': 'Roadmap section not found'}), 404
+        roadmap = roadmap_store.load(roadmap_id)
+        index_roadmap(response_data, roadmap['topic'], roadmap['proficiency'], user_id)
+        return jsonify(response_data)
+    except Exception as e:
+        print("Error in refresh_roadmap_section:", str(e))
+        return jsonify({'error': str(e)}), 500
+
+# Module fields that are indexed for search, with the heading shown in results
+MODULE_SECTIONS = (
+    ('firstPrinciples', 'First Principles'),
+    ('keyInformation', 'Key Information'),
+    ('practiceExercise', 'Practice Exercise'),
+)
+
+def module_section_request(field, topic, proficiency, goals_text):
+    """Budget endpoint and Claude request parameters for one module section"""
+    if field == 'firstPrinciples':
+        return 'first_principles', {
+            "model": SONNET_MODEL,  # Using more capable model for deeper analysis
+            "system": SYSTEM_PROMPT,
+            "messages": [{
+                "role": "user",
+                "content": prompts.get_prompt('first_principles', 
+                    topic=topic, 
+                    proficiency=proficiency,
+                    goals=goals_text)
+            }]
+        }
+    if field == 'keyInformation':
+        endpoint, instruction = 'key_information', 'Generate key information and concepts for learning'
+    else:
+        endpoint, instruction = 'practice_exercise', 'Generate a practice exercise for learning'
+    return endpoint, {
+        "model": HAIKU_MODEL,
+        "system": SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": f"""{instruction} {topic}.
+                Proficiency level: {proficiency}
+                Learning goals:
+                {goals_text}"""
+        }]
+    }
+
+def generate_module_section(field, topic, proficiency, goals_text, deadline):
+    """Response fields produced by one module section"""
+    with tracing.span('module.section', section=field):
+        with tracing.span('prompt.render', section=field):
+            endpoint, params = module_section_request(field, topic, proficiency, goals_text)
+        message = create_message(endpoint, deadline=deadline, **params)
+        with tracing.span('parse', parser='markdown', section=field) as span:
+            if field == 'firstPrinciples':
+                fields = {
+                    "firstPrinciples": parse_markdown_content(message.text),
+                    "fundamentalTruths": extract_fundamental_truths(message.text),
+                    "crossDomainConnections": extract_cross_domain_connections(message.text),
+                }
+                span.set(fundamental_truths=len(fields["fundamentalTruths"]),
+                         cross_domain_connections=len(fields["crossDomainConnections"]))
+                return fields
+            return {field: parse_markdown_content(message.text)}
+
+def finish_module(partial_data, section_results, user_id, topic, module_key):
+    """Store the complete module once the sections that missed the deadline arrive"""
+    response_data = dict(partial_data)
+    for fields in section_results:
+        response_data.update(fields)
+    response_data["status"] = "complete"
+    library.record(user_id, 'modules', topic, response_data, module_key)
+    index_module(response_data, topic, user_id, module_key)
+    pregenerate_questions(topic, response_data)
+
+def index_module(response_data, topic, user_id, module_key):
+    for field, heading in MODULE_SECTIONS:
+        search_index.record(
+            f"{module_key}:{field}", 'module', f"{topic}: {heading}", response_data[field],
+            topic=topic, user_id=user_id, ref=module_key
+        )
+
 @app.route('/generate_module_content', methods=['POST'])
 def generate_module_content():
     print('[app.py] generate_module_content starting')
@@ -516,68 +726,58 @@ def generate_module_content():
         # Format goals into string
         goals_text = "\n".join([f"- {goal}" for goal in goals])
 
-        # Generate first principles content
-        first_principles_message = client.messages.create(
-            model=SONNET_MODEL,  # Using more capable model for deeper analysis
-            max_tokens=2000,
-            system=SYSTEM_PROMPT,
-            messages=[{
-                "role": "user",
-                "content": prompts.get_prompt('first_principles', 
-                    topic=topic, 
-                    proficiency=proficiency,
-                    goals=goals_text)
-            }]
-        )
-
-        # Generate key information content
-        key_info_message = client.messages.create(
-            model=HAIKU_MODEL, 
-            max_tokens=1000,
-            system=SYSTEM_PROMPT,
-            messages=[{
-                "role": "user",
-                "content": f"""Generate key information and concepts for learning {topic}.
-                Proficiency level: {proficiency}
-                Learning goals:
-                {goals_text}"""
-            }]
-        )
-
-        # Generate practice exercise
-        practice_message = client.messages.create(
-            model=HAIKU_MODEL,
-            max_tokens=1000,
-            system=SYSTEM_PROMPT,
-            messages=[{
-                "role": "user",
-                "content": f"""Generate a practice exercise for learning {topic}.
-                Proficiency level: {proficiency}
-                Learning goals:
-                {goals_text}"""
-            }]
-        )
-
-        def clean_text_block(content):
-            content_str = str(content)
-            if 'TextBlock' in content_str:
-                try:
-                    import re
-                    text_match = re.search(r"text='(.*?)'", content_str, re.DOTALL)
-                    if text_match:
-                        return text_match.group(1)
-                except Exception as e:
-                    print(f"Error extracting from TextBlock: {str(e)}")
-            return content_str
-
-        response_data = {
-            "firstPrinciples": clean_text_block(first_principles_message.content),
-            "fundamentalTruths": extract_fundamental_truths(first_principles_message.content),
-            "crossDomainConnections": extract_cross_domain_connections(first_principles_message.content),
-            "keyInformation": clean_text_block(key_info_message.content),
-            "practiceExercise": clean_text_block(practice_message.content)
-        }
-
+        # A module generated from the same inputs on another device is reused
+        user_id = current_user_id()
+        module_key = content_key(topic, proficiency, goals_text)
+        stored = library.find('modules', module_key, user_id,
+                              on_shared=lambda payload, shared_topic: index_module(payload, shared_topic, user_id, module_key))
+        if stored is not None:
+            return jsonify(stored)
+        if quota_ledger.over_budget():
+            # Over budget: the newest module on the topic rather than three new generations
+            latest = library.find_latest('modules', topic)
+            if latest is not None:
+                return jsonify({**latest, "degraded": True})
+
+        # The three sections run in parallel; whatever is not back by the
+        # deadline is returned as pending instead of holding the response
+        deadline = Deadline(MODULE_DEADLINE)
+        results, failed, running = pending_jobs.gather({
+            field: partial(generate_module_section, field, topic, proficiency, goals_text, deadline)
+            for field, _ in MODULE_SECTIONS
+        }, deadline)
+
+        response_data = {"fundamentalTruths": [], "crossDomainConnections": []}
+        for fields in results.values():
+            response_data.update(fields)
+        if not failed and not running:
+            response_data["status"] = "complete"
+            library.record(user_id, 'modules', topic, response_data, module_key)
+            index_module(response_data, topic, user_id, module_key)
+            pregenerate_questions(topic, response_data)
+            return jsonify(response_data)
+
+        # Failed sections get one more try in the background
+        for field in failed:
+            running[field] = pending_jobs.submit(
+                generate_module_section, field, topic, proficiency, goals_text, Deadline(PENDING_GRACE, grace=0))
+        pending = {field: pending_jobs.park(future, 'module_section') for field, future in running.items()}
+        pending_jobs.when_all(list(running.values()), partial(finish_module, dict(response_data),
+                                                              user_id=user_id, topic=topic, module_key=module_key))
+
+        # Meanwhile show the newest module on the same topic for the missing parts
+        fallback = library.find_latest('modules', topic) or {}
+        fallbacks = []
+        for field in pending:
+            response_data[field] = fallback.get(field) or ''
+            if fallback.get(field):
+                fallbacks.append(field)
+        if 'firstPrinciples' in fallbacks:
+            response_data["fundamentalTruths"] = fallback.get('fundamentalTruths', [])
+            response_data["crossDomainConnections"] = fallback.get('crossDomainConnections', [])
+
+        response_data.update(status="partial", pending=pending, fallbacks=fallbacks)
+        print(f"[app.py] generate_module_content partial after {deadline.elapsed():.1f}s, pending: {list(pending)}")
         return jsonify(response_data)
 
     except Exception as e:
@@ -585,18 +785,144 @@ def generate_module_content():
         print(f"Error generating module content: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/pending/<job_id>', methods=['GET'])
+def get_pending_job(job_id):
+    """Result of a section that missed its request's deadline"""
+    job = pending_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job)
+
+@app.before_request
+def start_request_trace():
+    """Root span of the request; every span opened while handling it nests under this one"""
+    if request.method == 'OPTIONS':
+        return None
+    g.trace_span = tracing.start_trace(f"{request.method} {request.endpoint}", endpoint=request.endpoint,
+                                       method=request.method, path=request.path)
+    g.trace_span.__enter__()
+    return None
+
+@app.before_request
+def bind_quota_account():
+    """Charge the tokens this request generates, here and on the workers it hands off to"""
+    if request.method == 'OPTIONS':
+        return None
+    g.quota_token = quotas.bind_account(quota_account())
+    return None
+
+@app.before_request
+def admit_request():
+    """Hold or turn away the request according to its route's priority class"""
+    priority_class = admission.class_for(request.endpoint)
+    if priority_class is None or request.method == 'OPTIONS':
+        return None
+    try:
+        with tracing.span('admission.wait', priority_class=priority_class.name):
+            g.admission_ticket = admission.acquire(priority_class)
+    except Rejected as e:
+        logger.info(f"Rejected {request.endpoint}: {e}")
+        response = jsonify({'error': 'Server busy, please retry', 'class': e.priority_class, 'reason': e.reason})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return None
+
+@app.teardown_request
+def release_admission(exc=None):
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        ticket.release()
+
+@app.after_request
+def add_queue_wait(response):
+    ticket = g.get('admission_ticket')
+    if ticket is not None:
+        response.headers['X-Queue-Wait-Ms'] = f"{ticket.waited * 1000:.1f}"
+    return response
+
 @app.after_request
 def add_header(response):
-    if 'Cache-Control' not in response.headers:
-        response.headers['Cache-Control'] = 'no-store'
+    # Cache-Control per route, content ETags with 304s and gzip/brotli
+    with tracing.span('response.finalize') as span:
+        response = finalize_response(response)
+        span.set(encoding=response.headers.get('Content-Encoding'))
+    root = g.get('trace_span')
+    if root is not None and root.trace is not None:
+        root.set(status_code=response.status_code)
+        response.headers['X-Trace-Id'] = root.trace.id
     return response
 
-@app.route('/explain-sentence', methods=['POST', 'OPTIONS'])
+@app.teardown_request
+def unbind_quota_account(exc=None):
+    token = g.pop('quota_token', None)
+    if token is not None:
+        quotas.reset_account(token)
+
+@app.teardown_request
+def end_request_trace(exc=None):
+    root = g.pop('trace_span', None)
+    if root is not None:
+        root.__exit__(type(exc) if exc else None, exc, None)
+        if root.trace is not None:
+            sampler.request_finished(root.trace.id, root.duration_ms)
+
+EXPLAIN_SYSTEM = "You are a knowledgeable expert who explains concepts clearly and concisely. Focus on making dense, information-rich explanations that highlight key terminology and relationships."
+
+def explain_text(topic, sentence, user_id, context_key, on_text=None, cancelled=None):
+    """Explanation of a sentence, in the context of the learner's last explanations on the topic.
+
+    With on_text the explanation is streamed; returns None if cancelled midway.
+    """
+    # Recent exchanges on this topic for this learner (not shared across users)
+    messages = conversations.history(context_key, topic) + [{
+        "role": "user",
+        "content": f"""Explain '{sentence}' in the context of {topic}. Structure your response as a single paragraph under 70 words. Use simple english and key words. Get right to the answer, do not use  phrases like 'in the context of' or 'in relation to'.
+
+Make every word count - pack in meaning while maintaining readability."""
+    }]
+    params = {"model": SONNET_MODEL, "system": EXPLAIN_SYSTEM, "messages": messages}
+    if on_text is None:
+        explanation = parse_markdown_content(create_message('explain_sentence', **params).text)
+    else:
+        # Deltas go out normalized as they arrive, adding up to the normalized explanation
+        markdown = MarkdownStream()
+        def on_delta(text):
+            shown = markdown.feed(text)
+            if shown:
+                on_text(shown)
+        response = stream_message('explain_sentence', on_delta, cancelled=cancelled, **params)
+        if response is None:
+            return None
+        rest = markdown.flush()
+        if rest:
+            on_text(rest)
+        explanation = parse_markdown_content(response.text)
+
+    conversations.remember(context_key, topic, messages + [{"role": "assistant", "content": explanation}])
+
+    explanation_key = content_key(topic, sentence)
+    library.record(user_id, 'explanations', topic, {
+        'selectedText': sentence,
+        'content': explanation,
+        'timestamp': datetime.now().isoformat()
+    }, explanation_key)
+    index_explanation(explanation_key, topic, sentence, explanation, user_id)
+    return explanation
+
+def index_explanation(explanation_key, topic, sentence, explanation, user_id):
+    search_index.record(explanation_key, 'explanation', sentence, explanation,
+                        topic=topic, user_id=user_id, ref=explanation_key)
+    review_store.record(user_id, [('explanation', topic, sentence, explanation)])
+
+def stored_explanation(topic, sentence, user_id):
+    explanation_key = content_key(topic, sentence)
+    stored = library.find('explanations', explanation_key, user_id, on_shared=lambda payload, shared_topic: (
+        index_explanation(explanation_key, shared_topic, sentence, payload['content'], user_id)))
+    return None if stored is None else stored['content']
+
+@app.route('/explain-sentence', methods=['POST'])
 def explain_sentence():
-    if request.method == 'OPTIONS':
-        # Respond to preflight request
-        return make_response('', 200)
-    
     try:
         data = request.get_json()
         sentence = data.get('sentence')
@@ -609,75 +935,27 @@ def explain_sentence():
         print(f"Error in explain_sentence: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-    try:
-        # Get the last conversation for this topic if it exists
-        conversation_history = []
-        if hasattr(client, 'last_conversation') and client.last_conversation.get('topic') == topic:
-            conversation_history = client.last_conversation.get('messages', [])
-
-        # Create the new message
-        messages = conversation_history + [{
-            "role": "user",
-            "content": f"""Explain '{sentence}' in the context of {topic}. Structure your response as a single paragraph under 70 words. Use simple english and key words. Get right to the answer, do not use  phrases like 'in the context of' or 'in relation to'.
-
-Make every word count - pack in meaning while maintaining readability."""
-        }]
-
-        response = client.messages.create(
-            model=SONNET_MODEL,
-            max_tokens=1600,
-            system="You are a knowledgeable expert who explains concepts clearly and concisely. Focus on making dense, information-rich explanations that highlight key terminology and relationships.",
-            messages=messages
-        )
-
-        # Store this conversation for future context
-        client.last_conversation = {
-            'topic': topic,
-            'messages': messages + [{"role": "assistant", "content": str(response.content)}]
-        }
+    user_id = current_user_id()
+    if wants_cached(data.get('useCached', True)):
+        stored = stored_explanation(topic, sentence, user_id)
+        if stored is not None:
+            return jsonify({'explanation': stored})
 
-        # Convert the response content to a string
-        explanation = str(response.content)
-        
-        # Clean up the TextBlock format if present
-        if 'TextBlock' in explanation:
-            import re
-            text_match = re.search(r"text='(.*?)'", explanation, re.DOTALL)
-            if text_match:
-                explanation = text_match.group(1)
-        
+    try:
+        explanation = explain_text(topic, sentence, user_id, user_id)
         return jsonify({'explanation': explanation})
     except Exception as e:
         logger.error(f"Error in explain_sentence: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/generate_learning_cards', methods=['POST', 'OPTIONS'])
-def generate_learning_cards():
-    # Handle preflight request
-    if request.method == 'OPTIONS':
-        response = make_response()
-        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-        return response, 200
-        
-    try:
-        data = request.get_json()
-        print("Received data:", data)
-        topic = data.get('topic')
-        proficiency = data.get('proficiency')
-        
-        if not topic or not proficiency:
-            return jsonify({'error': 'Missing required fields'}), 400
-
-        # Generate cards using Claude
-        message = client.messages.create(
-            model=HAIKU_MODEL,
-            max_tokens=1000,
-            system=SYSTEM_PROMPT,
-            messages=[{
-                "role": "user",
-                "content": f"""Generate 3 learning cards for {topic} at {proficiency} level. Each card should be:
+def cards_request(topic, proficiency):
+    """Claude request parameters for the three learning cards"""
+    return {
+        "model": HAIKU_MODEL,
+        "system": SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": f"""Generate 3 learning cards for {topic} at {proficiency} level. Each card should be:
 1. A real-world success story, achievement, or theoretical breakthrough
 2. Inspiring and motivational
 3. Related to {topic}
@@ -706,143 +984,217 @@ Return the response in this exact JSON format, with no additional text or format
         }}
     ]
 }}"""
-            }]
-        )
+        }]
+    }
+
+def parse_cards_response(response_content):
+    """Parse and validate a cards response, raising ValueError if it is unusable"""
+    # Clean up the response if it contains TextBlock
+    if 'TextBlock' in response_content:
+        # Look for JSON object pattern rather than just text
+        json_match = re.search(r'\{[\s\S]*\}', response_content)
+        if json_match:
+            response_content = json_match.group(0)
+    
+    # Remove any leading/trailing whitespace and newlines
+    response_content = response_content.strip()
+    
+    # Parse the JSON response
+    parsed_content = json.loads(response_content)
+    
+    # Validate the response structure
+    if not isinstance(parsed_content, dict) or 'cards' not in parsed_content:
+        raise ValueError('Response missing cards array')
+    
+    if not isinstance(parsed_content['cards'], list) or len(parsed_content['cards']) != 3:
+        raise ValueError('Response must contain exactly 3 cards')
+    
+    for card in parsed_content['cards']:
+        required_fields = ['id', 'title', 'description', 'type']
+        if not all(field in card for field in required_fields):
+            raise ValueError('Cards missing required fields')
+    return parsed_content
+
+def fallback_cards(topic, proficiency):
+    """Generic cards used when the AI response cannot be parsed"""
+    return {
+        "cards": [
+            {
+                "id": 1,
+                "title": f"Getting Started with {topic}",
+                "description": f"Learn the fundamental concepts of {topic} at {proficiency} level.",
+                "type": "introduction"
+            },
+            {
+                "id": 2,
+                "title": f"Core Principles of {topic}",
+                "description": f"Master the essential principles and techniques in {topic}.",
+                "type": "theory"
+            },
+            {
+                "id": 3,
+                "title": f"Real-World Applications of {topic}",
+                "description": f"Discover how {topic} is applied in practical scenarios.",
+                "type": "achievement"
+            }
+        ]
+    }
+
+@app.route('/generate_learning_cards', methods=['POST'])
+def generate_learning_cards():
+    try:
+        data = request.get_json()
+        print("Received data:", data)
+        topic = data.get('topic')
+        proficiency = data.get('proficiency')
+        
+        if not topic or not proficiency:
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        cached = catalog.get('cards', topic, proficiency)
+        if cached is not None:
+            return jsonify(attach_mini_modules(topic, cached, pregenerate=MINI_MODULE_PREGENERATE))
+
+        # Generate cards using Claude
+        message = create_message('generate_learning_cards', **cards_request(topic, proficiency))
 
         # Parse the response and ensure it's properly formatted
         try:
-            response_content = str(message.content)
-            
-            # Clean up the response if it contains TextBlock
-            if 'TextBlock' in response_content:
-                import re
-                # Look for JSON object pattern rather than just text
-                json_match = re.search(r'\{[\s\S]*\}', response_content)
-                if json_match:
-                    response_content = json_match.group(0)
-            
-            # Remove any leading/trailing whitespace and newlines
-            response_content = response_content.strip()
+            with tracing.span('parse', parser='cards'):
+                parsed_content = parse_cards_response(message.text)
+            catalog.put_live('cards', topic, proficiency, parsed_content)
             
-            # Parse the JSON response
-            parsed_content = json.loads(response_content)
-            
-            # Validate the response structure
-            if not isinstance(parsed_content, dict) or 'cards' not in parsed_content:
-                raise ValueError('Response missing cards array')
-            
-            if not isinstance(parsed_content['cards'], list) or len(parsed_content['cards']) != 3:
-                raise ValueError('Response must contain exactly 3 cards')
-            
-            for card in parsed_content['cards']:
-                required_fields = ['id', 'title', 'description', 'type']
-                if not all(field in card for field in required_fields):
-                    raise ValueError('Cards missing required fields')
-                
-            # Store the descriptions for use in mini module
-            descriptions = [card['description'] for card in parsed_content['cards']]
-            app.config['last_card_descriptions'] = descriptions
-            
-            return jsonify(parsed_content)
+            return jsonify(attach_mini_modules(topic, parsed_content, pregenerate=MINI_MODULE_PREGENERATE))
             
         except Exception as e:
             print(f"Error parsing AI response: {str(e)}")
-            print(f"Raw response: {message.content}")
+            print(f"Raw response: {message.text}")
             
             # Fallback to dummy cards if parsing fails
-            fallback_cards = {
-                "cards": [
-                    {
-                        "id": 1,
-                        "title": f"Getting Started with {topic}",
-                        "description": f"Learn the fundamental concepts of {topic} at {proficiency} level.",
-                        "type": "introduction"
-                    },
-                    {
-                        "id": 2,
-                        "title": f"Core Principles of {topic}",
-                        "description": f"Master the essential principles and techniques in {topic}.",
-                        "type": "theory"
-                    },
-                    {
-                        "id": 3,
-                        "title": f"Real-World Applications of {topic}",
-                        "description": f"Discover how {topic} is applied in practical scenarios.",
-                        "type": "achievement"
-                    }
-                ]
-            }
-            return jsonify(fallback_cards)
+            return jsonify(fallback_cards(topic, proficiency))
             
     except Exception as e:
         print(f"Error in generate_learning_cards: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def attach_mini_modules(topic, cards_payload, pregenerate=False):
+    """Cards with the id of each card's mini module; pregenerate starts those in the background"""
+    cards = []
+    for card in cards_payload.get('cards', []):
+        card_context = {"title": card.get('title', ''), "description": card.get('description', '')}
+        if pregenerate:
+            # Speculative, so on its own few threads rather than the pool requests wait on
+            module_id = mini_modules.start(topic, card_context, generate_mini_module_for,
+                                           partial(pending_jobs.submit_lane, 'pregenerate'))
+        else:
+            module_id = card_module_id(topic, card_context)
+        cards.append({**card, "moduleId": module_id})
+    return {**cards_payload, "cards": cards}
+
+def mini_module_request(topic, card):
+    """Claude request parameters for a mini module on one card"""
+    context = card.get('description') or "No previous context available."
+    title = card.get('title') or topic
+    return {
+        "model": SONNET_MODEL,
+        "system": SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": f"""
+Create a mini learning module about {title} (topic: {topic}) using the context {context}. Include:
+
+1. description: A clear description of the concept (5 concise dense sentences)
+2. fundamentals: The fundamental truths/first principles (3-5 bullet points)
+3. summary: A concise summary under 20 words in simple but conceptually dense language
+
+Return only a JSON object with the keys "description", "fundamentals" (a list of strings) and "summary". Markdown is allowed inside the strings."""
+        }]
+    }
+
+def generate_mini_module_for(topic, card):
+    """{description, fundamentals, summary} for one card"""
+    message = create_message('generate_mini_module', **mini_module_request(topic, card))
+    with tracing.span('parse', parser='mini_module'):
+        return parse_mini_module(message.text)
+
 @app.route('/generate_mini_module', methods=['POST'])
 @handle_ai_request()
 def generate_mini_module():
     try:
         data = request.get_json()
         topic = data.get('topic')
+        module_id = data.get('moduleId')
         
         if not topic:
             return jsonify({'error': 'Topic is required'}), 400
 
-        # Get previously generated card descriptions
-        card_descriptions = app.config.get('last_card_descriptions', [])
-        context = "\n".join(card_descriptions) if card_descriptions else "No previous context available."
-
-        # Generate content using Claude with added context
-        message = client.messages.create(
-            model=SONNET_MODEL,
-            max_tokens=1000,
-            system=SYSTEM_PROMPT,
-            messages=[{
-                "role": "user",
-                "content": f"""
-Create a mini learning module about {topic} using the context {context}. Include:
-
-1. A clear description of the concept (5 concise densesentences)
-2. The fundamental truths/first principles (3-5 bullet points)
-3. A concise summary under 20 words in simple but conceptually dense language
-
-Format each section in markdown."""
-            }]
-        )
-
-        # Parse the response into sections
-        content = str(message.content)
-        sections = content.split('\n\n')
-
-        response_data = {
-            "description": sections[0] if len(sections) > 0 else "",
-            "fundamentals": sections[1] if len(sections) > 1 else "",
-            "summary": sections[2] if len(sections) > 2 else ""
-        }
-
-        return jsonify(response_data)
+        # A card's mini module was started when the cards were shown; join it.
+        # Cards can outlive their module (cached catalog responses, the TTL),
+        # so a click also sends the card and starts whatever is missing.
+        stored = mini_modules.get(module_id) if module_id else None
+        if mini_modules.fresh(stored):
+            return jsonify({**stored['content'], 'moduleId': module_id})
+        card = data.get('card')
+        if isinstance(card, dict) and card.get('title'):
+            card = {"title": card['title'], "description": card.get('description') or ''}
+        elif stored is not None:
+            card, topic = stored['card'], stored['topic']
+        else:
+            card = {"title": topic, "description": data.get('context') or ''}
+
+        module_id = mini_modules.start(topic, card, generate_mini_module_for, pending_jobs.submit)
+        stored = mini_modules.get(module_id)
+        if stored['status'] == 'done':
+            # Stale, refreshing in the background
+            return jsonify({**stored['content'], 'moduleId': module_id})
+        future = mini_modules.future(module_id)
+        if future is not None:
+            content = future.result(timeout=REQUEST_TIMEOUT)
+        else:
+            # Finished between start() and now
+            stored = mini_modules.get(module_id)
+            if stored['status'] != 'done':
+                return jsonify({'error': stored['error'] or 'Mini module generation failed'}), 500
+            content = stored['content']
+        return jsonify({**content, 'moduleId': module_id})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/mini_module/<id>', methods=['GET'])
-def get_mini_module(id):
-    # Add artificial delay for testing loading state
-    time.sleep(1)  # Remove this in production
-    # Rest of your endpoint logic...
-
-@app.route('/generate_questions', methods=['POST'])
-@app.route('/api/generate_questions', methods=['POST'])
-def generate_questions():
-    data = request.get_json()
-    text = data.get('text', '')
-
-    if not text:
-        return jsonify({'error': 'Missing text'}), 400
-
-    try:
-        # Construct the instruction
-        instructions = f"""Based on the following text, generate 3 simple comprehension questions that could be used to test understanding. one is practice, one is theoretical, one is historical:
+@app.route('/mini_module/<module_id>', methods=['GET'])
+def get_mini_module(module_id):
+    """A card's mini module: 200 when ready, 202 while it is still generating"""
+    stored = mini_modules.get(module_id)
+    if stored is None:
+        return jsonify({'error': 'Unknown mini module'}), 404
+    if stored['status'] == 'done':
+        # Stale ones are regenerated when the card is opened (POST /generate_mini_module), not on a read
+        return jsonify({**stored['content'], 'moduleId': module_id, 'status': 'done'})
+    if stored['status'] == 'failed' and mini_modules.future(module_id) is None:
+        return jsonify({'moduleId': module_id, 'status': 'failed', 'error': stored['error']}), 500
+    return jsonify({'moduleId': module_id, 'status': 'pending'}), 202
+
+def index_questions(text, topic, questions_data, user_id):
+    questions = questions_data.get('questions') if isinstance(questions_data, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return
+    search_index.record(
+        content_key('questions', topic, text), 'question', questions[0],
+        '\n'.join(str(question) for question in questions), topic=topic, user_id=user_id
+    )
+    # Generated questions become review items, answered against the text they came from
+    review_store.record(user_id, [('question', topic, str(question), text) for question in questions])
+
+def generate_questions_for(text, topic, user_id):
+    """{questions: [...]} for a passage; raises ValueError if the response has no JSON"""
+    # A section of a module whose questions were generated in one batch
+    stored = question_bank.find_section(text)
+    if stored:
+        index_questions(text, topic, {'questions': stored}, user_id)
+        return {'questions': stored}
+
+    # Construct the instruction
+    instructions = f"""Based on the following text, generate 3 simple comprehension questions that could be used to test understanding. one is practice, one is theoretical, one is historical:
 
 {text}
 
@@ -863,58 +1215,129 @@ Ensure that:
 
 Do not include any extra text before or after the JSON object."""
 
-        # Create message using the new API syntax
-        message = client.messages.create(
-            model=HAIKU_MODEL,
-            max_tokens=500,
-            temperature=0,
-            messages=[
-                {
-                    "role": "user",
-                    "content": instructions
-                }
-            ]
-        )
+    # Create message using the new API syntax
+    message = create_message(
+        'generate_questions',
+        model=HAIKU_MODEL,
+        temperature=0,
+        messages=[
+            {
+                "role": "user",
+                "content": instructions
+            }
+        ]
+    )
 
-        # Extract the response content
-        response_content = message.content[0].text
+    # Extract the response content
+    response_content = message.text
 
-        # Debug: Log the AI's raw response
-        print("[DEBUG] AI response content:")
-        print(response_content)
+    # Debug: Log the AI's raw response
+    print("[DEBUG] AI response content:")
+    print(response_content)
 
-        try:
-            # Try to parse the JSON directly first
-            questions_data = json.loads(response_content)
-            return jsonify(questions_data)
-        except json.JSONDecodeError:
-            # If direct parsing fails, try to extract JSON using regex
-            import re
-            json_match = re.search(r'\{.*\}', response_content, re.DOTALL)
-            if json_match:
-                json_text = json_match.group(0)
-                
-                # Replace single quotes with double quotes
-                json_text = json_text.replace("'", '"')
-                
-                # Remove trailing commas
-                json_text = re.sub(r',\s*([}\]])', r'\1', json_text)
-                
-                try:
-                    questions_data = json.loads(json_text)
-                    return jsonify(questions_data)
-                except json.JSONDecodeError as e:
-                    print(f"JSON decoding failed: {e}")
-                    print(f"Invalid JSON text: {json_text}")
-                    return jsonify({'error': f'Invalid JSON format from AI response: {e}'}), 500
-            else:
-                print(f"No JSON object found in the AI response: {response_content}")
-                return jsonify({'error': 'AI response did not contain a valid JSON object'}), 500
+    try:
+        with tracing.span('parse', parser='json'):
+            questions_data = extract_json_object(response_content)
+    except ValueError as e:
+        print(f"{str(e)}: {response_content}")
+        raise
+    index_questions(text, topic, questions_data, user_id)
+    return questions_data
 
+@app.route('/generate_questions', methods=['POST'])
+@app.route('/api/generate_questions', methods=['POST'])
+def generate_questions():
+    data = request.get_json()
+    text = data.get('text', '')
+    topic = data.get('topic', '')
+
+    if not text:
+        return jsonify({'error': 'Missing text'}), 400
+
+    try:
+        return jsonify(generate_questions_for(text, topic, current_user_id()))
     except Exception as e:
         print(f"Error generating questions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def module_questions_request(topic, sections):
+    """Claude request parameters for questions on every section of a module in one call"""
+    section_text = "\n\n".join(f'<section id="{field}">\n{text}\n</section>' for field, text in sections)
+    fields = ", ".join(f'"{field}": ["Question 1", "Question 2", "Question 3"]' for field, _ in sections)
+    return {
+        "model": HAIKU_MODEL,
+        "temperature": 0,
+        "messages": [{
+            "role": "user",
+            "content": f"""Below are the sections of a learning module on {topic}. For each section, generate 3 simple comprehension questions that could be used to test understanding. one is practice, one is theoretical, one is historical.
+
+{section_text}
+
+Provide **only** a JSON object with one key per section id, in the following format and nothing else:
+
+{{{fields}}}
+
+Do not include any extra text before or after the JSON object."""
+        }]
+    }
+
+def generate_module_questions_for(topic, sections):
+    """{field: [questions]} for each module section, from one model call"""
+    message = create_message('generate_module_questions', **module_questions_request(topic, sections))
+    with tracing.span('parse', parser='json'):
+        parsed = extract_json_object(message.text)
+    questions = {}
+    for field, _ in sections:
+        items = parsed.get(field) if isinstance(parsed, dict) else None
+        if isinstance(items, list) and items:
+            questions[field] = [str(item) for item in items]
+    if not questions:
+        raise ValueError('AI response did not contain questions for any section')
+    return questions
+
+def module_question_sections(module):
+    """[(field, text)] for the module sections that have content"""
+    return [(field, module[field]) for field, _ in MODULE_SECTIONS
+            if isinstance(module.get(field), str) and module[field].strip()]
+
+def pregenerate_questions(topic, module):
+    """Start generating a finished module's questions so they are ready when asked for"""
+    if not QUESTIONS_PREGENERATE:
+        return
+    sections = module_question_sections(module)
+    if sections:
+        question_bank.get_or_generate(topic, sections, generate_module_questions_for, pending_jobs.submit)
+
+@app.route('/generate_module_questions', methods=['POST'])
+@app.route('/api/generate_module_questions', methods=['POST'])
+def generate_module_questions():
+    """Questions for every section of a module, from one call, cached by the module's content"""
+    data = request.get_json() or {}
+    topic = data.get('topic', '')
+    sections = module_question_sections(data.get('module') or {})
+    if not topic or not sections:
+        return jsonify({'error': 'Missing topic or module sections'}), 400
+
+    module_key, questions, future = question_bank.get_or_generate(
+        topic, sections, generate_module_questions_for, pending_jobs.submit)
+    cached = questions is not None
+    if not cached:
+        try:
+            questions = future.result(timeout=REQUEST_TIMEOUT)
+        except FutureTimeoutError:
+            # Still generating; the client can poll /pending/<job_id>
+            return jsonify({'moduleHash': module_key, 'status': 'pending',
+                            'pending': pending_jobs.park(future, 'module_questions')}), 202
+        except Exception as e:
+            logger.error(f"Error generating module questions: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    # Indexed and enrolled for review per user, including cached questions
+    texts = dict(sections)
+    for field, items in questions.items():
+        index_questions(texts[field], topic, {'questions': items}, current_user_id())
+    return jsonify({'moduleHash': module_key, 'questions': questions, 'cached': cached})
+
 # Add this near your other decorators
 def handle_perplexity_request(retries=3, timeout=30):
     def decorator(f):
@@ -924,11 +1347,11 @@ def handle_perplexity_request(retries=3, timeout=30):
             for attempt in range(retries):
                 try:
                     return f(*args, **kwargs)
-                except requests.exceptions.ReadTimeout:
+                except (requests.exceptions.ReadTimeout, openai.APITimeoutError):
                     logger.warning(f"Perplexity API timed out, attempt {attempt + 1}/{retries}")
                     time.sleep(2 ** attempt)  # Exponential backoff
                     last_error = "Perplexity API timed out repeatedly"
-                except requests.exceptions.RequestException as e:
+                except (requests.exceptions.RequestException, openai.APIConnectionError) as e:
                     logger.error(f"Perplexity API request failed: {str(e)}")
                     time.sleep(2 ** attempt)
                     last_error = str(e)
@@ -941,182 +1364,560 @@ def handle_perplexity_request(retries=3, timeout=30):
         return decorated_function
     return decorator
 
-# Update the generate_examples route
-@app.route('/generate_examples', methods=['POST'])
-@handle_perplexity_request(retries=3, timeout=45)
-def generate_examples():
-    try:
-        data = request.get_json()
-        
-        # Validate required parameters
-        if not data.get('text') or not data.get('topic'):
-            return jsonify({'error': 'Missing required parameters: text and topic'}), 400
-
-        perplexity_key = os.getenv('PERPLEXITY_API_KEY')
-        if not perplexity_key:
-            return jsonify({'error': 'Perplexity API key not configured'}), 500
-
-        headers = {
-            'Authorization': f'Bearer {perplexity_key}',
-            'Content-Type': 'application/json',
-        }
-
-        data_payload = {
-            "model": "llama-3.1-sonar-large-128k-online",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "Be precise and concise. You are an expert at finding real-world examples "
-                        "with verifiable sources."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        f"Find a specific real-world example of this concept from {data['topic']}: "
-                        f"'{data['text']}'. Keep the example under 100 words and include citation "
-                        "numbers in the text that match the returned citations. Maximum 3 paragraphs."
-                    )
-                }
-            ],
-            "max_tokens": 1000,
-            "temperature": 0.2,
-            "top_p": 0.9,
+def generate_examples_for(topic, text, user_id, use_cached=True):
+    """A cited real-world example of a passage, from Perplexity's online search model"""
+    example_key = content_key(topic, text)
+    if wants_cached(use_cached):
+        stored = library.find('examples', example_key, user_id, on_shared=lambda payload, shared_topic: (
+            index_example(example_key, shared_topic, text, payload['examples'][0]['description'], user_id)))
+        if stored is not None:
+            return stored
+
+    completion = create_message(
+        'generate_examples',
+        # Perplexity serves this with its online search model (PERPLEXITY_MODEL)
+        model=SONNET_MODEL,
+        system=(
+            "Be precise and concise. You are an expert at finding real-world examples "
+            "with verifiable sources."
+        ),
+        messages=[
+            {
+                "role": "user",
+                "content": (
+                    f"Find a specific real-world example of this concept from {topic}: "
+                    f"'{text}'. Keep the example under 100 words and include citation "
+                    "numbers in the text that match the returned citations. Maximum 3 paragraphs."
+                )
+            }
+        ],
+        temperature=0.2,
+        top_p=0.9,
+        timeout=45,  # Match the decorator
+        # Search options only Perplexity understands
+        extra={"perplexity": {
             "search_domain_filter": ["perplexity.ai"],
             "return_images": False,
             "return_related_questions": False,
             "search_recency_filter": "month",
             "top_k": 0,
-            "stream": False,
             "presence_penalty": 0,
             "frequency_penalty": 1
-        }
+        }}
+    )
+    content = completion.text
+    response_json = completion.raw if isinstance(completion.raw, dict) else {}
 
-        logger.debug("Perplexity API Request Payload: %s", data_payload)
+    # If citations exist - adjust if they appear differently.
+    citations = response_json.get('citations', [])
 
-        response = requests.post(
-            "https://api.perplexity.ai/chat/completions",
-            headers=headers,
-            json=data_payload,
-            timeout=45  # Match the decorator
-        )
+    # Format citations
+    formatted_citations = []
+    from urllib.parse import urlparse
+    for url in citations:
+        try:
+            parsed_url = urlparse(url)
+            display_text = parsed_url.netloc.replace('www.', '')
+            formatted_citations.append({
+                'text': display_text,
+                'url': url
+            })
+        except Exception as e:
+            logger.error(f"Error formatting citation URL '{url}': {str(e)}")
+
+    # Build final response data
+    response_data = {
+        'examples': [{
+            'description': content or 'No content returned.',
+            'type': 'Real-world Example',
+            'timestamp': datetime.now().isoformat(),
+            'text': text,
+            'topic': topic
+        }],
+        'citations': formatted_citations
+    }
+    library.record(user_id, 'examples', topic, response_data, example_key)
+    index_example(example_key, topic, text, content or '', user_id)
+    return response_data
 
-        # Log raw response text for debugging
-        logger.debug("Perplexity API Raw Response: %s", response.text)
-
-        response_json = response.json()
-
-        # Now parse content and citations as needed.
-        # Adjust if Perplexity's response structure differs from typical openAI-like format
-        content = ""
-        if "choices" in response_json:
-            # If Perplexity returns choices array
-            content = (
-                response_json.get('choices', [{}])[0]
-                .get('message', {})
-                .get('content', '')
-            )
-        elif "completions" in response_json:
-            # If they return completions array (depends on their final specs)
-            content = response_json['completions'][0].get('text', '')
-
-        # If citations exist - adjust if they appear differently.
-        citations = response_json.get('citations', [])
-
-        # Format citations
-        formatted_citations = []
-        from urllib.parse import urlparse
-        for url in citations:
-            try:
-                parsed_url = urlparse(url)
-                display_text = parsed_url.netloc.replace('www.', '')
-                formatted_citations.append({
-                    'text': display_text,
-                    'url': url
-                })
-            except Exception as e:
-                logger.error(f"Error formatting citation URL '{url}': {str(e)}")
-
-        # Build final response data
-        response_data = {
-            'examples': [{
-                'description': content or 'No content returned.',
-                'type': 'Real-world Example',
-                'timestamp': datetime.now().isoformat(),
-                'text': data['text'],
-                'topic': data['topic']
-            }],
-            'citations': formatted_citations
-        }
+def index_example(example_key, topic, text, content, user_id):
+    search_index.record(example_key, 'example', text, content, topic=topic, user_id=user_id, ref=example_key)
 
+# Update the generate_examples route
+@app.route('/generate_examples', methods=['POST'])
+@handle_perplexity_request(retries=3, timeout=45)
+def generate_examples():
+    try:
+        data = request.get_json()
+        
+        # Validate required parameters
+        if not data.get('text') or not data.get('topic'):
+            return jsonify({'error': 'Missing required parameters: text and topic'}), 400
+
+        response_data = generate_examples_for(data['topic'], data['text'], current_user_id(),
+                                              use_cached=data.get('useCached', True))
         return jsonify(response_data), 200
 
     except Exception as error:
         logger.error(f"Error in generate_examples: {str(error)}")
         return jsonify({'error': str(error)}), 500
 
-# Add new route to get/set API keys
+# Session request type -> the HTTP route it stands in for (and whose admission class it uses)
+SESSION_ENDPOINTS = {
+    'explain': 'explain_sentence',
+    'examples': 'generate_examples',
+    'questions': 'generate_questions',
+}
+SESSION_REQUIRED_FIELDS = {
+    'explain': ('sentence', 'topic'),
+    'examples': ('text', 'topic'),
+    'questions': ('text',),
+}
+
+def admit_session_request(kind):
+    """Admission ticket for a session request, waited for on the posting thread"""
+    priority_class = admission.class_for(SESSION_ENDPOINTS[kind])
+    return admission.acquire(priority_class) if priority_class is not None else None
+
+def run_session_request(session, session_request, payload, ticket):
+    """Result body of one session request, the same as its HTTP route returns"""
+    kind = session_request.kind
+    quota_token = quotas.bind_account(session.context_key)
+    try:
+        if session_request.cancelled.is_set():
+            return None
+        topic = payload.get('topic', '')
+        use_cached = wants_cached(payload.get('useCached', True))
+        if kind == 'explain':
+            sentence = payload['sentence']
+            stored = stored_explanation(topic, sentence, session.user_id) if use_cached else None
+            if stored is not None:
+                return {'explanation': stored}
+            explanation = explain_text(
+                topic, sentence, session.user_id, session.context_key,
+                on_text=lambda text: session.emit('delta', {'id': session_request.id, 'text': text}),
+                cancelled=session_request.cancelled)
+            return None if explanation is None else {'explanation': explanation}
+        if kind == 'examples':
+            return generate_examples_for(topic, payload['text'], session.user_id, use_cached=use_cached)
+        return generate_questions_for(payload['text'], topic, session.user_id)
+    finally:
+        quotas.reset_account(quota_token)
+        if ticket is not None:
+            ticket.release()
+
+@app.route('/session', methods=['POST'])
+def create_session():
+    """Open a session channel; the learner id is bound here since EventSource cannot send headers"""
+    session = sessions.create(current_user_id())
+    return jsonify({'sessionId': session.id}), 201
+
+@app.route('/session/<session_id>', methods=['DELETE'])
+def close_session(session_id):
+    if not sessions.close(session_id):
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    return jsonify({'closed': session_id})
+
+@app.route('/session/<session_id>/events', methods=['GET'])
+def session_events(session_id):
+    """Server-sent events for a session's requests"""
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('lastEventId') or 0)
+    except ValueError:
+        last_id = 0
+    stream = sessions.stream(session, last_id)
+    if stream is None:
+        # Every stream holds a thread; the client falls back to the plain HTTP routes
+        response = jsonify({'error': 'Too many open session streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SESSION_STREAM_RETRY)
+        return response
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+@app.route('/session/<session_id>/requests', methods=['POST'])
+def post_session_request(session_id):
+    """Start an explain/examples/questions request; its result arrives on the event stream"""
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    # Sent as text/plain so the browser skips the CORS preflight
+    data = request.get_json(force=True, silent=True) or {}
+    request_id = str(data.get('id') or '')[:64]
+    kind = data.get('type')
+    payload = data.get('payload') or {}
+    if not request_id or kind not in SESSION_ENDPOINTS:
+        return jsonify({'error': f"Need an id and a type of {', '.join(SESSION_ENDPOINTS)}"}), 400
+    missing = [field for field in SESSION_REQUIRED_FIELDS[kind] if not payload.get(field)]
+    if missing:
+        return jsonify({'error': f"Missing required fields: {', '.join(missing)}"}), 400
+
+    try:
+        session_request = sessions.submit(
+            session, request_id, kind, data.get('channel'),
+            lambda session_request, ticket: run_session_request(session, session_request, payload, ticket),
+            admit=lambda: admit_session_request(kind))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Rejected as e:
+        logger.info(f"Rejected session {kind} request: {e}")
+        response = jsonify({'error': 'Server busy, please retry', 'class': e.priority_class, 'reason': e.reason})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return jsonify({'id': request_id, 'superseded': session_request.superseded}), 202
+
+@app.route('/session/<session_id>/requests/<request_id>', methods=['DELETE'])
+def cancel_session_request(session_id, request_id):
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    return jsonify({'id': request_id, 'cancelled': sessions.cancel(session, request_id)})
+
+def admin_required(view):
+    """Serve the route only to requests carrying ADMIN_TOKEN (X-Admin-Token or a Bearer token)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        token = request.headers.get('X-Admin-Token', '')
+        authorization = request.headers.get('Authorization', '')
+        if not token and authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):]
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# Settings names of the providers whose API keys can be changed at runtime
+SETTINGS_PROVIDERS = {'claude': 'anthropic', 'perplexity': 'perplexity'}
+
+def settings_keys(value):
+    """One key, a comma-separated string of keys or a list of keys"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [key.strip() for key in value or [] if isinstance(key, str) and key.strip()]
+
 @app.route('/api/settings', methods=['GET', 'POST'])
+@admin_required
 def handle_settings():
     if request.method == 'POST':
-        data = request.get_json()
+        data = request.get_json() or {}
         try:
-            # Update environment variables with user-provided keys
-            if 'claude' in data and data['claude']:
-                os.environ['ANTHROPIC_API_KEY'] = data['claude']
-                client = anthropic.Anthropic(api_key=data['claude'])
-            
-            if 'perplexity' in data and data['perplexity']:
-                os.environ['PERPLEXITY_API_KEY'] = data['perplexity']
-            
+            for setting, name in SETTINGS_PROVIDERS.items():
+                keys = settings_keys(data.get(setting))
+                if not keys:
+                    continue
+                # Swaps the keys every call leases from; calls in flight finish on their old key
+                set_provider_keys(providers, name, keys)
+                prefix = name.upper()
+                os.environ[f'{prefix}_API_KEY'] = keys[0]
+                os.environ[f'{prefix}_API_KEYS'] = ','.join(keys)
+
             # Don't write to .env file in production
             if os.getenv('FLASK_ENV') != 'production':
                 env_path = os.path.join(os.path.dirname(__file__), '.env')
                 try:
-                    with open(env_path, 'w') as f:
-                        f.write(f"ANTHROPIC_API_KEY={os.getenv('ANTHROPIC_API_KEY')}\n")
-                        f.write(f"PERPLEXITY_API_KEY={os.getenv('PERPLEXITY_API_KEY')}\n")
+                    # set_key keeps the file's other variables (EXA_API_KEY and the rest)
+                    for name in SETTINGS_PROVIDERS.values():
+                        for var in (f'{name.upper()}_API_KEY', f'{name.upper()}_API_KEYS'):
+                            if os.getenv(var):
+                                set_key(env_path, var, os.getenv(var), quote_mode='never')
                 except IOError as e:
                     logger.warning(f"Could not write to .env file: {str(e)}")
-            
+
             return jsonify({"message": "Settings updated successfully"})
-            
+
         except Exception as e:
             logger.error(f"Error updating settings: {str(e)}")
             return jsonify({"error": str(e)}), 500
-    
+
     elif request.method == 'GET':
-        # Return masked versions of current keys
-        def mask_key(key):
-            if not key:
-                return ''
-            return f"{key[:5]}...{key[-5:]}" if len(key) > 10 else key
-        
-        return jsonify({
-            "claude": mask_key(os.getenv('ANTHROPIC_API_KEY')),
-            "perplexity": mask_key(os.getenv('PERPLEXITY_API_KEY'))
-        })
-
-# Modify the initialization of API clients
-def initialize_api_clients():
-    global client, exa
+        # Masked keys, first key first, with each key's load and rate-limit state
+        settings = {}
+        for setting, name in SETTINGS_PROVIDERS.items():
+            provider = providers.providers.get(name)
+            keys = provider.pool.snapshot() if provider is not None else []
+            settings[setting] = keys[0]['key'] if keys else ''
+            settings[f'{setting}Keys'] = keys
+        return jsonify(settings)
+
+@app.route('/catalog/<kind>', methods=['GET'])
+def get_catalog_artifact(kind):
+    """Cacheable GET for precomputed goals, roadmaps and cards (404 on a miss)"""
+    if kind not in CATALOG_KINDS:
+        return jsonify({'error': f'Unknown catalog kind: {kind}'}), 404
+    topic = request.args.get('topic')
+    proficiency = request.args.get('proficiency')
+    if not topic or not proficiency:
+        return jsonify({'error': 'Missing required fields: topic, proficiency'}), 400
+    variant = ''
+    if kind == 'roadmap':
+        goals = request.args.getlist('goals')
+        if not goals:
+            return jsonify({'error': 'Missing required field: goals'}), 400
+        variant = goals_key(format_goals_text(goals))
+    artifact = catalog.get(kind, topic, proficiency, variant=variant)
+    if artifact is None:
+        return jsonify({'error': 'Not in catalog'}), 404
+    if kind == 'cards':
+        artifact = attach_mini_modules(topic, artifact)
+    return jsonify(artifact)
+
+def library_user_or_400():
+    user_id = current_user_id()
+    if not user_id:
+        return None, (jsonify({'error': 'Missing X-Gyaan-User header'}), 400)
+    if request.view_args.get('kind') not in (None, *LIBRARY_KINDS):
+        return None, (jsonify({'error': f"Unknown library kind: {request.view_args['kind']}"}), 404)
+    return user_id, None
+
+@app.route('/library/<kind>', methods=['GET', 'POST'])
+def library_items(kind):
+    """Paged newest-first listing (GET) or save an item (POST)"""
+    user_id, error = library_user_or_400()
+    if error:
+        return error
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        topic = data.get('topic')
+        payload = data.get('item')
+        if not topic or not isinstance(payload, dict):
+            return jsonify({'error': 'Missing required fields: topic, item'}), 400
+        item_id = library.save(user_id, kind, topic, payload, saved=data.get('saved', True))
+        return jsonify({'id': item_id}), 201
     try:
-        anthropic_key = os.getenv('ANTHROPIC_API_KEY')
-        perplexity_key = os.getenv('PERPLEXITY_API_KEY')
-        
-        if anthropic_key:
-            client = anthropic.Anthropic(api_key=anthropic_key)
-        if perplexity_key:
-            # Update headers in generate_examples function
-            pass  # The headers are already set in the function
-            
-    except Exception as e:
-        logger.error(f"Error initializing API clients: {str(e)}")
-        raise
-
-# Call initialize_api_clients when the app starts
-initialize_api_clients()
+        items, next_cursor = library.list(
+            user_id, kind,
+            topic=request.args.get('topic'),
+            saved_only=request.args.get('saved') == '1',
+            limit=request.args.get('limit', 50),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    return jsonify({'items': items, 'nextCursor': next_cursor})
+
+@app.route('/library/<kind>/topics', methods=['GET'])
+def library_topics(kind):
+    user_id, error = library_user_or_400()
+    if error:
+        return error
+    return jsonify({'topics': library.topics(user_id, kind, saved_only=request.args.get('saved') == '1')})
+
+@app.route('/library/<kind>/<int:item_id>', methods=['GET', 'PATCH', 'DELETE'])
+def library_item(kind, item_id):
+    user_id, error = library_user_or_400()
+    if error:
+        return error
+    if request.method == 'DELETE':
+        found = library.delete(user_id, kind, item_id)
+    elif request.method == 'PATCH':
+        found = library.set_saved(user_id, kind, item_id, bool((request.get_json() or {}).get('saved')))
+    else:
+        item = library.get(user_id, kind, item_id)
+        if item is None:
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(item)
+    if not found:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'id': item_id})
+
+@app.route('/library/export', methods=['GET'])
+def library_export():
+    """All of a user's items as newline-delimited JSON"""
+    user_id, error = library_user_or_400()
+    if error:
+        return error
+    lines = (json.dumps(item) + '\n' for item in library.export(user_id))
+    return app.response_class(lines, mimetype='application/x-ndjson')
+
+def review_user_or_400():
+    user_id = current_user_id()
+    if not user_id:
+        return None, (jsonify({'error': 'Missing X-Gyaan-User header'}), 400)
+    return user_id, None
+
+@app.route('/review/queue', methods=['GET'])
+def review_queue():
+    """Questions and explanations due for review, most overdue first"""
+    user_id, error = review_user_or_400()
+    if error:
+        return error
+    try:
+        limit = int(request.args.get('limit', DEFAULT_QUEUE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    items = review_store.queue(user_id, limit=limit, topic=request.args.get('topic') or None)
+    return jsonify({'items': items, **review_store.counts(user_id)})
+
+@app.route('/review/items', methods=['POST'])
+def review_enroll():
+    """Add items to review: {"items": [{"kind", "topic", "prompt", "answer"}]}"""
+    user_id, error = review_user_or_400()
+    if error:
+        return error
+    items = (request.get_json() or {}).get('items') or []
+    try:
+        rows = [(item['kind'], item['topic'], item['prompt'], item.get('answer', '')) for item in items]
+        item_ids = review_store.enroll(user_id, rows)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Invalid review items ({', '.join(REVIEW_KINDS)}): {str(e)}"}), 400
+    return jsonify({'itemIds': item_ids}), 201
+
+@app.route('/review/items/<item_id>', methods=['DELETE'])
+def review_delete(item_id):
+    user_id, error = review_user_or_400()
+    if error:
+        return error
+    if not review_store.delete(user_id, item_id):
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'itemId': item_id})
+
+@app.route('/review/items/<item_id>/grade', methods=['POST'])
+def review_grade(item_id):
+    """Record a 0-5 grade (or again/hard/good/easy) and return the item's next due date"""
+    user_id, error = review_user_or_400()
+    if error:
+        return error
+    try:
+        grade = parse_grade((request.get_json() or {}).get('grade'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'grade must be 0-5 or one of again, hard, good, easy'}), 400
+    item = review_store.grade(user_id, item_id, grade)
+    if item is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(item)
+
+@app.route('/search', methods=['GET'])
+def search_content():
+    """Ranked full-text search over the user's generated roadmaps, modules, explanations, examples and questions"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing required parameter: q'}), 400
+    kind = request.args.get('kind')
+    if kind and kind not in SEARCH_KINDS:
+        return jsonify({'error': f'Unknown search kind: {kind}'}), 400
+    start = time.perf_counter()
+    try:
+        results = search_index.search(
+            query,
+            user_id=current_user_id(),
+            topic=request.args.get('topic'),
+            kind=kind,
+            limit=request.args.get('limit', 20),
+            offset=request.args.get('offset', 0)
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or offset'}), 400
+    return jsonify({'results': results, 'tookMs': round((time.perf_counter() - start) * 1000, 2)})
+
+@app.route('/api/catalog', methods=['GET'])
+@admin_required
+def get_catalog_stats():
+    """Catalog size and exact/near-duplicate/miss lookup counts"""
+    return jsonify(catalog.stats())
+
+@app.route('/api/resources', methods=['GET'])
+@admin_required
+def get_resource_index_stats():
+    """Indexed resources, domains and topics, and how lookups were answered"""
+    return jsonify(resource_index.stats())
+
+@app.route('/api/providers', methods=['GET'])
+@admin_required
+def get_provider_usage():
+    """Routes, health, latency and token usage per LLM provider"""
+    return jsonify(providers.usage())
+
+@app.route('/api/admission', methods=['GET'])
+@admin_required
+def get_admission_stats():
+    """Running, waiting, rejections and queue wait per priority class"""
+    return jsonify(admission.stats())
+
+@app.route('/api/sessions', methods=['GET'])
+@admin_required
+def get_session_stats():
+    """Open sessions and streams, requests in flight, superseded and cancelled requests"""
+    return jsonify(sessions.snapshot())
+
+@app.route('/api/traces', methods=['GET'])
+@admin_required
+def get_trace_settings():
+    """Sampling, export paths and counts of traced, sampled and slow requests"""
+    return jsonify(tracing.tracer.settings())
+
+@app.route('/api/traces/slow', methods=['GET'])
+@admin_required
+def get_slow_traces():
+    """The latest slow requests, slowest spans included, newest first"""
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify({'slowMs': tracing.tracer.slow_ms, 'traces': tracing.tracer.slow_traces(limit)})
+
+@app.route('/api/quota', methods=['GET'])
+@admin_required
+def get_quota():
+    """Tokens ?account= used in the current window, its budget and when it resets"""
+    account = request.args.get('account')
+    if not account:
+        return jsonify({'error': 'Missing account'}), 400
+    return jsonify(quota_ledger.status(account))
+
+@app.route('/admin/quotas', methods=['GET'])
+@admin_required
+def get_quota_usage():
+    """Ledger settings and the accounts using the most tokens this window"""
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify({**quota_ledger.settings(), 'top': quota_ledger.top(limit)})
+
+@app.route('/admin/profile', methods=['POST'])
+@admin_required
+def start_profile():
+    """Sample stacks for `seconds`, or keep only the samples of requests slower than `slowMs`"""
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 30))
+        interval_ms = float(data.get('intervalMs', PROFILE_INTERVAL_MS))
+        slow_ms = float(data['slowMs']) if data.get('slowMs') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seconds, intervalMs and slowMs must be numbers'}), 400
+    try:
+        sampler.start(seconds, interval_ms, slow_ms)
+    except ProfileAlreadyRunning as e:
+        return jsonify({'error': str(e), **sampler.status()}), 409
+    return jsonify(sampler.status()), 202
+
+@app.route('/admin/profile', methods=['GET'])
+@admin_required
+def get_profile():
+    """Status and top stacks per route; ?format=collapsed returns flamegraph input"""
+    if request.args.get('format') == 'collapsed':
+        response = make_response(sampler.collapsed(request.args.get('route')))
+        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        return response
+    return jsonify(sampler.status(request.args.get('top', default=10, type=int)))
+
+@app.route('/admin/profile', methods=['DELETE'])
+@admin_required
+def stop_profile():
+    sampler.stop()
+    return jsonify(sampler.status())
+
+@app.route('/api/hedging', methods=['GET'])
+@admin_required
+def get_hedging_stats():
+    """Hedge thresholds, hedge rate, wins and cancellations per hedged endpoint"""
+    return jsonify(hedger.settings())
+
+@app.route('/api/budgets', methods=['GET'])
+@admin_required
+def get_output_budgets():
+    """Expose the derived max_tokens/stop sequences and the observed output lengths"""
+    return jsonify(budgets.settings())
 
 @app.errorhandler(500)
 def handle_500_error(e):
@@ -0,0 +1,108 @@
+"""Micro-benchmark the markdown post-processing in utils.
+
+Builds roadmap-like model outputs of 2-10 KB (headers, nested lists,
+numbered steps, bold lines, blank-line runs and the usual formatting slips)
+and times, per output size:
+
+  legacy    - the previous four-pass re.sub normalizer
+  single    - utils.parse_markdown_content (one precompiled pass)
+  stream    - utils.MarkdownStream fed token-sized chunks, as during streaming
+
+    cd backend
+    python -m bench.bench_markdown
+    python -m bench.bench_markdown --sizes 2 5 10 --repeat 500 --chunk 16
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from budgets import percentile  # noqa: E402
+from utils import MarkdownStream, parse_goals, parse_markdown_content  # noqa: E402
+
+WORDS = ('learn the core model of state and data flow build a small project measure compare explain '
+         'practice review estimate hours concepts tools testing deployment patterns tradeoffs').split()
+
+
+def legacy_parse_markdown_content(text):
+    """The normalizer before the single-pass rewrite, kept for comparison"""
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = re.sub(r'#([^#\s])', r'# \1', text)
+    text = re.sub(r'^\s*[-*]\s*([^\s])', r'- \1', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*(\d+)\.\s*([^\s])', r'\1. \2', text, flags=re.MULTILINE)
+    return text.strip()
+
+
+def sentence(rng, words=(6, 14)):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(*words))).capitalize()
+
+
+def sample_output(rng, size):
+    """A roadmap-style markdown document of roughly size bytes"""
+    lines = []
+    section = 0
+    while sum(len(line) + 1 for line in lines) < size:
+        section += 1
+        lines.append(rng.choice(['## ', '##', '### ']) + f"Section {section}: {sentence(rng, (2, 4))}")
+        lines.extend([''] * rng.randint(1, 3))
+        lines.append(f"**Objective:** {sentence(rng)}")
+        for step in range(1, rng.randint(3, 6)):
+            lines.append(f"{step}.{rng.choice([' ', '', '  '])}{sentence(rng)}")
+            for _ in range(rng.randint(0, 3)):
+                lines.append(rng.choice(['- ', '-', '* ', '  - ', '    * ']) + sentence(rng))
+        lines.append(rng.choice(['', '   ', '\t']))
+        lines.append(f"Time estimate: {rng.randint(1, 9)}.5 hours")
+        lines.append('')
+    return '\n'.join(lines)[:size]
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def run_stream(parts):
+    stream = MarkdownStream()
+    out = [stream.feed(part) for part in parts]
+    out.append(stream.flush())
+    return ''.join(out)
+
+
+def time_call(fn, arg, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return percentile(samples, 50), percentile(samples, 95)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2, 4, 6, 8, 10], help='output sizes in KB')
+    parser.add_argument('--repeat', type=int, default=300)
+    parser.add_argument('--chunk', type=int, default=12, help='characters per streamed chunk')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"{'size':>6} {'legacy p50/p95 us':>20} {'single p50/p95 us':>20} {'stream p50/p95 us':>20}")
+    for kb in args.sizes:
+        text = sample_output(rng, kb * 1024)
+        parts = chunks(text, args.chunk)
+        # Streaming must produce exactly what the one-shot pass does
+        assert run_stream(parts) == parse_markdown_content(text)
+        rows = [time_call(fn, arg, args.repeat) for fn, arg in (
+            (legacy_parse_markdown_content, text), (parse_markdown_content, text), (run_stream, parts))]
+        print(f"{kb:>4}KB " + ' '.join(f"{p50:>11.1f}/{p95:<8.1f}" for p50, p95 in rows))
+
+    goals = '\n'.join(f"{i}. {sentence(rng)}" for i in range(1, 6))
+    p50, p95 = time_call(parse_goals, goals, args.repeat)
+    print(f"parse_goals (5 goals): p50 {p50:.1f}us p95 {p95:.1f}us")
+
+
+if __name__ == '__main__':
+    main()
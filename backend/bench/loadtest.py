@@ -0,0 +1,217 @@
+"""Load test the backend against the local stub upstream.
+
+Replays the goals -> roadmap -> module -> cards flow (plus the interactive
+explain/questions/examples calls) with concurrent virtual users and reports
+RPS, p50/p95/p99 latency and error rate per endpoint. Nothing leaves the
+machine: the app is pointed at stub_upstream.py unless --target is given.
+
+    cd backend
+    python -m bench.loadtest --users 8 --duration 30 --latency 0.5
+    python -m bench.loadtest --scenario interactive --rate-limit-rate 0.05
+    python -m bench.loadtest --target http://127.0.0.1:5001   # already running server
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_upstream  # noqa: E402
+from budgets import percentile  # noqa: E402
+
+DEFAULT_TOPICS = [
+    'python', 'machine learning', 'linear algebra', 'organic chemistry', 'music theory', 'photography',
+    'statistics', 'rust', 'public speaking', 'microeconomics', 'quantum physics', 'spanish grammar',
+    'react', 'calculus', 'negotiation', 'databases', 'climate science', 'game theory', 'chess openings',
+    'cell biology',
+]
+PROFICIENCIES = ['beginner', 'intermediate', 'advanced']
+FALLBACK_GOALS = ['Understand the core ideas', 'Apply them to a small project', 'Explain them to someone else']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and status samples"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, ok):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((seconds, ok))
+
+    def report(self, elapsed):
+        rows = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = [seconds * 1000 for seconds, _ in samples]
+            errors = sum(1 for _, ok in samples if not ok)
+            rows[endpoint] = {
+                "requests": len(samples),
+                "rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "error_rate": round(errors / len(samples), 4),
+            }
+        return rows
+
+
+class VirtualUser:
+    def __init__(self, base_url, recorder, topics, rng):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.topics = topics
+        self.rng = rng
+        self.session = requests.Session()
+
+    def post(self, path, payload):
+        start = time.perf_counter()
+        data, ok = None, False
+        try:
+            response = self.session.post(self.base_url + path, json=payload, timeout=120)
+            ok = response.status_code < 400
+            data = response.json() if ok else None
+        except (requests.RequestException, ValueError):
+            ok = False
+        self.recorder.add(path, time.perf_counter() - start, ok)
+        return data
+
+    def pick(self):
+        return self.rng.choice(self.topics), self.rng.choice(PROFICIENCIES)
+
+    def flow(self):
+        """What a learner does from picking a topic to reading the module"""
+        topic, proficiency = self.pick()
+        goals = (self.post('/generate_goals', {"topic": topic, "proficiency": proficiency}) or {}).get('goals')
+        if not isinstance(goals, list) or not goals:
+            goals = FALLBACK_GOALS
+        self.post('/generate_roadmap', {"topic": topic, "proficiency": proficiency, "goals": goals})
+        module = self.post('/generate_module_content', {"topic": topic, "proficiency": proficiency, "goals": goals})
+        self.post('/generate_learning_cards', {"topic": topic, "proficiency": proficiency})
+        text = (module or {}).get('keyInformation') or goals[0]
+        self.interactive(topic, text)
+
+    def interactive(self, topic=None, text=None):
+        """Click-to-explain, questions and examples on a piece of module text"""
+        if topic is None:
+            topic, _ = self.pick()
+        text = text or f"The central idea of {topic} and why it matters."
+        sentence = text.split('.')[0][:200] or topic
+        self.post('/explain-sentence', {"sentence": sentence, "topic": topic})
+        self.post('/generate_questions', {"text": text[:2000]})
+        self.post('/generate_examples', {"text": sentence, "topic": topic})
+
+
+SCENARIOS = {
+    # Every user walks the full learning flow
+    'flow': lambda user, index: user.flow(),
+    # Only the latency-sensitive interactive calls
+    'interactive': lambda user, index: user.interactive(),
+    # One in four users is generating content while the rest are reading
+    'mixed': lambda user, index: user.flow() if index % 4 == 0 else user.interactive(),
+}
+
+
+def run_users(base_url, scenario, users, duration, iterations, topics, seed):
+    recorder = Recorder()
+    deadline = time.time() + duration if duration else None
+    step = SCENARIOS[scenario]
+
+    def worker(index):
+        user = VirtualUser(base_url, recorder, topics, random.Random((seed or 0) + index))
+        done = 0
+        while (deadline is None or time.time() < deadline) and (not iterations or done < iterations):
+            step(user, index)
+            done += 1
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(worker, range(users)))
+    elapsed = time.time() - start
+    return recorder.report(elapsed), elapsed
+
+
+def start_local_app(args):
+    """Run the stub upstream and the Flask app in-process on free ports"""
+    stub_port = free_port()
+    stub_upstream.serve(port=stub_port, **stub_upstream.knobs_from_args(args))
+    stub_url = f'http://127.0.0.1:{stub_port}'
+    os.environ.update({
+        'ANTHROPIC_API_KEY': os.environ.get('ANTHROPIC_API_KEY') or 'stub-key',
+        'EXA_API_KEY': os.environ.get('EXA_API_KEY') or 'stub-key',
+        'PERPLEXITY_API_KEY': os.environ.get('PERPLEXITY_API_KEY') or 'stub-key',
+        'ANTHROPIC_BASE_URL': stub_url,
+        'EXA_BASE_URL': stub_url,
+        'PERPLEXITY_BASE_URL': stub_url,
+        'GYAAN_DATA_DIR': tempfile.mkdtemp(prefix='gyaan-bench-'),
+        'CATALOG_ENABLED': '1' if args.catalog else '0',
+    })
+
+    import logging
+    from werkzeug.serving import make_server
+    import app as backend
+
+    logging.getLogger().setLevel(logging.WARNING)
+    app_port = free_port()
+    server = make_server('127.0.0.1', app_port, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{app_port}'
+
+
+def print_report(rows, elapsed):
+    header = f"{'endpoint':<28}{'requests':>9}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+    print(header)
+    print('-' * len(header))
+    for endpoint, row in rows.items():
+        print(f"{endpoint:<28}{row['requests']:>9}{row['rps']:>8}{row['p50_ms']:>10}"
+              f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['error_rate']:>9.1%}")
+    total = sum(row['requests'] for row in rows.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} rps)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline load test for the Gyaan backend')
+    parser.add_argument('--target', help='base URL of a running backend (default: start one in-process)')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='flow')
+    parser.add_argument('--users', type=int, default=4, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run (0 to use --iterations)')
+    parser.add_argument('--iterations', type=int, default=0, help='scenario runs per user')
+    parser.add_argument('--topics', help='file with one topic per line')
+    parser.add_argument('--catalog', action='store_true', help='let the app serve from the topic catalog')
+    parser.add_argument('--json', help='also write the report to this file')
+    stub_upstream.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    topics = DEFAULT_TOPICS
+    if args.topics:
+        with open(args.topics) as f:
+            topics = [line.strip() for line in f if line.strip()]
+
+    base_url = args.target or start_local_app(args)
+    rows, elapsed = run_users(base_url, args.scenario, args.users, args.duration, args.iterations,
+                              topics, args.seed)
+    print_report(rows, elapsed)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"scenario": args.scenario, "users": args.users, "elapsed": elapsed,
+                       "endpoints": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
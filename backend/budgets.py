@@ -0,0 +1,135 @@
+from collections import deque
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Per-endpoint output budgets. `ceiling` is the hand-tuned limit the endpoint
+# used before budgets existed; the derived limit never exceeds it. `floor`
+# keeps a few noisy short samples from starving legitimate long answers.
+DEFAULT_BUDGETS = {
+    "generate_goals": {"ceiling": 1000, "floor": 150},
+    # One of the five roadmap sections, generated on its own
+    "roadmap_section": {"ceiling": 1000, "floor": 300},
+    "first_principles": {"ceiling": 2000, "floor": 800},
+    "key_information": {"ceiling": 1000, "floor": 400},
+    "practice_exercise": {"ceiling": 1000, "floor": 400},
+    # A single paragraph answer never needs a header or list after it
+    "explain_sentence": {"ceiling": 1600, "floor": 120, "stop_sequences": ["\n\n#", "\n\n-"]},
+    "generate_learning_cards": {"ceiling": 1000, "floor": 250},
+    "generate_mini_module": {"ceiling": 1000, "floor": 400},
+    "generate_questions": {"ceiling": 500, "floor": 120},
+    # Three questions for each section of a module, in one call
+    "generate_module_questions": {"ceiling": 1200, "floor": 300},
+    "generate_examples": {"ceiling": 1000, "floor": 200},
+}
+
+BUDGET_PERCENTILE = float(os.getenv('BUDGET_PERCENTILE', '99'))
+BUDGET_HEADROOM = float(os.getenv('BUDGET_HEADROOM', '1.2'))
+BUDGET_MIN_SAMPLES = int(os.getenv('BUDGET_MIN_SAMPLES', '20'))
+BUDGET_WINDOW = int(os.getenv('BUDGET_WINDOW', '500'))
+# Share of truncated responses above which the endpoint falls back to its ceiling
+BUDGET_MAX_TRUNCATION_RATE = float(os.getenv('BUDGET_MAX_TRUNCATION_RATE', '0.02'))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class EndpointBudget:
+    """Rolling window of observed output token counts for one endpoint"""
+
+    def __init__(self, name, ceiling, floor=1, stop_sequences=None, window=BUDGET_WINDOW):
+        self.name = name
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.stop_sequences = list(stop_sequences or [])
+        self.samples = deque(maxlen=window)
+        self.truncations = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, output_tokens, truncated=False):
+        with self._lock:
+            self.samples.append(int(output_tokens))
+            self.truncations.append(bool(truncated))
+
+    def truncation_rate(self):
+        with self._lock:
+            if not self.truncations:
+                return 0.0
+            return sum(self.truncations) / len(self.truncations)
+
+    def max_tokens(self):
+        """Derive max_tokens from a high percentile of the observed outputs"""
+        with self._lock:
+            samples = list(self.samples)
+            truncated = sum(self.truncations)
+        if len(samples) < BUDGET_MIN_SAMPLES:
+            return self.ceiling
+        # Truncated samples under-report the real length, so back off to the
+        # ceiling until the window is clean again
+        if truncated / len(samples) > BUDGET_MAX_TRUNCATION_RATE:
+            return self.ceiling
+        derived = math.ceil(percentile(samples, BUDGET_PERCENTILE) * BUDGET_HEADROOM)
+        return max(self.floor, min(self.ceiling, derived))
+
+    def settings(self):
+        """Current request settings plus the stats they were derived from"""
+        with self._lock:
+            samples = list(self.samples)
+        stats = {}
+        if samples:
+            stats = {
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+                "max": max(samples),
+            }
+        return {
+            "max_tokens": self.max_tokens(),
+            "stop_sequences": self.stop_sequences,
+            "ceiling": self.ceiling,
+            "floor": self.floor,
+            "samples": len(samples),
+            "truncation_rate": round(self.truncation_rate(), 4),
+            "observed": stats,
+        }
+
+
+class OutputBudgetManager:
+    """Tracks output lengths per endpoint and right-sizes max_tokens"""
+
+    def __init__(self, budgets=None):
+        self._budgets = {}
+        for name, config in (budgets or DEFAULT_BUDGETS).items():
+            self._budgets[name] = EndpointBudget(name, **config)
+
+    def get(self, endpoint):
+        if endpoint not in self._budgets:
+            raise KeyError(f"No output budget configured for endpoint: {endpoint}")
+        return self._budgets[endpoint]
+
+    def request_params(self, endpoint):
+        """max_tokens and stop_sequences to send for an endpoint"""
+        budget = self.get(endpoint)
+        params = {"max_tokens": budget.max_tokens()}
+        if budget.stop_sequences:
+            params["stop_sequences"] = budget.stop_sequences
+        return params
+
+    def record(self, endpoint, output_tokens, truncated=False):
+        budget = self.get(endpoint)
+        budget.record(output_tokens, truncated)
+        if truncated:
+            logger.warning(f"{endpoint} hit its output limit ({output_tokens} tokens)")
+
+    def settings(self):
+        return {name: budget.settings() for name, budget in self._budgets.items()}
+
+
+budgets = OutputBudgetManager()
@@ -0,0 +1,188 @@
+"""Precompute goals, roadmaps and learning cards into the topic catalog.
+
+Walks a topic list (one topic per line) for each proficiency level and
+stores the artifacts that /generate_goals, /generate_roadmap and
+/generate_learning_cards serve before falling back to live generation.
+Roadmaps go through the section engine like live ones, so sections that do
+not depend on the goals are generated once per topic and level, and
+cataloged roadmaps can be adopted and refreshed section by section.
+
+    python build_catalog.py topics.txt --concurrency 8
+    python build_catalog.py topics.txt --batch        # Message Batches API
+
+Run from the backend directory, like app.py. Point ANTHROPIC_BASE_URL and
+EXA_BASE_URL at stub_upstream.py to try it without API keys.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import sys
+import time
+
+import app
+from budgets import budgets
+from catalog import catalog, goals_key
+from utils import parse_goals
+
+logger = logging.getLogger('build_catalog')
+
+DEFAULT_PROFICIENCIES = ['beginner', 'intermediate', 'advanced']
+
+
+def read_topics(path):
+    with open(path, 'r') as f:
+        topics = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    # Keep the file order but drop duplicates
+    return list(dict.fromkeys(topics))
+
+
+def request_params(endpoint, params):
+    return {**budgets.request_params(endpoint), **params}
+
+
+def store_roadmap(topic, proficiency, goals, response_data):
+    """Catalog a section engine roadmap in the shape /generate_roadmap serves"""
+    if response_data['failed']:
+        raise ValueError(f"roadmap sections failed: {', '.join(response_data['failed'])}")
+    goals_text = app.format_goals_text(goals)
+    catalog.put('roadmap', topic, proficiency, {
+        key: response_data[key] for key in ('roadmap', 'resources', 'sections')
+    }, variant=goals_key(goals_text))
+
+
+def build_roadmap(topic, proficiency, goals, resources_cache):
+    """Generate (or reuse) the roadmap's sections and catalog it"""
+    response_data = app.roadmap_engine.generate(
+        topic, proficiency, app.format_goals_text(goals), lambda topic: resources_for(topic, resources_cache))
+    store_roadmap(topic, proficiency, goals, response_data)
+
+
+def build_pair(topic, proficiency, resources_cache, skip_existing=False):
+    """Generate and store goals, cards and roadmap for one topic/proficiency"""
+    if skip_existing and catalog.has('goals', topic, proficiency) and catalog.has('cards', topic, proficiency):
+        return 'skipped'
+
+    message = app.create_message('generate_goals', **app.goals_request(topic, proficiency))
+    goals = parse_goals(message.text)
+    if not goals:
+        raise ValueError('no goals parsed')
+    catalog.put('goals', topic, proficiency, {"goals": goals})
+
+    message = app.create_message('generate_learning_cards', **app.cards_request(topic, proficiency))
+    catalog.put('cards', topic, proficiency, app.parse_cards_response(message.text))
+
+    build_roadmap(topic, proficiency, goals, resources_cache)
+    return 'built'
+
+
+def resources_for(topic, resources_cache):
+    # Resources only depend on the topic, so share them across proficiencies
+    if topic not in resources_cache:
+        try:
+            resources_cache[topic] = app.fetch_resources(topic)
+        except Exception as e:
+            logger.warning(f"Resource search failed for {topic}: {str(e)}")
+            resources_cache[topic] = []
+    return resources_cache[topic]
+
+
+def build_concurrent(pairs, concurrency, skip_existing):
+    resources_cache = {}
+    counts = {'built': 0, 'skipped': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(build_pair, topic, proficiency, resources_cache, skip_existing): (topic, proficiency)
+            for topic, proficiency in pairs
+        }
+        for future in as_completed(futures):
+            topic, proficiency = futures[future]
+            try:
+                counts[future.result()] += 1
+            except Exception as e:
+                counts['failed'] += 1
+                logger.error(f"Failed {topic} ({proficiency}): {str(e)}")
+    return counts
+
+
+def run_batch(endpoint, requests):
+    """Submit {custom_id: params} as one batch on the endpoint's provider and wait for the texts"""
+    completions = app.providers.batch(endpoint, requests)
+    return {custom_id: completion.text for custom_id, completion in completions.items()}
+
+
+def build_batch(pairs, skip_existing):
+    """Two batch rounds: goals and cards first, then the roadmap sections not stored yet"""
+    if skip_existing:
+        pairs = [pair for pair in pairs
+                 if not (catalog.has('goals', *pair) and catalog.has('cards', *pair))]
+    counts = {'built': 0, 'skipped': 0, 'failed': 0}
+    keys = {f"p{i}": pair for i, pair in enumerate(pairs)}
+
+    first_round = {}
+    for key, (topic, proficiency) in keys.items():
+        first_round[f"{key}-goals"] = request_params('generate_goals', app.goals_request(topic, proficiency))
+        first_round[f"{key}-cards"] = request_params('generate_learning_cards', app.cards_request(topic, proficiency))
+    texts = run_batch('generate_goals', first_round) if first_round else {}
+
+    goals_by_key = {}
+    for key, (topic, proficiency) in keys.items():
+        try:
+            goals = parse_goals(texts[f"{key}-goals"])
+            if not goals:
+                raise ValueError('no goals parsed')
+            catalog.put('goals', topic, proficiency, {"goals": goals})
+            catalog.put('cards', topic, proficiency, app.parse_cards_response(texts[f"{key}-cards"]))
+            goals_by_key[key] = goals
+        except Exception as e:
+            counts['failed'] += 1
+            logger.error(f"Failed {topic} ({proficiency}): {str(e)}")
+
+    # Per pair and section: stored content, or the batch request generating it
+    plans, missing = app.roadmap_engine.plan_batch({
+        key: (*keys[key], app.format_goals_text(goals)) for key, goals in goals_by_key.items()})
+    second_round = {custom_id: request_params('roadmap_section', app.roadmap_section_request(*section))
+                    for custom_id, section in missing.items()}
+    texts = run_batch('roadmap_section', second_round) if second_round else {}
+
+    resources_cache = {}
+    for key, goals in goals_by_key.items():
+        topic, proficiency = keys[key]
+        try:
+            contents = {title: content if content is not None else app.roadmap_section_content(title, texts[custom_id])
+                        for title, (content, custom_id) in plans[key].items()}
+            response_data = app.roadmap_engine.save_generated(
+                topic, proficiency, app.format_goals_text(goals), resources_for(topic, resources_cache), contents)
+            store_roadmap(topic, proficiency, goals, response_data)
+        except Exception as e:
+            counts['failed'] += 1
+            logger.error(f"Failed roadmap for {topic} ({proficiency}): {str(e)}")
+            continue
+        counts['built'] += 1
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute the topic catalog')
+    parser.add_argument('topics', help='file with one topic per line')
+    parser.add_argument('--proficiency', nargs='+', default=DEFAULT_PROFICIENCIES)
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel topic/proficiency pairs')
+    parser.add_argument('--batch', action='store_true', help='use the Message Batches API')
+    parser.add_argument('--skip-existing', action='store_true', help='leave pairs already in the catalog alone')
+    args = parser.parse_args(argv)
+
+    topics = read_topics(args.topics)
+    pairs = [(topic, proficiency) for topic in topics for proficiency in args.proficiency]
+    logger.info(f"Building catalog for {len(pairs)} topic/proficiency pairs into {catalog.path}")
+
+    start = time.time()
+    if args.batch:
+        counts = build_batch(pairs, args.skip_existing)
+    else:
+        counts = build_concurrent(pairs, args.concurrency, args.skip_existing)
+    logger.info(f"Done in {time.time() - start:.1f}s: {counts}")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
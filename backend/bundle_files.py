@@ -0,0 +1,105 @@
+"""Bundle files and the manifest that lists them.
+
+Kept apart from export_bundles.py, which renders the bundles with the live
+generators, so the file layout can be used without the app.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always written
+    brotli = None
+
+from catalog import normalize_topic
+
+# Bumped when the bundle layout changes; the frontend ignores other versions
+BUNDLE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 16
+# JavaScript's \s, which trim() also strips; Python's \s differs on U+FEFF and U+001C-U+001F
+JS_WHITESPACE = re.compile('[\t\n\v\f\r \u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000\ufeff]+')
+
+
+def normalize_key(value):
+    r"""The frontend's normalizeKey: String(value).replace(/\s+/g, ' ').trim().toLowerCase()"""
+    return JS_WHITESPACE.sub(' ', str(value)).strip(' ').lower()
+
+
+def bundle_key(topic, proficiency):
+    """Manifest key the frontend looks topics up by"""
+    return f"{normalize_key(topic)}|{normalize_key(proficiency)}"
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', normalize_topic(text)).strip('-')[:60] or 'topic'
+
+
+def encode(payload):
+    """Canonical JSON bytes, so unchanged content hashes to the same file"""
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_compressed(path, data):
+    """path plus its precompressed .gz (and .br) copies"""
+    write_atomic(path, data)
+    write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_atomic(path + '.br', brotli.compress(data, quality=11))
+
+
+def write_bundle(out_dir, bundle):
+    """Write a bundle under its content hash; returns its manifest entry"""
+    data = encode(bundle)
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{slug(bundle['topic'])}-{slug(bundle['proficiency'])}.{digest[:HASH_LENGTH]}.json"
+    path = os.path.join(out_dir, name)
+    if not os.path.exists(path):
+        write_compressed(path, data)
+    return {
+        "file": name,
+        "sha256": digest,
+        "bytes": len(data),
+        "gzipBytes": os.path.getsize(path + '.gz'),
+        "topic": bundle['topic'],
+        "proficiency": bundle['proficiency'],
+        "exportedAt": time.time(),
+    }
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('bundles', {}) if manifest.get('version') == BUNDLE_VERSION else {}
+
+
+def write_manifest(out_dir, bundles):
+    """Written last, so it never points at a bundle that is not there yet"""
+    manifest = {"version": BUNDLE_VERSION, "generatedAt": time.time(), "bundles": bundles}
+    write_compressed(os.path.join(out_dir, MANIFEST_NAME), encode(manifest))
+
+
+def prune(out_dir, bundles):
+    """Delete bundle files the manifest no longer references"""
+    keep = {entry['file'] for entry in bundles.values()}
+    removed = 0
+    for name in os.listdir(out_dir):
+        base = re.sub(r'\.(gz|br)$', '', name)
+        if base != MANIFEST_NAME and base.endswith('.json') and base not in keep:
+            os.remove(os.path.join(out_dir, name))
+            removed += 1
+    return removed
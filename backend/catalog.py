@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+from storage import SQLiteStore, data_path
+from topic_index import TopicIndex
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = os.getenv('CATALOG_PATH') or data_path('catalog.db')
+CATALOG_ENABLED = os.getenv('CATALOG_ENABLED', '1') == '1'
+# Store live generations too, so the catalog doubles as a cache for the long tail
+CATALOG_WRITE_THROUGH = os.getenv('CATALOG_WRITE_THROUGH', '1') == '1'
+
+# Near-duplicate topics ("python" / "learn python basics") reuse the same entry
+TOPIC_MATCH_ENABLED = os.getenv('TOPIC_MATCH_ENABLED', '1') == '1'
+TOPIC_MATCH_THRESHOLD = float(os.getenv('TOPIC_MATCH_THRESHOLD', '0.85'))
+# Pick up topics written by other workers
+TOPIC_INDEX_REFRESH = float(os.getenv('TOPIC_INDEX_REFRESH', '60'))
+
+CATALOG_KINDS = ('goals', 'roadmap', 'cards')
+
+
+def normalize_topic(topic):
+    """Case- and whitespace-insensitive catalog key for a topic"""
+    return re.sub(r'\s+', ' ', str(topic)).strip().lower()
+
+
+def goals_key(goals_text):
+    """Stable hash of a goals list, ignoring bullets, case and spacing"""
+    lines = []
+    for line in str(goals_text).split('\n'):
+        line = normalize_topic(line.strip().lstrip('-*').strip())
+        if line:
+            lines.append(line)
+    return hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()[:16]
+
+
+class TopicCatalog(SQLiteStore):
+    """Precomputed goals, roadmaps and cards keyed by topic and proficiency"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS artifacts (
+        kind TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        proficiency TEXT NOT NULL,
+        variant TEXT NOT NULL DEFAULT '',
+        payload BLOB NOT NULL,
+        source TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (kind, topic, proficiency, variant)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path=CATALOG_PATH, enabled=CATALOG_ENABLED, write_through=CATALOG_WRITE_THROUGH,
+                 match_threshold=TOPIC_MATCH_THRESHOLD, match_enabled=TOPIC_MATCH_ENABLED):
+        super().__init__(path)
+        self.enabled = enabled
+        self.write_through = write_through
+        self.match_enabled = match_enabled
+        self.match_threshold = match_threshold
+        self.index = TopicIndex()
+        self._index_loaded_at = 0.0
+        self._index_lock = threading.Lock()
+        self.counters = {'exact': 0, 'similar': 0, 'miss': 0}
+
+    def _load_payload(self, kind, topic, proficiency, variant):
+        row = self.execute(
+            'SELECT payload FROM artifacts WHERE kind = ? AND topic = ? AND proficiency = ? AND variant = ?',
+            (kind, topic, proficiency, variant)
+        ).fetchone()
+        return None if row is None else json.loads(zlib.decompress(row['payload']))
+
+    def _refresh_index(self):
+        with self._index_lock:
+            if time.time() - self._index_loaded_at < TOPIC_INDEX_REFRESH:
+                return
+            rows = self.execute('SELECT DISTINCT topic, proficiency FROM artifacts').fetchall()
+            self.index.add_many([(row['topic'], row['proficiency']) for row in rows])
+            self._index_loaded_at = time.time()
+
+    def resolve_topic(self, topic, proficiency):
+        """Closest cataloged topic for a near-duplicate one, as (topic, score) or None"""
+        self._refresh_index()
+        return self.index.match(normalize_topic(topic), normalize_topic(proficiency), self.match_threshold)
+
+    def get(self, kind, topic, proficiency, variant=''):
+        """Return the stored artifact, or None on a miss"""
+        if not self.enabled:
+            return None
+        topic_key, proficiency_key = normalize_topic(topic), normalize_topic(proficiency)
+        try:
+            payload = self._load_payload(kind, topic_key, proficiency_key, variant)
+            if payload is not None:
+                self.counters['exact'] += 1
+                logger.debug(f"Catalog hit: {kind} {topic} ({proficiency})")
+                return payload
+            if self.match_enabled:
+                match = self.resolve_topic(topic_key, proficiency_key)
+                if match is not None and match[0] != topic_key:
+                    payload = self._load_payload(kind, match[0], proficiency_key, variant)
+                    if payload is not None:
+                        self.counters['similar'] += 1
+                        logger.debug(f"Catalog near-duplicate hit: {topic} -> {match[0]} ({match[1]:.2f})")
+                        return payload
+        except Exception as e:
+            # The catalog is an optimisation; never fail a request because of it
+            logger.error(f"Catalog lookup failed: {str(e)}")
+            return None
+        self.counters['miss'] += 1
+        return None
+
+    def put(self, kind, topic, proficiency, payload, variant='', source='batch'):
+        if kind not in CATALOG_KINDS:
+            raise ValueError(f"Unknown catalog kind: {kind}")
+        blob = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 9)
+        self.write(
+            'INSERT OR REPLACE INTO artifacts (kind, topic, proficiency, variant, payload, source, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (kind, normalize_topic(topic), normalize_topic(proficiency), variant, blob, source, time.time())
+        )
+        self.index.add(normalize_topic(topic), normalize_topic(proficiency))
+
+    def put_live(self, kind, topic, proficiency, payload, variant=''):
+        """Write-through for live generations; failures are logged, not raised"""
+        if not (self.enabled and self.write_through):
+            return
+        try:
+            self.put(kind, topic, proficiency, payload, variant=variant, source='live')
+        except Exception as e:
+            logger.error(f"Catalog write failed: {str(e)}")
+
+    def has(self, kind, topic, proficiency, variant=''):
+        row = self.execute(
+            'SELECT 1 FROM artifacts WHERE kind = ? AND topic = ? AND proficiency = ? AND variant = ?',
+            (kind, normalize_topic(topic), normalize_topic(proficiency), variant)
+        ).fetchone()
+        return row is not None
+
+    def stats(self):
+        rows = self.execute(
+            'SELECT kind, source, COUNT(*) AS n, SUM(LENGTH(payload)) AS bytes '
+            'FROM artifacts GROUP BY kind, source'
+        ).fetchall()
+        return {
+            "artifacts": [dict(row) for row in rows],
+            "lookups": dict(self.counters),
+            "indexed_topics": len(self.index),
+            "match_threshold": self.match_threshold,
+        }
+
+
+catalog = TopicCatalog()
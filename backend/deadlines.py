@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging
+import os
+import threading
+import time
+import uuid
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# How long an endpoint waits before answering with what it has
+MODULE_DEADLINE = float(os.getenv('MODULE_DEADLINE', '20'))
+ROADMAP_RESOURCES_DEADLINE = float(os.getenv('ROADMAP_RESOURCES_DEADLINE', '8'))
+# Extra time upstream calls get to finish in the background once the
+# response has gone out; after that they are abandoned
+PENDING_GRACE = float(os.getenv('PENDING_GRACE', '40'))
+# Finished background results are kept this long for /pending/<job_id>
+PENDING_TTL = float(os.getenv('PENDING_TTL', '600'))
+DEADLINE_WORKERS = int(os.getenv('DEADLINE_WORKERS', '16'))
+# Resource lookups get threads of their own, so they never queue behind generations
+RESOURCE_WORKERS = int(os.getenv('RESOURCE_WORKERS', '8'))
+# Speculative work (mini modules of cards not opened yet) is confined to a few threads
+PREGENERATE_WORKERS = int(os.getenv('PREGENERATE_WORKERS', '2'))
+# Never hand an upstream client a timeout shorter than this
+MIN_UPSTREAM_TIMEOUT = 1.0
+
+
+class Deadline:
+    """A response deadline plus the hard limit for the upstream calls behind it"""
+
+    def __init__(self, seconds, grace=PENDING_GRACE):
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+        self.hard_expires_at = self.expires_at + grace
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def upstream_timeout(self, cap=None):
+        """Timeout for an upstream call that may keep running after the response"""
+        timeout = max(MIN_UPSTREAM_TIMEOUT, self.hard_expires_at - time.monotonic())
+        return min(timeout, cap) if cap else timeout
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+class PendingJobs:
+    """Upstream work that outlived its request, fetchable later by job id"""
+
+    def __init__(self, max_workers=DEADLINE_WORKERS, ttl=PENDING_TTL, lanes=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='deadline')
+        # Separate executors, by name, for work that must not share the main queue
+        self.lanes = {name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+                      for name, workers in (lanes or {}).items()}
+        self.ttl = ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        # Spans opened by fn join the submitting request's trace
+        return self.executor.submit(tracing.bind(fn), *args, **kwargs)
+
+    def submit_lane(self, lane, fn, *args, **kwargs):
+        """submit() on one of the separate executors; the future can be parked the same way"""
+        return self.lanes[lane].submit(tracing.bind(fn), *args, **kwargs)
+
+    def park(self, future, kind):
+        """Register a still-running future and return its job id"""
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self._expire()
+            self.jobs[job_id] = {"future": future, "kind": kind, "created": time.monotonic()}
+        return job_id
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job['created'] < cutoff]:
+            del self.jobs[job_id]
+
+    def when_all(self, futures, callback):
+        """Call callback(results) once every future has succeeded, without holding a worker"""
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if any(future.exception() is not None for future in futures):
+                return
+            try:
+                callback([future.result() for future in futures])
+            except Exception as e:
+                logger.error(f"Completing pending work failed: {str(e)}")
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def status(self, job_id):
+        """{"status": pending|done|failed, ...} or None for an unknown or expired job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        future = job['future']
+        if not future.done():
+            return {"status": "pending", "kind": job['kind']}
+        error = future.exception()
+        if error is not None:
+            return {"status": "failed", "kind": job['kind'], "error": str(error)}
+        return {"status": "done", "kind": job['kind'], "result": future.result()}
+
+    def gather(self, tasks, deadline):
+        """Run named callables in parallel until the deadline.
+
+        Returns (results, failed, running): finished values by name, the
+        exceptions of calls that failed, and the futures still in flight.
+        """
+        futures = {name: self.submit(fn) for name, fn in tasks.items()}
+        wait(futures.values(), timeout=deadline.remaining())
+        results, failed, running = {}, {}, {}
+        for name, future in futures.items():
+            if not future.done():
+                running[name] = future
+            elif future.exception() is not None:
+                failed[name] = future.exception()
+                logger.error(f"{name} failed: {str(future.exception())}")
+            else:
+                results[name] = future.result()
+        if running:
+            logger.warning(f"Deadline passed after {deadline.elapsed():.1f}s, still running: {', '.join(running)}")
+        return results, failed, running
+
+
+pending_jobs = PendingJobs(lanes={'resources': RESOURCE_WORKERS, 'pregenerate': PREGENERATE_WORKERS})
@@ -0,0 +1,156 @@
+"""Export complete learning paths as static JSON bundles for a CDN or static host.
+
+For each topic and proficiency, the goals -> roadmap -> module content ->
+cards -> mini modules chain is rendered with the same generators the live
+routes use (reusing whatever the catalog, library and mini module stores
+already hold) and written as one bundle:
+
+    bundles/manifest.json                           topic|proficiency -> file
+    bundles/python-beginner.3fa2c1d4e5b6a7f8.json   the learning path
+    bundles/python-beginner.3fa2c1d4e5b6a7f8.json.gz (and .br with brotli)
+
+Bundle names carry a hash of their content, so they can be cached forever
+(Cache-Control: immutable); only manifest.json changes between exports. The
+.gz/.br copies are for hosts that serve precompressed files (nginx
+gzip_static, most CDNs). The frontend reads the manifest from
+REACT_APP_BUNDLE_BASE_URL and only calls the backend on a miss.
+
+    python export_bundles.py topics.txt --out bundles --concurrency 4
+
+Run from the backend directory, like build_catalog.py.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import os
+import sys
+import time
+
+import app
+import build_catalog
+from bundle_files import BUNDLE_VERSION, bundle_key, load_manifest, prune, write_bundle, write_manifest
+from catalog import catalog, goals_key
+from deadlines import Deadline, MODULE_DEADLINE, PENDING_GRACE
+from library import library, content_key
+from mini_modules import mini_modules
+from storage import data_path
+
+logger = logging.getLogger('export_bundles')
+
+BUNDLE_DIR = os.getenv('BUNDLE_DIR') or data_path('bundles')
+
+
+def catalog_goals(topic, proficiency, resources_cache):
+    """Goals, cards and roadmap from the catalog, building whatever is missing"""
+    build_catalog.build_pair(topic, proficiency, resources_cache, skip_existing=True)
+    goals = catalog.get('goals', topic, proficiency)['goals']
+    cards = catalog.get('cards', topic, proficiency)
+    roadmap = catalog.get('roadmap', topic, proficiency, variant=goals_key(app.format_goals_text(goals)))
+    if roadmap is None:
+        # Goals and cards were cataloged without their roadmap
+        build_catalog.build_roadmap(topic, proficiency, goals, resources_cache)
+        roadmap = catalog.get('roadmap', topic, proficiency, variant=goals_key(app.format_goals_text(goals)))
+    return goals, cards, roadmap
+
+
+def module_content(topic, proficiency, goals):
+    """The /generate_module_content body for these goals, generated in full"""
+    # Same goals text and key as the route, so modules it stored are reused
+    goals_text = "\n".join([f"- {goal}" for goal in goals])
+    stored = library.find('modules', content_key(topic, proficiency, goals_text))
+    if stored is not None and stored.get('status') == 'complete':
+        return stored
+    module = {"fundamentalTruths": [], "crossDomainConnections": []}
+    for field, _ in app.MODULE_SECTIONS:
+        module.update(app.generate_module_section(field, topic, proficiency, goals_text,
+                                                  Deadline(MODULE_DEADLINE + PENDING_GRACE, grace=0)))
+    module["status"] = "complete"
+    return module
+
+
+def card_mini_modules(topic, cards):
+    """Cards with their moduleId, and the mini module of each card by id"""
+    with_ids, modules = [], {}
+    for card in cards.get('cards', []):
+        card_context = {"title": card.get('title', ''), "description": card.get('description', '')}
+        module_id = mini_modules.start(topic, card_context, app.generate_mini_module_for, app.pending_jobs.submit)
+        future = mini_modules.future(module_id)
+        if future is not None:
+            future.exception(timeout=app.REQUEST_TIMEOUT * 4)
+        stored = mini_modules.get(module_id)
+        if stored is not None and stored['status'] == 'done':
+            modules[module_id] = {**stored['content'], "moduleId": module_id}
+        else:
+            logger.warning(f"No mini module for card {card_context['title']!r} of {topic}")
+        with_ids.append({**card, "moduleId": module_id})
+    return {**cards, "cards": with_ids}, modules
+
+
+def render_bundle(topic, proficiency, resources_cache):
+    goals, cards, roadmap = catalog_goals(topic, proficiency, resources_cache)
+    cards, modules = card_mini_modules(topic, cards)
+    return {
+        "version": BUNDLE_VERSION,
+        "topic": topic,
+        "proficiency": proficiency,
+        "goals": goals,
+        "roadmap": roadmap,
+        "module": module_content(topic, proficiency, goals),
+        "cards": cards,
+        "miniModules": modules,
+    }
+
+
+def export(pairs, out_dir, concurrency):
+    os.makedirs(out_dir, exist_ok=True)
+    bundles = load_manifest(out_dir)
+    resources_cache = {}
+    counts = {'exported': 0, 'unchanged': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(render_bundle, topic, proficiency, resources_cache): (topic, proficiency)
+            for topic, proficiency in pairs
+        }
+        for future in as_completed(futures):
+            topic, proficiency = futures[future]
+            try:
+                entry = write_bundle(out_dir, future.result())
+            except Exception as e:
+                counts['failed'] += 1
+                logger.error(f"Failed {topic} ({proficiency}): {str(e)}")
+                continue
+            key = bundle_key(topic, proficiency)
+            previous = bundles.get(key)
+            if previous and previous['sha256'] == entry['sha256']:
+                counts['unchanged'] += 1
+            else:
+                counts['exported'] += 1
+                bundles[key] = entry
+    write_manifest(out_dir, bundles)
+    return bundles, counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export learning paths as static JSON bundles')
+    parser.add_argument('topics', help='file with one topic per line')
+    parser.add_argument('--proficiency', nargs='+', default=build_catalog.DEFAULT_PROFICIENCIES)
+    parser.add_argument('--out', default=BUNDLE_DIR, help='output directory')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel topic/proficiency pairs')
+    parser.add_argument('--prune', action='store_true', help='delete bundles the manifest no longer lists')
+    args = parser.parse_args(argv)
+
+    topics = build_catalog.read_topics(args.topics)
+    pairs = [(topic, proficiency) for topic in topics for proficiency in args.proficiency]
+    logger.info(f"Exporting {len(pairs)} learning paths to {args.out}")
+
+    start = time.time()
+    bundles, counts = export(pairs, args.out, args.concurrency)
+    if args.prune:
+        counts['pruned'] = prune(args.out, bundles)
+    logger.info(f"Done in {time.time() - start:.1f}s: {counts}, {len(bundles)} bundles in the manifest")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
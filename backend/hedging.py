@@ -0,0 +1,216 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from budgets import percentile
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: only these endpoints are hedged
+HEDGE_ENDPOINTS = [name.strip() for name in os.getenv('HEDGE_ENDPOINTS', '').split(',') if name.strip()]
+# Hedge once the primary has gone this far into its usual time-to-first-token distribution
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+# Used until an endpoint has HEDGE_MIN_SAMPLES first-token timings
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '2.0'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', '500'))
+# Spend cap: at most this share of requests (plus a small burst) get a second call
+HEDGE_MAX_RATE = float(os.getenv('HEDGE_MAX_RATE', '0.1'))
+HEDGE_BURST = float(os.getenv('HEDGE_BURST', '5'))
+# Optional faster model for the hedge, per endpoint, e.g. {"explain_sentence": "claude-3-haiku-20240307"}
+HEDGE_MODELS = json.loads(os.getenv('HEDGE_MODELS', '{}'))
+HEDGE_WORKERS = int(os.getenv('HEDGE_WORKERS', '16'))
+
+
+class EndpointHedging:
+    """First-token timings, hedge allowance and counters for one endpoint"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.ttft = deque(maxlen=HEDGE_WINDOW)
+        self.allowance = HEDGE_BURST
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self.cancelled = 0
+        self.failovers = 0
+
+    @staticmethod
+    def _threshold(samples):
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return percentile(samples, HEDGE_PERCENTILE)
+
+    def threshold(self):
+        with self.lock:
+            samples = list(self.ttft)
+        return self._threshold(samples)
+
+    def started(self):
+        # Every request earns a fraction of a hedge, so hedges stay under HEDGE_MAX_RATE
+        with self.lock:
+            self.requests += 1
+            self.allowance = min(HEDGE_BURST, self.allowance + HEDGE_MAX_RATE)
+
+    def take_hedge(self):
+        with self.lock:
+            if self.allowance < 1:
+                self.denied += 1
+                return False
+            self.allowance -= 1
+            self.hedged += 1
+            return True
+
+    def observe_ttft(self, seconds):
+        with self.lock:
+            self.ttft.append(seconds)
+
+    def failed_over(self):
+        with self.lock:
+            self.failovers += 1
+
+    def finished(self, hedge_won, cancelled):
+        with self.lock:
+            self.hedge_wins += int(hedge_won)
+            self.cancelled += cancelled
+
+    def snapshot(self):
+        with self.lock:
+            samples = list(self.ttft)
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "denied": self.denied,
+                "cancelled": self.cancelled,
+                "failovers": self.failovers,
+                "threshold_s": round(self._threshold(samples), 3),
+                "ttft_p50_s": round(percentile(samples, 50), 3) if samples else None,
+                "ttft_p95_s": round(percentile(samples, 95), 3) if samples else None,
+            }
+
+
+class Hedger:
+    """Hedged requests: a second call goes out when the first is slow to start, first to finish wins.
+
+    A primary that fails before the hedge threshold sends the call to the next
+    provider at once, outside the hedge budget. When every attempt fails, the
+    providers not tried yet get it through the router's failover.
+    """
+
+    def __init__(self, router, endpoints=HEDGE_ENDPOINTS, models=HEDGE_MODELS):
+        self.router = router
+        self.endpoints = set(endpoints)
+        self.models = models
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+
+    def enabled(self, endpoint):
+        return endpoint in self.endpoints
+
+    def _stats(self, endpoint):
+        with self.stats_lock:
+            if endpoint not in self.stats:
+                self.stats[endpoint] = EndpointHedging(endpoint)
+            return self.stats[endpoint]
+
+    def _attempt(self, name, provider, request, results, progress, cancelled, on_primary_token):
+        def on_first_token():
+            if name == 'primary':
+                # Recorded even when the backup wins, so slow starts stay in the distribution
+                on_primary_token()
+            progress.set()
+        try:
+            results.put((name, provider.complete_streaming(request, on_first_token, cancelled), None))
+        except Exception as e:
+            results.put((name, None, e))
+        progress.set()
+
+    def generate(self, endpoint, request):
+        stats = self._stats(endpoint)
+        stats.started()
+        candidates = self.router.candidates(endpoint)
+        # Hedge on the next provider in the route if there is one, else on the same one
+        primary, backup = candidates[0], candidates[1] if len(candidates) > 1 else candidates[0]
+
+        results = queue.Queue()
+        progress = threading.Event()
+        cancel = {'primary': threading.Event(), 'backup': threading.Event()}
+        running, tried = set(), []
+        start = time.monotonic()
+
+        def on_primary_token():
+            stats.observe_ttft(time.monotonic() - start)
+
+        def launch(name, provider, attempt_request):
+            running.add(name)
+            tried.append(provider)
+            self.executor.submit(tracing.bind(self._attempt), name, provider, attempt_request, results, progress,
+                                 cancel[name], on_primary_token)
+
+        launch('primary', primary, request)
+        threshold_at = start + stats.threshold()
+        # Set once the backup went out, or can no longer go out as a hedge
+        backup_decided = hedged = False
+        last_error = None
+        while running:
+            timeout = None
+            if not backup_decided and not progress.is_set():
+                timeout = max(0.0, threshold_at - time.monotonic())
+            try:
+                name, completion, error = results.get(timeout=timeout)
+            except queue.Empty:
+                # Slow to start: hedge, if the spend cap allows
+                backup_decided = True
+                if stats.take_hedge():
+                    hedge_request = dict(request)
+                    if self.models.get(endpoint):
+                        hedge_request['model'] = self.models[endpoint]
+                    launch('backup', backup, hedge_request)
+                    hedged = True
+                    tracing.add_event('hedge', provider=backup.name)
+                    logger.debug(f"Hedged {endpoint} on {backup.name} after {time.monotonic() - start:.2f}s")
+                continue
+            running.discard(name)
+            if error is not None:
+                last_error = error
+                tracing.add_event('failover', provider=name, error=str(error)[:200])
+                if name == 'primary' and not backup_decided and backup is not primary:
+                    # Failed before the threshold: the next provider now, not after the threshold
+                    backup_decided = True
+                    launch('backup', backup, request)
+                    stats.failed_over()
+                continue
+            if completion is None:
+                continue
+            # First finisher wins; attempts still running stop at their next token
+            for other in running:
+                cancel[other].set()
+            stats.finished(hedge_won=hedged and name == 'backup', cancelled=len(running))
+            return completion
+
+        remaining = [provider for provider in candidates if provider not in tried]
+        if not remaining:
+            raise last_error
+        logger.warning(f"Hedged attempts for {endpoint} failed ({str(last_error)}), failing over")
+        return self.router.generate(endpoint, request, providers=remaining)
+
+    def settings(self):
+        with self.stats_lock:
+            endpoints = {name: stats.snapshot() for name, stats in self.stats.items()}
+        return {
+            "endpoints_enabled": sorted(self.endpoints),
+            "percentile": HEDGE_PERCENTILE,
+            "max_rate": HEDGE_MAX_RATE,
+            "endpoints": endpoints,
+        }
@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import logging
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL_GZIP = int(os.getenv('COMPRESS_LEVEL_GZIP', '6'))
+COMPRESS_LEVEL_BROTLI = int(os.getenv('COMPRESS_LEVEL_BROTLI', '5'))
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'image/svg+xml')
+
+DEFAULT_CACHE_POLICY = 'no-store'
+
+# Cache-Control per Flask endpoint; anything not listed is never stored
+ROUTE_CACHE_POLICIES = {
+    # Catalog artifacts only change when the catalog is rebuilt
+    'get_catalog_artifact': 'public, max-age=86400, stale-while-revalidate=604800',
+    'favicon': 'public, max-age=604800',
+    'static': 'public, max-age=604800',
+    # A stored roadmap changes when its sections are refreshed; revalidated via ETag
+    'get_roadmap': 'private, no-cache',
+}
+
+# GET responses whose body is a pure function of the request get a content ETag.
+# POST responses are never reused by browsers, so they get none: the frontend's
+# generation calls are POSTs and only benefit from compression.
+ETAG_ENDPOINTS = set(ROUTE_CACHE_POLICIES)
+
+
+def content_etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """gzip/brotli a buffered response above the size threshold"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers):
+        return response
+    if not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = _accepted_encoding()
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=COMPRESS_LEVEL_BROTLI)
+    elif encoding == 'gzip':
+        compressed = gzip.compress(body, compresslevel=COMPRESS_LEVEL_GZIP)
+    else:
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def finalize_response(response):
+    """Apply the route's Cache-Control, content ETag/304 and compression"""
+    endpoint = request.endpoint
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = ROUTE_CACHE_POLICIES.get(endpoint, DEFAULT_CACHE_POLICY)
+
+    if (endpoint in ETAG_ENDPOINTS and request.method in ('GET', 'HEAD') and response.status_code == 200
+            and not response.direct_passthrough and not response.is_streamed):
+        # Weak, so the same tag still matches once the body is compressed
+        response.set_etag(content_etag(response.get_data()), weak=True)
+        response.make_conditional(request)
+
+    return compress_response(response)
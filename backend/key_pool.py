@@ -0,0 +1,216 @@
+"""API keys of one provider, each with its own client and rate-limit state.
+
+Every call leases the least-loaded healthy key, so a deployment with N keys
+gets roughly N keys' worth of rate limit:
+
+    ANTHROPIC_API_KEYS=sk-ant-1,sk-ant-2,sk-ant-3
+    PERPLEXITY_API_KEYS=pplx-1,pplx-2
+
+A key that gets a 429 sits out for its Retry-After; one that is rejected as
+invalid sits out for KEY_AUTH_COOLDOWN. Connection errors and timeouts say
+nothing about the key, so they are retried after KEY_CONNECTION_RETRY_DELAY
+on whichever key is least loaded, possibly the same one. Keys are swapped at runtime with
+replace(), which publishes a new tuple of keys without blocking calls in flight.
+"""
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+
+import anthropic
+import openai
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Seconds a key sits out after a 429 without a Retry-After header
+KEY_RATE_LIMIT_COOLDOWN = float(os.getenv('KEY_RATE_LIMIT_COOLDOWN', '10'))
+# Seconds a key sits out after the provider rejects it (401/403)
+KEY_AUTH_COOLDOWN = float(os.getenv('KEY_AUTH_COOLDOWN', '600'))
+# When every key is cooling down, wait this long at most for the first one back
+KEY_MAX_WAIT = float(os.getenv('KEY_MAX_WAIT', '5'))
+# Pause before retrying a call that got no response at all
+KEY_CONNECTION_RETRY_DELAY = float(os.getenv('KEY_CONNECTION_RETRY_DELAY', '0.5'))
+
+RATE_LIMITED = 429
+AUTH_FAILED = (401, 403)
+# No response arrived (the SDKs' timeout errors subclass these)
+CONNECTION_ERRORS = (anthropic.APIConnectionError, openai.APIConnectionError)
+
+
+def connection_failed(error):
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+def retryable(error):
+    """Worth another attempt: rate limits, rejected keys, server errors, connection errors and timeouts"""
+    if connection_failed(error):
+        return True
+    status = getattr(error, 'status_code', None)
+    return status == RATE_LIMITED or status in AUTH_FAILED or (status is not None and status >= 500)
+
+
+def retry_delay(error):
+    """Seconds to wait before the next attempt; none when another key can take it at once"""
+    return KEY_CONNECTION_RETRY_DELAY if connection_failed(error) else 0.0
+
+
+def keys_from_env(prefix):
+    """PREFIX_API_KEYS (comma-separated) plus PREFIX_API_KEY, without duplicates"""
+    keys = [key.strip() for key in os.getenv(f'{prefix}_API_KEYS', '').split(',')]
+    keys.append((os.getenv(f'{prefix}_API_KEY') or '').strip())
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def mask_key(key):
+    if not key:
+        return ''
+    return f"{key[:5]}...{key[-5:]}" if len(key) > 10 else key
+
+
+def retry_after(error):
+    """Retry-After seconds from an SDK error's response, if it has one"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class KeysExhausted(Exception):
+    """Every key of a pool is cooling down"""
+
+    def __init__(self, name, wait):
+        super().__init__(f"All {name} API keys are rate limited for {wait:.1f}s")
+        self.wait = wait
+
+
+class PooledKey:
+    """One API key, its client (and connection pool) and its rate-limit state"""
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.inflight = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+        self.last_error = None
+
+    def available(self, now):
+        return now >= self.cooldown_until
+
+    def snapshot(self, now):
+        return {
+            "key": mask_key(self.key),
+            "inflight": self.inflight,
+            "calls": self.calls,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "cooling_s": round(max(0.0, self.cooldown_until - now), 1),
+            "last_error": self.last_error,
+        }
+
+
+class KeyPool:
+    """Least-loaded routing over a provider's API keys.
+
+    make_client(key) builds the client for a key. Reads of the key tuple take
+    no lock; the lock only guards the small counter updates and replace().
+    """
+
+    def __init__(self, name, keys, make_client):
+        self.name = name
+        self.make_client = make_client
+        self.lock = threading.Lock()
+        self.keys = tuple(PooledKey(key, make_client(key)) for key in dict.fromkeys(keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def replace(self, keys):
+        """Swap in a new key list; unchanged keys keep their client and state"""
+        keys = list(dict.fromkeys(key for key in keys if key))
+        if not keys:
+            raise ValueError(f"{self.name} needs at least one API key")
+        with self.lock:
+            current = {pooled.key: pooled for pooled in self.keys}
+            # Removed keys are dropped from the tuple; calls already holding one finish normally
+            self.keys = tuple(current.get(key) or PooledKey(key, self.make_client(key)) for key in keys)
+        logger.info(f"{self.name} key pool now has {len(keys)} keys")
+
+    def _pick(self):
+        keys = self.keys
+        now = time.time()
+        with self.lock:
+            healthy = [pooled for pooled in keys if pooled.available(now)]
+            if not healthy:
+                raise KeysExhausted(self.name, min(pooled.cooldown_until for pooled in keys) - now)
+            pooled = min(healthy, key=lambda p: (p.inflight, p.calls))
+            pooled.inflight += 1
+            pooled.calls += 1
+        return pooled
+
+    def _failed(self, pooled, error):
+        status = getattr(error, 'status_code', None)
+        with self.lock:
+            pooled.errors += 1
+            pooled.last_error = str(error)[:200]
+            if status == RATE_LIMITED:
+                pooled.rate_limited += 1
+                pooled.cooldown_until = time.time() + (retry_after(error) or KEY_RATE_LIMIT_COOLDOWN)
+            elif status in AUTH_FAILED:
+                pooled.cooldown_until = time.time() + KEY_AUTH_COOLDOWN
+                logger.error(f"{self.name} rejected key {mask_key(pooled.key)}: {str(error)}")
+
+    @contextmanager
+    def lease(self):
+        """The least-loaded healthy key's client for the duration of one call"""
+        pooled = self._pick()
+        try:
+            yield pooled.client
+        except Exception as e:
+            self._failed(pooled, e)
+            raise
+        finally:
+            with self.lock:
+                pooled.inflight -= 1
+
+    def attempts(self):
+        """Attempts a call gets: one per key, and at least one retry"""
+        return max(2, len(self.keys))
+
+    def call(self, fn):
+        """fn(client) on the least-loaded key, retrying after a 429, 5xx, connection error or timeout.
+
+        Pooled clients are built with the SDK's own retries off, since those
+        would keep retrying a rate-limited key instead of switching.
+        """
+        attempts = self.attempts()
+        waited = False
+        while True:
+            try:
+                with self.lease() as client:
+                    return fn(client)
+            except KeysExhausted as e:
+                if waited or e.wait > KEY_MAX_WAIT:
+                    raise
+                waited = True
+                tracing.add_event('keys_exhausted', pool=self.name, wait_s=round(e.wait, 2))
+                time.sleep(max(0.0, e.wait))
+            except Exception as e:
+                attempts -= 1
+                if not retryable(e) or attempts <= 0:
+                    raise
+                logger.warning(f"{self.name} call failed ({getattr(e, 'status_code', None) or type(e).__name__}), "
+                               "trying again")
+                tracing.add_event('retry', pool=self.name, status=getattr(e, 'status_code', None))
+                time.sleep(retry_delay(e))
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            return [pooled.snapshot(now) for pooled in self.keys]
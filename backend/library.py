@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from storage import SQLiteStore, data_path
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_PATH = os.getenv('LIBRARY_PATH') or data_path('library.db')
+LIBRARY_KINDS = ('modules', 'explanations', 'examples')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def content_key(*parts):
+    """Hash of the inputs that produced a piece of content"""
+    normalized = '\x1f'.join(' '.join(str(part).split()).lower() for part in parts)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:32]
+
+
+def item_key(kind, topic, payload):
+    """Key a saved item the same way the generating endpoint keys it"""
+    if kind == 'explanations' and payload.get('selectedText'):
+        return content_key(topic, payload['selectedText'])
+    if kind == 'examples' and payload.get('text'):
+        return content_key(topic, payload['text'])
+    return content_key(topic, json.dumps(payload, sort_keys=True))
+
+
+def encode_cursor(row):
+    return f"{row['created_at']!r}:{row['id']}"
+
+
+def decode_cursor(cursor):
+    created_at, item_id = cursor.rsplit(':', 1)
+    return float(created_at), int(item_id)
+
+
+class ContentLibrary(SQLiteStore):
+    """Generated modules, explanations and examples, per user and topic"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        content_key TEXT NOT NULL,
+        saved INTEGER NOT NULL DEFAULT 0,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS items_user_content ON items (user_id, kind, content_key);
+    CREATE INDEX IF NOT EXISTS items_user_created ON items (user_id, kind, saved, created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS items_user_topic ON items (user_id, kind, topic, created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS items_content ON items (kind, content_key);
+    CREATE INDEX IF NOT EXISTS items_topic ON items (kind, topic, created_at DESC);
+    """
+
+    def __init__(self, path=LIBRARY_PATH):
+        super().__init__(path)
+
+    @staticmethod
+    def _row_to_item(row):
+        return {
+            "id": row['id'],
+            "kind": row['kind'],
+            "topic": row['topic'],
+            "saved": bool(row['saved']),
+            "createdAt": row['created_at'],
+            **json.loads(row['payload']),
+        }
+
+    def save(self, user_id, kind, topic, payload, key=None, saved=False):
+        """Insert or refresh an item; returns its id"""
+        if kind not in LIBRARY_KINDS:
+            raise ValueError(f"Unknown library kind: {kind}")
+        key = key or item_key(kind, topic, payload)
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO items (user_id, kind, topic, content_key, saved, payload, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (user_id, kind, content_key) DO UPDATE SET '
+                'payload = excluded.payload, saved = MAX(items.saved, excluded.saved)',
+                (user_id, kind, topic, key, int(saved), json.dumps(payload), time.time())
+            )
+            row = conn.execute(
+                'SELECT id FROM items WHERE user_id = ? AND kind = ? AND content_key = ?',
+                (user_id, kind, key)
+            ).fetchone()
+        return row['id']
+
+    def record(self, user_id, kind, topic, payload, key):
+        """Persist a generation without failing the request that produced it"""
+        if not user_id:
+            return None
+        try:
+            return self.save(user_id, kind, topic, payload, key=key)
+        except Exception as e:
+            logger.error(f"Library write failed: {str(e)}")
+            return None
+
+    def find(self, kind, key, user_id=None, on_shared=None):
+        """Most recent payload generated from the same inputs, by this user first.
+
+        Content found under another user is recorded for this user as well, so
+        it shows up in their library; on_shared(payload, topic) is then called
+        for whatever else the caller keeps per user (search, review).
+        """
+        try:
+            row = None
+            if user_id:
+                row = self.execute(
+                    'SELECT payload FROM items WHERE user_id = ? AND kind = ? AND content_key = ?',
+                    (user_id, kind, key)
+                ).fetchone()
+            if row is not None:
+                return json.loads(row['payload'])
+            row = self.execute(
+                'SELECT topic, payload FROM items WHERE kind = ? AND content_key = ? LIMIT 1',
+                (kind, key)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Library lookup failed: {str(e)}")
+            return None
+        if row is None:
+            return None
+        payload = json.loads(row['payload'])
+        if user_id and self.record(user_id, kind, row['topic'], payload, key) is not None and on_shared is not None:
+            try:
+                on_shared(payload, row['topic'])
+            except Exception as e:
+                logger.error(f"Recording shared {kind} failed: {str(e)}")
+        return payload
+
+    def find_latest(self, kind, topic):
+        """Newest payload of a kind for the same topic, from any inputs or user"""
+        try:
+            row = self.execute(
+                'SELECT payload FROM items WHERE kind = ? AND topic = ? ORDER BY created_at DESC LIMIT 1',
+                (kind, topic)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Library lookup failed: {str(e)}")
+            return None
+        return None if row is None else json.loads(row['payload'])
+
+    def list(self, user_id, kind, topic=None, saved_only=False, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """Newest-first page of items and the cursor for the next page"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses = ['user_id = ?', 'kind = ?']
+        params = [user_id, kind]
+        if topic:
+            clauses.append('topic = ?')
+            params.append(topic)
+        if saved_only:
+            clauses.append('saved = 1')
+        if cursor:
+            created_at, item_id = decode_cursor(cursor)
+            clauses.append('(created_at < ? OR (created_at = ? AND id < ?))')
+            params.extend([created_at, created_at, item_id])
+        rows = self.execute(
+            f"SELECT * FROM items WHERE {' AND '.join(clauses)} "
+            'ORDER BY created_at DESC, id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return [self._row_to_item(row) for row in rows[:limit]], next_cursor
+
+    def get(self, user_id, kind, item_id):
+        row = self.execute(
+            'SELECT * FROM items WHERE id = ? AND user_id = ? AND kind = ?', (item_id, user_id, kind)
+        ).fetchone()
+        return None if row is None else self._row_to_item(row)
+
+    def set_saved(self, user_id, kind, item_id, saved):
+        cursor = self.write(
+            'UPDATE items SET saved = ? WHERE id = ? AND user_id = ? AND kind = ?',
+            (int(saved), item_id, user_id, kind)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, user_id, kind, item_id):
+        cursor = self.write('DELETE FROM items WHERE id = ? AND user_id = ? AND kind = ?', (item_id, user_id, kind))
+        return cursor.rowcount > 0
+
+    def topics(self, user_id, kind, saved_only=False):
+        rows = self.execute(
+            'SELECT topic, COUNT(*) AS count, MAX(created_at) AS latest FROM items '
+            'WHERE user_id = ? AND kind = ?' + (' AND saved = 1' if saved_only else '') +
+            ' GROUP BY topic ORDER BY latest DESC',
+            (user_id, kind)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def export(self, user_id):
+        """Every item of a user, oldest first, without loading them all at once"""
+        cursor = self.execute('SELECT * FROM items WHERE user_id = ? ORDER BY created_at, id', (user_id,))
+        for row in cursor:
+            yield self._row_to_item(row)
+
+
+library = ContentLibrary()
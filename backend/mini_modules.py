@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from library import content_key
+from storage import SQLiteStore, data_path
+from utils import extract_json_object, parse_markdown_content
+
+logger = logging.getLogger(__name__)
+
+MINI_MODULE_PATH = os.getenv('MINI_MODULE_PATH') or data_path('mini_modules.db')
+# Start every card's mini module as soon as the cards are shown
+MINI_MODULE_PREGENERATE = os.getenv('MINI_MODULE_PREGENERATE', '1') == '1'
+# Bump when the mini module prompt changes so stored modules are regenerated
+MINI_MODULE_PROMPT_VERSION = '1'
+# Stored modules older than this are regenerated (served meanwhile)
+MINI_MODULE_TTL = float(os.getenv('MINI_MODULE_TTL', str(7 * 86400)))
+
+MINI_MODULE_SECTIONS = (
+    ('description', 'Description'),
+    ('fundamentals', 'Fundamentals'),
+    ('summary', 'Summary'),
+)
+# "## Fundamentals", "2. **Fundamental truths**", "**Summary:**" and the like
+SECTION_HEADING = re.compile(r'^\s*(?:#{1,6}\s*|\d+\.\s*)?\**\s*(?P<title>[A-Za-z][^\n*:#]*?)\s*\**:?\**\s*$',
+                             re.MULTILINE)
+HEADING_FIELDS = (('fundamental', 'fundamentals'), ('first principle', 'fundamentals'),
+                  ('summary', 'summary'), ('description', 'description'), ('concept', 'description'))
+
+
+def card_module_id(topic, card):
+    """Id of the mini module for a card, stable for the same card content"""
+    return content_key(MINI_MODULE_PROMPT_VERSION, topic, card.get('title', ''), card.get('description', ''))
+
+
+def _heading_field(title):
+    title = title.lower()
+    for needle, field in HEADING_FIELDS:
+        if needle in title:
+            return field
+    return None
+
+
+def parse_mini_module(text):
+    """{description, fundamentals, summary} markdown from a JSON or headed markdown response"""
+    try:
+        parsed = extract_json_object(text)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict) and any(parsed.get(field) for field, _ in MINI_MODULE_SECTIONS):
+        sections = {}
+        for field, _ in MINI_MODULE_SECTIONS:
+            value = parsed.get(field) or ''
+            if isinstance(value, list):
+                value = '\n'.join(f"- {item}" for item in value)
+            sections[field] = parse_markdown_content(str(value))
+        return sections
+
+    # Markdown: split on the section headings rather than on blank lines
+    sections = {field: '' for field, _ in MINI_MODULE_SECTIONS}
+    headings = [(match, _heading_field(match.group('title'))) for match in SECTION_HEADING.finditer(text)]
+    headings = [(match, field) for match, field in headings if field]
+    if not headings:
+        sections['description'] = parse_markdown_content(text)
+        return sections
+    preamble = text[:headings[0][0].start()].strip()
+    for i, (match, field) in enumerate(headings):
+        end = headings[i + 1][0].start() if i + 1 < len(headings) else len(text)
+        body = text[match.end():end].strip()
+        sections[field] = parse_markdown_content('\n\n'.join(part for part in (sections[field], body) if part))
+    if preamble and not sections['description']:
+        sections['description'] = parse_markdown_content(preamble)
+    return sections
+
+
+class MiniModuleStore(SQLiteStore):
+    """Mini modules per learning card, generated in the background before they are opened"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS mini_modules (
+        module_id TEXT PRIMARY KEY,
+        topic TEXT NOT NULL,
+        card TEXT NOT NULL,
+        status TEXT NOT NULL,
+        payload TEXT,
+        error TEXT,
+        updated_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path=MINI_MODULE_PATH, ttl=MINI_MODULE_TTL):
+        super().__init__(path)
+        self.ttl = ttl
+        # module_id -> future of the generation in flight
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def get(self, module_id):
+        row = self.execute('SELECT * FROM mini_modules WHERE module_id = ?', (module_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "moduleId": row['module_id'],
+            "topic": row['topic'],
+            "card": json.loads(row['card']),
+            "status": row['status'],
+            "content": json.loads(row['payload']) if row['payload'] else None,
+            "error": row['error'],
+            "updatedAt": row['updated_at'],
+        }
+
+    def fresh(self, stored):
+        """True for a generated module younger than the TTL"""
+        return stored is not None and stored['status'] == 'done' and time.time() - stored['updatedAt'] < self.ttl
+
+    def _set(self, module_id, topic, card, status, payload=None, error=None):
+        self.write(
+            'INSERT INTO mini_modules (module_id, topic, card, status, payload, error, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (module_id) DO UPDATE SET status = excluded.status, '
+            'payload = excluded.payload, error = excluded.error, updated_at = excluded.updated_at',
+            (module_id, topic, json.dumps(card), status, json.dumps(payload) if payload is not None else None,
+             error, time.time())
+        )
+
+    def future(self, module_id):
+        with self.lock:
+            return self.inflight.get(module_id)
+
+    def start(self, topic, card, generate, submit):
+        """Generate a card's mini module unless it is fresh or already generating; returns its id"""
+        module_id = card_module_id(topic, card)
+        with self.lock:
+            if module_id in self.inflight:
+                return module_id
+            stored = self.get(module_id)
+            if self.fresh(stored):
+                return module_id
+            if stored is None or stored['status'] != 'done':
+                # A stale module stays readable until its replacement is done
+                self._set(module_id, topic, card, 'pending')
+            self.inflight[module_id] = submit(self._generate, module_id, topic, card, generate)
+        return module_id
+
+    def _generate(self, module_id, topic, card, generate):
+        try:
+            content = generate(topic, card)
+            self._set(module_id, topic, card, 'done', payload=content)
+            return content
+        except Exception as e:
+            logger.error(f"Mini module {module_id} failed: {str(e)}")
+            stored = self.get(module_id)
+            if stored is None or stored['status'] != 'done':
+                self._set(module_id, topic, card, 'failed', error=str(e))
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(module_id, None)
+
+
+mini_modules = MiniModuleStore()
@@ -0,0 +1,99 @@
+"""Deterministic model responses shaped like what each endpoint expects.
+
+Used by the offline provider (LLM_OFFLINE=1) and by stub_upstream.py, which
+serves them over HTTP in place of the Anthropic and Perplexity APIs.
+"""
+import itertools
+import json
+import re
+
+_ids = itertools.count(1)
+
+
+def prompt_text(body):
+    """Concatenate the user message text of a Messages API request"""
+    parts = []
+    for message in body.get('messages', []):
+        content = message.get('content', '')
+        if isinstance(content, list):
+            content = ' '.join(block.get('text', '') for block in content if isinstance(block, dict))
+        parts.append(str(content))
+    return '\n'.join(parts)
+
+
+def topic_of(prompt):
+    match = re.search(r'\b(?:for|about|of) ([^.\n]+?) at (?:an? )?\w+ level', prompt)
+    return match.group(1).strip() if match else 'the topic'
+
+
+def fake_completion(prompt):
+    """Deterministic response text shaped like what each endpoint expects"""
+    topic = topic_of(prompt)
+    if 'learning cards' in prompt:
+        cards = [
+            {"id": i, "title": f"{topic} milestone {i}",
+             "description": f"How a breakthrough in {topic} changed the field, part {i}.", "type": kind}
+            for i, kind in enumerate(['success-story', 'achievement', 'theory'], start=1)
+        ]
+        return json.dumps({"cards": cards})
+    if 'learning goals' in prompt or 'numbered goals' in prompt:
+        return '\n'.join([
+            f"1. Explain the core vocabulary and ideas behind {topic}",
+            f"2. Apply {topic} fundamentals to solve a small practical problem",
+            f"3. Build and present a complete project that uses {topic}",
+        ])
+    if 'mini learning module' in prompt:
+        return json.dumps({
+            "description": f"{topic.capitalize()} explained in a few dense sentences.",
+            "fundamentals": [f"{topic.capitalize()} rests on a first principle", "It composes with related ideas"],
+            "summary": f"{topic.capitalize()} in one line.",
+        })
+    if 'comprehension questions' in prompt and '<section id=' in prompt:
+        return json.dumps({section: [
+            f"How would you practice {section}?",
+            f"What theory underpins {section}?",
+            f"Where did {section} originate?",
+        ] for section in re.findall(r'<section id="([^"]+)">', prompt)})
+    if 'comprehension questions' in prompt:
+        return json.dumps({"questions": [
+            f"How would you practice {topic}?",
+            f"What theory underpins {topic}?",
+            f"Where did {topic} originate?",
+        ]})
+    if 'roadmap' in prompt:
+        sections = re.findall(r'^\s*- ([A-Z][^\n]+)$', prompt, re.MULTILINE) or ['Fundamentals', 'Core Concepts']
+        return '\n\n'.join(
+            f"## {section}\n- Learn the key ideas of {section.lower()}\n- Practice with exercises\n- Time: 1 week"
+            for section in sections
+        )
+    return f"{topic.capitalize()} in brief: a concise explanation that covers the essential idea."
+
+
+def malform(text):
+    """Break JSON-looking output the way models do: single quotes and a trailing comma"""
+    if text.lstrip().startswith('{'):
+        return text.replace('"', "'").rstrip('}') + ',}'
+    return text
+
+
+def fake_message(body, malformed=False):
+    text = fake_completion(prompt_text(body))
+    if malformed:
+        text = malform(text)
+    output_tokens = max(1, len(text) // 4)
+    max_tokens = int(body.get('max_tokens') or output_tokens)
+    stop_reason = 'end_turn'
+    if output_tokens > max_tokens:
+        text = text[:max_tokens * 4]
+        output_tokens = max_tokens
+        stop_reason = 'max_tokens'
+    return {
+        "id": f"msg_stub_{next(_ids)}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get('model', 'stub'),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": max(1, len(prompt_text(body)) // 4), "output_tokens": output_tokens},
+    }
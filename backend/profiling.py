@@ -0,0 +1,210 @@
+"""On-demand stack sampling, attributed to routes, as flamegraph-ready collapsed stacks.
+
+Nothing runs until an admin starts a profile, so the cost when off is one
+attribute check per request. While a profile runs, a background thread reads
+every thread's Python stack each PROFILE_INTERVAL_MS. Threads are attributed to
+the route whose request they are working for (request threads and the
+executor threads bound with tracing.bind), and idle threads are skipped.
+
+Two modes:
+    window - every sample for `seconds`
+    slow   - only the samples of requests that end up slower than slow_ms
+
+Output per route is the collapsed format flamegraph.pl and speedscope read:
+    POST generate_module_content;app.py:generate_module_content;utils.py:parse_markdown_content 12
+"""
+from collections import Counter, defaultdict
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '300'))
+# Sampling less often than this would leave too few samples to rank stacks
+PROFILE_MAX_INTERVAL_MS = float(os.getenv('PROFILE_MAX_INTERVAL_MS', '1000'))
+# Thread entry frames left off the root of every stack
+THREAD_ENTRY_FILES = ('threading.py', 'concurrent/futures/thread.py')
+MAX_STACK_DEPTH = 64
+
+
+STDLIB = sysconfig.get_paths()['stdlib'] + os.sep
+
+
+def frame_file(path):
+    """'flask/app.py' for packages and the standard library, 'app.py' for the backend's own modules"""
+    _, marker, rest = path.rpartition('site-packages' + os.sep)
+    if marker:
+        return rest
+    if path.startswith(STDLIB):
+        return path[len(STDLIB):]
+    return os.path.basename(path)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{frame_file(code.co_filename)}:{code.co_name}"
+
+
+def collapse(frame):
+    """Root-first 'file:function' frames of a stack, joined with ';'"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    start = 0
+    while start < len(names) - 1 and names[start].split(':', 1)[0] in THREAD_ENTRY_FILES:
+        start += 1
+    return ';'.join(names[start:])
+
+
+class ProfileAlreadyRunning(Exception):
+    pass
+
+
+class Profile:
+    """Collapsed stack counts per route from one profiling run"""
+
+    def __init__(self, mode, seconds, interval_ms, slow_ms=None):
+        self.mode = mode
+        self.seconds = seconds
+        self.interval_ms = interval_ms
+        self.slow_ms = slow_ms
+        self.started_at = time.time()
+        self.ends_at = time.monotonic() + seconds
+        self.finished_at = None
+        self.samples = 0
+        self.requests_kept = 0
+        self.requests_dropped = 0
+        self.stacks = defaultdict(Counter)
+        # trace id -> Counter of (route, stack), held until the request's duration is known
+        self.pending = defaultdict(Counter)
+
+    def add(self, route, trace_id, stack):
+        self.samples += 1
+        if self.mode == 'slow':
+            self.pending[trace_id][(route, stack)] += 1
+        else:
+            self.stacks[route][stack] += 1
+
+    def request_finished(self, trace_id, duration_ms):
+        samples = self.pending.pop(trace_id, None)
+        if samples is None:
+            return
+        if duration_ms < self.slow_ms:
+            self.requests_dropped += 1
+            return
+        self.requests_kept += 1
+        for (route, stack), count in samples.items():
+            self.stacks[route][stack] += count
+
+    def summary(self, top=10):
+        return {
+            "mode": self.mode,
+            "seconds": self.seconds,
+            "intervalMs": self.interval_ms,
+            "slowMs": self.slow_ms,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "samples": self.samples,
+            "slowRequests": self.requests_kept,
+            "fastRequests": self.requests_dropped,
+            "routes": {
+                route: {
+                    "samples": sum(counts.values()),
+                    "top": [{"stack": stack, "samples": count} for stack, count in counts.most_common(top)],
+                }
+                for route, counts in self.stacks.items()
+            },
+        }
+
+    def collapsed(self, route=None):
+        """Collapsed stacks, each prefixed with its route as the root frame"""
+        lines = []
+        for name, counts in sorted(self.stacks.items()):
+            if route and name != route:
+                continue
+            lines.extend(f"{name};{stack} {count}" for stack, count in counts.most_common())
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+
+class StackSampler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profile = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, interval_ms=PROFILE_INTERVAL_MS, slow_ms=None):
+        seconds = max(1.0, min(float(seconds), PROFILE_MAX_SECONDS))
+        interval_ms = max(1.0, min(float(interval_ms), PROFILE_MAX_INTERVAL_MS))
+        with self.lock:
+            if self.running:
+                raise ProfileAlreadyRunning('A profile is already running')
+            self.profile = Profile('slow' if slow_ms else 'window', seconds, interval_ms,
+                                   float(slow_ms) if slow_ms else None)
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, args=(self.profile,), name='stack-sampler',
+                                           daemon=True)
+            self.thread.start()
+        logger.info(f"Profiling started: {self.profile.mode} for {seconds:.0f}s every {interval_ms:.0f}ms"
+                    f"{f', slowMs={slow_ms}' if slow_ms else ''}")
+        return self.profile
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _run(self, profile):
+        own = threading.get_ident()
+        interval = profile.interval_ms / 1000
+        try:
+            while not self.stop_event.is_set() and time.monotonic() < profile.ends_at:
+                active = dict(tracing.active_threads)
+                frames = sys._current_frames()
+                with self.lock:
+                    for ident, frame in frames.items():
+                        label = active.get(ident)
+                        if ident == own or label is None:
+                            continue
+                        route, trace_id = label
+                        profile.add(route, trace_id, collapse(frame))
+                del frames
+                self.stop_event.wait(interval)
+        finally:
+            profile.finished_at = time.time()
+            with self.lock:
+                profile.pending.clear()
+
+    def request_finished(self, trace_id, duration_ms):
+        """Keep or drop a request's samples in slow mode; free when no profile runs"""
+        profile = self.profile
+        if profile is None or profile.mode != 'slow' or profile.finished_at is not None:
+            return
+        with self.lock:
+            profile.request_finished(trace_id, duration_ms)
+
+    def status(self, top=10):
+        with self.lock:
+            if self.profile is None:
+                return {"running": False}
+            return {"running": self.running, **self.profile.summary(top)}
+
+    def collapsed(self, route=None):
+        with self.lock:
+            return self.profile.collapsed(route) if self.profile is not None else ''
+
+
+sampler = StackSampler()
@@ -0,0 +1,576 @@
+"""One interface over every LLM backend the app can talk to.
+
+Requests are Messages-API shaped dicts (model, system, messages, max_tokens,
+stop_sequences, temperature, top_p, timeout) plus an optional `extra` dict of
+body fields keyed by provider name, e.g. {"perplexity": {"return_images": False}}. Each provider maps them onto its own API and
+returns a Completion. The router picks providers per endpoint and fails over
+when one errors or gets slow:
+
+    LLM_ROUTES='{"explain_sentence": ["anthropic", "openai"], "*": ["anthropic", "offline"]}'
+    LLM_ROUTING=fastest      # or "ordered" (default): first healthy provider in the list
+    LLM_OFFLINE=1            # serve every endpoint from the deterministic offline provider
+
+Anthropic, Perplexity and OpenAI calls are spread over every key in
+ANTHROPIC_API_KEYS / PERPLEXITY_API_KEYS / OPENAI_API_KEYS (see key_pool).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+import time
+
+import anthropic
+import openai
+
+from key_pool import KeyPool, keys_from_env, retry_delay, retryable
+import offline_responses
+from quotas import ledger as quota_ledger
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Endpoints not listed use the "*" route
+DEFAULT_ROUTES = {
+    "generate_examples": ["perplexity"],
+    "*": ["anthropic"],
+}
+LLM_ROUTING = os.getenv('LLM_ROUTING', 'ordered')
+LLM_OFFLINE = os.getenv('LLM_OFFLINE', '0') == '1'
+# A provider whose smoothed latency is above this is only used when nothing faster is healthy
+LLM_FAILOVER_LATENCY = float(os.getenv('LLM_FAILOVER_LATENCY', '20'))
+# How long a provider is skipped after a failed call
+LLM_ERROR_COOLDOWN = float(os.getenv('LLM_ERROR_COOLDOWN', '30'))
+LATENCY_SMOOTHING = 0.2
+BATCH_POLL_INTERVAL = 30
+
+# Claude model ids the app asks for, mapped to each provider's equivalent
+PERPLEXITY_MODELS = {"default": os.getenv('PERPLEXITY_MODEL', 'llama-3.1-sonar-large-128k-online')}
+OPENAI_MODELS = {
+    "claude-3-haiku-20240307": os.getenv('OPENAI_FAST_MODEL', 'gpt-4o-mini'),
+    "default": os.getenv('OPENAI_MODEL', 'gpt-4o'),
+}
+LOCAL_MODELS = {"default": os.getenv('LOCAL_LLM_MODEL', 'local')}
+# Providers whose keys come from NAME_API_KEYS / NAME_API_KEY and can be changed at runtime
+KEYED_PROVIDERS = ('anthropic', 'perplexity', 'openai')
+
+# Normalised stop reasons
+STOP_END = 'end_turn'
+STOP_MAX_TOKENS = 'max_tokens'
+# Usage estimate for streams that report none
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(chars):
+    return max(1, chars // CHARS_PER_TOKEN)
+
+
+def prompt_chars(request):
+    """Characters of the system prompt and messages of a request"""
+    total = len(request.get('system') or '')
+    for message in request.get('messages', []):
+        content = message.get('content', '')
+        if isinstance(content, list):
+            content = ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+        total += len(str(content))
+    return total
+
+
+def load_routes():
+    routes = dict(DEFAULT_ROUTES)
+    configured = os.getenv('LLM_ROUTES')
+    if configured:
+        try:
+            routes.update(json.loads(configured))
+        except ValueError as e:
+            logger.error(f"Ignoring invalid LLM_ROUTES: {str(e)}")
+    return routes
+
+
+class Completion:
+    """Provider-independent result of one generation"""
+
+    def __init__(self, text, provider, model, input_tokens=0, output_tokens=0, stop_reason=STOP_END, raw=None):
+        self.text = text
+        self.provider = provider
+        self.model = model
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.stop_reason = stop_reason
+        self.raw = raw
+
+    @property
+    def truncated(self):
+        return self.stop_reason == STOP_MAX_TOKENS
+
+    def __str__(self):
+        return self.text
+
+
+class ProviderStats:
+    """Call counts, token usage and smoothed latency of one provider"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.inflight = 0
+        self.latency = None
+        self.cooldown_until = 0.0
+        self.last_error = None
+
+    def started(self):
+        with self.lock:
+            self.inflight += 1
+
+    def succeeded(self, seconds, completion):
+        with self.lock:
+            self.inflight -= 1
+            self.calls += 1
+            self.input_tokens += completion.input_tokens
+            self.output_tokens += completion.output_tokens
+            self._observe(seconds)
+
+    def failed(self, seconds, error):
+        with self.lock:
+            self.inflight -= 1
+            self.calls += 1
+            self.errors += 1
+            self.last_error = str(error)[:200]
+            self.cooldown_until = time.time() + LLM_ERROR_COOLDOWN
+            self._observe(seconds)
+
+    def abandoned(self):
+        """A call cancelled by the caller; it counts neither as success nor failure"""
+        with self.lock:
+            self.inflight -= 1
+
+    def _observe(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def healthy(self):
+        return time.time() >= self.cooldown_until
+
+    def slow(self):
+        return self.latency is not None and self.latency > LLM_FAILOVER_LATENCY
+
+    def load_score(self):
+        """Expected wait: smoothed latency scaled by the calls already in flight"""
+        return (self.latency or 0.0) * (1 + self.inflight)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "inflight": self.inflight,
+                "latency_s": None if self.latency is None else round(self.latency, 3),
+                "healthy": self.healthy(),
+                "last_error": self.last_error,
+            }
+
+
+class LLMProvider:
+    """Base adapter: subclasses implement generate(), and optionally stream() and batch()"""
+
+    def __init__(self, name, models=None):
+        self.name = name
+        self.models = models or {}
+        self.stats = ProviderStats()
+
+    def model_for(self, requested):
+        return self.models.get(requested) or self.models.get('default') or requested
+
+    def generate(self, request):
+        raise NotImplementedError
+
+    def stream(self, request):
+        """Yield text deltas; providers without streaming yield the whole text once"""
+        yield self.generate(request).text
+
+    def stream_complete(self, request, on_first_token=None, cancelled=None, on_text=None):
+        """Stream a completion, calling on_first_token once and on_text per delta; None if cancelled midway"""
+        parts = []
+        stream = self.stream(request)
+        try:
+            for text in stream:
+                if not parts and on_first_token is not None:
+                    on_first_token()
+                parts.append(text)
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                if on_text is not None:
+                    on_text(text)
+        finally:
+            stream.close()
+        text = ''.join(parts)
+        # No usage on the stream; estimate from the length of the prompt and the text
+        return Completion(text, self.name, self.model_for(request.get('model')),
+                          input_tokens=estimate_tokens(prompt_chars(request)),
+                          output_tokens=estimate_tokens(len(text)))
+
+    def batch(self, requests):
+        """{custom_id: request} -> {custom_id: Completion}; failed requests are left out"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {custom_id: executor.submit(self.complete, request) for custom_id, request in requests.items()}
+            for custom_id, future in futures.items():
+                try:
+                    results[custom_id] = future.result()
+                except Exception as e:
+                    logger.error(f"Batch request {custom_id} failed on {self.name}: {str(e)}")
+        return results
+
+    def complete(self, request):
+        """generate() with usage, latency accounting and an upstream span"""
+        with tracing.span('llm.upstream', provider=self.name, model=self.model_for(request.get('model'))) as span:
+            self.stats.started()
+            start = time.monotonic()
+            try:
+                completion = self.generate(request)
+            except Exception as e:
+                self.stats.failed(time.monotonic() - start, e)
+                raise
+            self.stats.succeeded(time.monotonic() - start, completion)
+            quota_ledger.charge(completion.input_tokens + completion.output_tokens)
+            span.set(input_tokens=completion.input_tokens, output_tokens=completion.output_tokens,
+                     stop_reason=completion.stop_reason)
+            return completion
+
+    def complete_streaming(self, request, on_first_token=None, cancelled=None, on_text=None):
+        """stream_complete() with the same accounting as complete()"""
+        with tracing.span('llm.upstream', provider=self.name, model=self.model_for(request.get('model')),
+                          streaming=True) as span:
+            start = time.monotonic()
+            started = []
+
+            def first_token():
+                started.append(True)
+                span.add_event('first_token')
+                if on_first_token is not None:
+                    on_first_token()
+
+            self.stats.started()
+            pool = getattr(self, 'pool', None)
+            attempts = pool.attempts() if pool is not None else 1
+            while True:
+                try:
+                    completion = self.stream_complete(request, first_token, cancelled, on_text)
+                    break
+                except Exception as e:
+                    attempts -= 1
+                    # Retried like KeyPool.call, but only until text has been passed on
+                    if started or attempts <= 0 or not retryable(e):
+                        self.stats.failed(time.monotonic() - start, e)
+                        raise
+                    logger.warning(f"{self.name} stream failed before its first token ({str(e)}), trying again")
+                    tracing.add_event('retry', pool=self.name, status=getattr(e, 'status_code', None))
+                    time.sleep(retry_delay(e))
+            if completion is None:
+                self.stats.abandoned()
+                span.set(cancelled=True)
+            else:
+                self.stats.succeeded(time.monotonic() - start, completion)
+                quota_ledger.charge(completion.input_tokens + completion.output_tokens)
+                span.set(input_tokens=completion.input_tokens, output_tokens=completion.output_tokens,
+                         stop_reason=completion.stop_reason)
+            return completion
+
+    def usage(self):
+        usage = self.stats.snapshot()
+        pool = getattr(self, 'pool', None)
+        if pool is not None:
+            usage['keys'] = pool.snapshot()
+        return usage
+
+
+class AnthropicProvider(LLMProvider):
+    PARAMS = ('model', 'system', 'messages', 'max_tokens', 'stop_sequences', 'temperature', 'top_p', 'timeout')
+
+    def __init__(self, api_keys, base_url=None, name='anthropic'):
+        super().__init__(name)
+        self.pool = KeyPool(name, api_keys, lambda key: anthropic.Anthropic(
+            api_key=key, base_url=base_url, max_retries=0))
+
+    def _params(self, request):
+        params = {key: request[key] for key in self.PARAMS if request.get(key) is not None}
+        params['model'] = self.model_for(params['model'])
+        params.update((request.get('extra') or {}).get(self.name) or {})
+        return params
+
+    def _completion(self, message):
+        text = ''.join(block.text for block in message.content if getattr(block, 'type', None) == 'text')
+        usage = getattr(message, 'usage', None)
+        return Completion(
+            text, self.name, message.model,
+            input_tokens=getattr(usage, 'input_tokens', 0) or 0,
+            output_tokens=getattr(usage, 'output_tokens', 0) or 0,
+            stop_reason=message.stop_reason or STOP_END,
+            raw=message,
+        )
+
+    def generate(self, request):
+        params = self._params(request)
+        return self._completion(self.pool.call(lambda client: client.messages.create(**params)))
+
+    def stream(self, request):
+        with self.pool.lease() as client, client.messages.stream(**self._params(request)) as stream:
+            for text in stream.text_stream:
+                yield text
+
+    def stream_complete(self, request, on_first_token=None, cancelled=None, on_text=None):
+        with self.pool.lease() as client, client.messages.stream(**self._params(request)) as stream:
+            first = True
+            for text in stream.text_stream:
+                if first and on_first_token is not None:
+                    on_first_token()
+                first = False
+                if cancelled is not None and cancelled.is_set():
+                    # Leaving the block closes the connection, which stops generation
+                    return None
+                if on_text is not None:
+                    on_text(text)
+            return self._completion(stream.get_final_message())
+
+    def batch(self, requests):
+        """Message Batches API: half price, results within 24h"""
+        params = {custom_id: self._params(request) for custom_id, request in requests.items()}
+        for request_params in params.values():
+            request_params.pop('timeout', None)
+        # A batch belongs to the key that created it, so that key's client polls it to the end
+        with self.pool.lease() as client:
+            batches = client.messages.batches
+            batch = batches.create(requests=[
+                {"custom_id": custom_id, "params": request_params} for custom_id, request_params in params.items()
+            ])
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+        while batch.processing_status != 'ended':
+            time.sleep(BATCH_POLL_INTERVAL)
+            batch = batches.retrieve(batch.id)
+        results = {}
+        for entry in batches.results(batch.id):
+            if entry.result.type == 'succeeded':
+                results[entry.custom_id] = self._completion(entry.result.message)
+            else:
+                logger.error(f"Batch request {entry.custom_id} {entry.result.type}")
+        return results
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any /chat/completions endpoint: OpenAI, Perplexity, or a local server (vLLM, llama.cpp, Ollama)"""
+
+    def __init__(self, name, api_keys, base_url=None, models=None):
+        super().__init__(name, models)
+        self.pool = KeyPool(name, api_keys, lambda key: openai.OpenAI(
+            api_key=key, base_url=base_url, max_retries=0))
+
+    def _params(self, request):
+        messages = list(request.get('messages', []))
+        if request.get('system'):
+            messages.insert(0, {"role": "system", "content": request['system']})
+        params = {
+            "model": self.model_for(request.get('model')),
+            "messages": messages,
+            "max_tokens": request.get('max_tokens'),
+            "temperature": request.get('temperature'),
+            "top_p": request.get('top_p'),
+            "timeout": request.get('timeout'),
+        }
+        if request.get('stop_sequences'):
+            # The chat completions API accepts at most four stop strings
+            params['stop'] = request['stop_sequences'][:4]
+        extra = (request.get('extra') or {}).get(self.name)
+        if extra:
+            params['extra_body'] = extra
+        return {key: value for key, value in params.items() if value is not None}
+
+    def generate(self, request):
+        params = self._params(request)
+        response = self.pool.call(lambda client: client.chat.completions.create(**params))
+        choice = response.choices[0]
+        usage = response.usage
+        return Completion(
+            choice.message.content or '', self.name, response.model,
+            input_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            output_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+            stop_reason=STOP_MAX_TOKENS if choice.finish_reason == 'length' else STOP_END,
+            # Keeps provider extras such as Perplexity's citations
+            raw=response.model_dump(),
+        )
+
+    def stream(self, request):
+        with self.pool.lease() as client:
+            for chunk in client.chat.completions.create(stream=True, **self._params(request)):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    def stream_complete(self, request, on_first_token=None, cancelled=None, on_text=None):
+        parts, usage, finish_reason = [], None, None
+        with self.pool.lease() as client:
+            # The final chunk carries the usage of the whole stream, with no choices
+            stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True},
+                                                    **self._params(request))
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, 'usage', None) or usage
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    text = chunk.choices[0].delta.content
+                    if not text:
+                        continue
+                    if not parts and on_first_token is not None:
+                        on_first_token()
+                    parts.append(text)
+                    if cancelled is not None and cancelled.is_set():
+                        return None
+                    if on_text is not None:
+                        on_text(text)
+            finally:
+                stream.close()
+        text = ''.join(parts)
+        if usage is None:
+            # A server that ignores stream_options
+            logger.debug(f"{self.name} stream reported no usage; estimating it")
+            input_tokens, output_tokens = estimate_tokens(prompt_chars(request)), estimate_tokens(len(text))
+        else:
+            input_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+            output_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        return Completion(
+            text, self.name, self.model_for(request.get('model')),
+            input_tokens=input_tokens, output_tokens=output_tokens,
+            stop_reason=STOP_MAX_TOKENS if finish_reason == 'length' else STOP_END,
+        )
+
+
+class OfflineProvider(LLMProvider):
+    """Deterministic local responses shaped like each endpoint's output; no network"""
+
+    def __init__(self, name='offline'):
+        super().__init__(name)
+
+    def generate(self, request):
+        message = offline_responses.fake_message({
+            "model": request.get('model', 'offline'),
+            "max_tokens": request.get('max_tokens'),
+            "messages": request.get('messages', []),
+        })
+        return Completion(
+            message['content'][0]['text'], self.name, message['model'],
+            input_tokens=message['usage']['input_tokens'],
+            output_tokens=message['usage']['output_tokens'],
+            stop_reason=message['stop_reason'],
+            raw=message,
+        )
+
+
+class ProviderRouter:
+    """Per-endpoint provider lists with health- and latency-aware ordering"""
+
+    def __init__(self, providers=(), routes=None, policy=LLM_ROUTING):
+        self.providers = {provider.name: provider for provider in providers}
+        self.routes = routes or dict(DEFAULT_ROUTES)
+        self.policy = policy
+
+    def register(self, provider):
+        self.providers[provider.name] = provider
+
+    def candidates(self, endpoint):
+        names = self.routes.get(endpoint) or self.routes.get('*') or []
+        providers = [self.providers[name] for name in names if name in self.providers]
+        if not providers:
+            raise RuntimeError(f"No LLM provider configured for {endpoint}")
+        if self.policy == 'fastest':
+            return sorted(providers, key=lambda p: (not p.stats.healthy(), p.stats.load_score()))
+        # Configured order, but unhealthy and slow providers go to the back
+        return sorted(providers, key=lambda p: (not p.stats.healthy(), p.stats.slow()))
+
+    def generate(self, endpoint, request, providers=None):
+        """A completion from the first provider that succeeds; providers overrides the endpoint's candidates"""
+        last_error = None
+        for provider in providers if providers is not None else self.candidates(endpoint):
+            try:
+                return provider.complete(request)
+            except Exception as e:
+                logger.warning(f"{provider.name} failed for {endpoint}: {str(e)}")
+                tracing.add_event('failover', provider=provider.name, error=str(e)[:200])
+                last_error = e
+        raise last_error
+
+    def stream(self, endpoint, request):
+        # Mid-stream failover would duplicate text, so only the first provider streams
+        return self.candidates(endpoint)[0].stream(request)
+
+    def stream_complete(self, endpoint, request, on_text, cancelled=None):
+        """Completion streamed through on_text, failing over only until the first delta is sent"""
+        last_error = None
+        for provider in self.candidates(endpoint):
+            sent = []
+
+            def forward(text):
+                sent.append(True)
+                on_text(text)
+
+            try:
+                return provider.complete_streaming(request, cancelled=cancelled, on_text=forward)
+            except Exception as e:
+                if sent:
+                    raise
+                logger.warning(f"{provider.name} failed for {endpoint}: {str(e)}")
+                last_error = e
+        raise last_error
+
+    def batch(self, endpoint, requests):
+        return self.candidates(endpoint)[0].batch(requests)
+
+    def usage(self):
+        return {
+            "policy": self.policy,
+            "routes": self.routes,
+            "providers": {name: provider.usage() for name, provider in self.providers.items()},
+        }
+
+
+def build_router():
+    """Providers from the environment; offline mode routes everything to the offline provider"""
+    router = ProviderRouter(routes=load_routes())
+    router.register(OfflineProvider())
+    if LLM_OFFLINE:
+        router.routes = {"*": ["offline"]}
+        return router
+    for name in KEYED_PROVIDERS:
+        keys = keys_from_env(name.upper())
+        if keys:
+            router.register(keyed_provider(name, keys))
+    if os.getenv('LOCAL_LLM_BASE_URL'):
+        router.register(OpenAICompatibleProvider(
+            'local', [os.getenv('LOCAL_LLM_API_KEY', 'local')], base_url=os.getenv('LOCAL_LLM_BASE_URL'),
+            models=LOCAL_MODELS))
+    return router
+
+
+def keyed_provider(name, keys):
+    """The provider for one of KEYED_PROVIDERS over the given API keys"""
+    if name == 'anthropic':
+        return AnthropicProvider(keys, base_url=os.getenv('ANTHROPIC_BASE_URL'))
+    if name == 'perplexity':
+        return OpenAICompatibleProvider(
+            'perplexity', keys, base_url=os.getenv('PERPLEXITY_BASE_URL', 'https://api.perplexity.ai'),
+            models=PERPLEXITY_MODELS)
+    return OpenAICompatibleProvider('openai', keys, base_url=os.getenv('OPENAI_BASE_URL'), models=OPENAI_MODELS)
+
+
+def set_provider_keys(router, name, keys):
+    """Swap a provider's API keys at runtime, registering it if it had none"""
+    provider = router.providers.get(name)
+    if provider is None:
+        router.register(keyed_provider(name, keys))
+    else:
+        provider.pool.replace(keys)
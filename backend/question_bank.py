@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from library import content_key
+from storage import SQLiteStore, data_path
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS_PATH = os.getenv('QUESTIONS_PATH') or data_path('questions.db')
+# Generate a module's questions in the background as soon as the module is complete
+QUESTIONS_PREGENERATE = os.getenv('QUESTIONS_PREGENERATE', '0') == '1'
+# Bump when the module questions prompt changes so stored questions are regenerated
+QUESTIONS_PROMPT_VERSION = '1'
+
+
+def module_hash(topic, sections):
+    """Hash of a module's section texts, in section order"""
+    return content_key(QUESTIONS_PROMPT_VERSION, topic, *(text for _, text in sections))
+
+
+def section_hash(text):
+    """Hash of one section's text, so single-section requests can reuse module questions"""
+    return content_key(QUESTIONS_PROMPT_VERSION, text)
+
+
+class QuestionBank(SQLiteStore):
+    """Comprehension questions per module section, generated once per module content"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS module_questions (
+        module_hash TEXT NOT NULL,
+        field TEXT NOT NULL,
+        section_hash TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        questions TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (module_hash, field)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS module_questions_section ON module_questions (section_hash, created_at DESC);
+    """
+
+    def __init__(self, path=QUESTIONS_PATH):
+        super().__init__(path)
+        # module_hash -> future of the generation in flight, so a request and a
+        # background pre-generation for the same module share one upstream call
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def get(self, module_hash):
+        """{field: [questions]} for a module, or None if it has not been generated"""
+        try:
+            rows = self.execute('SELECT field, questions FROM module_questions WHERE module_hash = ?',
+                                (module_hash,)).fetchall()
+        except Exception as e:
+            logger.error(f"Question lookup failed: {str(e)}")
+            return None
+        return {row['field']: json.loads(row['questions']) for row in rows} or None
+
+    def find_section(self, text):
+        """Questions already generated for this exact section text by any module"""
+        try:
+            row = self.execute(
+                'SELECT questions FROM module_questions WHERE section_hash = ? ORDER BY created_at DESC LIMIT 1',
+                (section_hash(text),)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Question lookup failed: {str(e)}")
+            return None
+        return None if row is None else json.loads(row['questions'])
+
+    def put(self, module_hash, topic, sections, questions):
+        now = time.time()
+        texts = dict(sections)
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO module_questions '
+                '(module_hash, field, section_hash, topic, questions, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(module_hash, field, section_hash(texts[field]), topic, json.dumps(items), now)
+                 for field, items in questions.items() if field in texts]
+            )
+
+    def get_or_generate(self, topic, sections, generate, submit):
+        """Stored questions for a module, else a future for the one generation of them.
+
+        sections is [(field, text)]; generate(topic, sections) returns
+        {field: [questions]} and runs through submit(fn, *args) -> future.
+        Returns (module_hash, questions, future): questions when stored,
+        otherwise the future to wait on.
+        """
+        key = module_hash(topic, sections)
+        stored = self.get(key)
+        if stored is not None:
+            return key, stored, None
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = submit(self._generate, key, topic, sections, generate)
+                self.inflight[key] = future
+        return key, None, future
+
+    def _generate(self, key, topic, sections, generate):
+        try:
+            questions = generate(topic, sections)
+            self.put(key, topic, sections, questions)
+            return questions
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+
+question_bank = QuestionBank()
@@ -0,0 +1,275 @@
+"""Per-account token budgets, charged from the usage of every upstream response.
+
+Each request is charged to an account: the learner id the frontend sends
+(X-Gyaan-User), the session for session channel requests, or else the client
+address. Input plus output tokens are counted in fixed windows of
+QUOTA_WINDOW seconds against a budget of QUOTA_TOKENS per window.
+
+Charging takes no lock: every thread adds to its own shard, which only that
+thread writes, and a flusher thread folds the shards' growth into SQLite every
+QUOTA_FLUSH_INTERVAL seconds. The shard of a thread that has exited is
+dropped once its last growth is flushed. Reads add the flushed totals of all workers to
+this worker's unflushed growth, so a budget holds across gunicorn workers to
+within one flush interval.
+
+An account past its budget is degraded rather than refused: stored content is
+served wherever there is some, and new generations use Haiku without hedging.
+"""
+import atexit
+from collections import defaultdict
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+import weakref
+
+from storage import SQLiteStore, data_path
+
+logger = logging.getLogger(__name__)
+
+QUOTAS_ENABLED = os.getenv('QUOTAS_ENABLED', '1') == '1'
+QUOTA_PATH = os.getenv('QUOTA_PATH') or data_path('quotas.db')
+QUOTA_WINDOW = int(os.getenv('QUOTA_WINDOW', '3600'))
+# Input + output tokens per account per window
+QUOTA_TOKENS = int(os.getenv('QUOTA_TOKENS', '200000'))
+QUOTA_FLUSH_INTERVAL = float(os.getenv('QUOTA_FLUSH_INTERVAL', '5'))
+# Usage rows older than this are deleted
+QUOTA_RETENTION = float(os.getenv('QUOTA_RETENTION', str(7 * 86400)))
+
+_account = contextvars.ContextVar('quota_account', default=None)
+
+
+def bind_account(account):
+    """Charge what the current context generates to account; returns a token for reset_account"""
+    return _account.set(account)
+
+
+def reset_account(token):
+    try:
+        _account.reset(token)
+    except ValueError:
+        # Reset from another context (a teardown hook)
+        _account.set(None)
+
+
+class Shard:
+    """Monotonic token and call counts of one thread, written only by that thread"""
+
+    def __init__(self, shard_id):
+        self.id = shard_id
+        self.tokens = {}
+        self.calls = {}
+        self.window = None
+
+    def add(self, key, tokens):
+        self.tokens[key] = self.tokens.get(key, 0) + tokens
+        self.calls[key] = self.calls.get(key, 0) + 1
+
+    def drop_before(self, window_start):
+        # Windows this old were flushed long ago
+        for key in [key for key in self.tokens if key[1] < window_start]:
+            del self.tokens[key]
+            self.calls.pop(key, None)
+
+
+class _ShardOwner:
+    """Held only by a thread's locals, so it is collected when the thread exits"""
+
+
+class QuotaLedger(SQLiteStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS usage (
+        account TEXT NOT NULL,
+        window_start INTEGER NOT NULL,
+        tokens INTEGER NOT NULL,
+        calls INTEGER NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (account, window_start)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_usage_window ON usage (window_start);
+    """
+
+    def __init__(self, path=QUOTA_PATH, enabled=QUOTAS_ENABLED, window=QUOTA_WINDOW, budget=QUOTA_TOKENS,
+                 flush_interval=QUOTA_FLUSH_INTERVAL):
+        super().__init__(path)
+        self.enabled = enabled
+        self.window = window
+        self.budget = budget
+        self.flush_interval = flush_interval
+        self.shards = []
+        self._shard_ids = itertools.count()
+        self._thread_shard = threading.local()
+        self._shards_lock = threading.Lock()
+        # Shards of exited threads, removed by the next flush
+        self._retired = []
+        self._flush_lock = threading.Lock()
+        # Only the flusher writes these two; readers see one dict or the next
+        self.flushed = {}
+        self.totals = {}
+        self.flusher = None
+        self.stats = {"charged": 0, "degraded": 0, "flushes": 0, "flush_errors": 0}
+
+    def window_start(self, now=None):
+        now = time.time() if now is None else now
+        return int(now // self.window * self.window)
+
+    def _shard(self):
+        shard = getattr(self._thread_shard, 'shard', None)
+        if shard is None:
+            shard = Shard(next(self._shard_ids))
+            with self._shards_lock:
+                # Copy-on-write, so readers iterate without the lock
+                self.shards = self.shards + [shard]
+            self._thread_shard.shard = shard
+            self._thread_shard.owner = _ShardOwner()
+            weakref.finalize(self._thread_shard.owner, self._retired.append, shard)
+        return shard
+
+    def charge(self, tokens, account=None):
+        """Add tokens to the account bound to the current context"""
+        account = account or _account.get()
+        if not self.enabled or not account or tokens <= 0:
+            return
+        window_start = self.window_start()
+        shard = self._shard()
+        if shard.window != window_start:
+            shard.drop_before(window_start - 2 * self.window)
+            shard.window = window_start
+        shard.add((account, window_start), int(tokens))
+        self.stats["charged"] += 1
+        if self.flusher is None:
+            self._start_flusher()
+
+    def used(self, account=None, window_start=None):
+        account = account or _account.get()
+        key = (account, window_start or self.window_start())
+        flushed = self.flushed
+        unflushed = sum(shard.tokens.get(key, 0) - flushed.get((shard.id, key), (0, 0))[0]
+                        for shard in self.shards)
+        return self.totals.get(key, 0) + unflushed
+
+    def over_budget(self, account=None):
+        account = account or _account.get()
+        if not self.enabled or not account:
+            return False
+        if self.flusher is None:
+            # Also loads what the other workers charged
+            self._start_flusher()
+        return self.used(account) >= self.budget
+
+    def degrade(self, account=None):
+        """True, and counted, when the account should get the degraded service"""
+        if self.over_budget(account):
+            self.stats["degraded"] += 1
+            return True
+        return False
+
+    def status(self, account=None):
+        account = account or _account.get()
+        window_start = self.window_start()
+        used = self.used(account, window_start) if account else 0
+        return {
+            "account": account,
+            "enabled": self.enabled,
+            "used": used,
+            "budget": self.budget,
+            "remaining": max(0, self.budget - used),
+            "overBudget": self.enabled and bool(account) and used >= self.budget,
+            "windowSeconds": self.window,
+            "resetsIn": round(window_start + self.window - time.time(), 1),
+        }
+
+    def _start_flusher(self):
+        with self._shards_lock:
+            if self.flusher is not None:
+                return
+            self.flusher = threading.Thread(target=self._run_flusher, name='quota-flusher', daemon=True)
+            self.flusher.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while True:
+            self.flush()
+            time.sleep(self.flush_interval)
+
+    def flush(self):
+        """Write the growth of every shard since the last flush and reload the shared totals"""
+        try:
+            with self._flush_lock:
+                self._flush()
+                self.stats["flushes"] += 1
+        except Exception as e:
+            self.stats["flush_errors"] += 1
+            logger.error(f"Quota flush failed: {str(e)}")
+
+    def _flush(self):
+        # These threads have exited, so the growth counted below is their last
+        retired = list(self._retired)
+        deltas = defaultdict(lambda: [0, 0])
+        flushed = dict(self.flushed)
+        for shard in self.shards:
+            for key, tokens in list(shard.tokens.items()):
+                calls = shard.calls.get(key, 0)
+                done_tokens, done_calls = flushed.get((shard.id, key), (0, 0))
+                if tokens > done_tokens:
+                    deltas[key][0] += tokens - done_tokens
+                    deltas[key][1] += calls - done_calls
+                    flushed[(shard.id, key)] = (tokens, calls)
+        now = time.time()
+        if deltas:
+            conn = self.connection()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO usage (account, window_start, tokens, calls, updated_at) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (account, window_start) DO UPDATE SET tokens = tokens + excluded.tokens, '
+                    'calls = calls + excluded.calls, updated_at = excluded.updated_at',
+                    [(account, window_start, tokens, calls, now)
+                     for (account, window_start), (tokens, calls) in deltas.items()]
+                )
+        oldest = self.window_start(now) - self.window
+        # Markers first: until the totals are reloaded this undercounts, never double counts
+        self.flushed = {marker: value for marker, value in flushed.items() if marker[1][1] >= oldest - self.window}
+        rows = self.execute('SELECT account, window_start, tokens FROM usage WHERE window_start >= ?',
+                            (oldest,)).fetchall()
+        self.totals = {(row['account'], row['window_start']): row['tokens'] for row in rows}
+        self._drop_retired(retired)
+        if self.stats["flushes"] % 720 == 0:
+            self.write('DELETE FROM usage WHERE window_start < ?', (now - QUOTA_RETENTION,))
+
+    def _drop_retired(self, retired):
+        """Forget the shards of exited threads; everything they charged is in the totals now"""
+        if not retired:
+            return
+        gone = {shard.id for shard in retired}
+        with self._shards_lock:
+            self.shards = [shard for shard in self.shards if shard.id not in gone]
+        del self._retired[:len(retired)]
+        # Shards first, then their markers, so used() never counts their tokens twice
+        self.flushed = {marker: value for marker, value in self.flushed.items() if marker[0] not in gone}
+
+    def top(self, limit=20):
+        """Accounts using the most tokens in the current window"""
+        window_start = self.window_start()
+        accounts = {key[0] for key in self.totals if key[1] == window_start}
+        for shard in self.shards:
+            accounts.update(key[0] for key in list(shard.tokens) if key[1] == window_start)
+        usage = sorted(((self.used(account, window_start), account) for account in accounts), reverse=True)
+        return [{"account": account, "used": used, "overBudget": used >= self.budget}
+                for used, account in usage[:limit]]
+
+    def settings(self):
+        window_start = self.window_start()
+        return {
+            "enabled": self.enabled,
+            "windowSeconds": self.window,
+            "budget": self.budget,
+            "flushInterval": self.flush_interval,
+            "shards": len(self.shards),
+            "accounts": len({key[0] for key in self.totals if key[1] == window_start}),
+            **self.stats,
+        }
+
+
+ledger = QuotaLedger()
@@ -0,0 +1,276 @@
+"""Local index of the learning resources Exa has returned, so most roadmaps skip the search.
+
+Every search result is stored once under its canonical URL (scheme, "www.",
+fragments and tracking parameters ignored) with its title, domain and
+metadata, and indexed under the terms of its title and of the topics it was
+found for. A topic is answered from the index when:
+
+    - the same topic was searched less than RESOURCE_TTL ago, or
+    - at least RESOURCE_MIN_MATCHES fresh resources match every term of the
+      topic ("python decorators" reuses what "advanced python decorators" found)
+
+Otherwise the caller searches Exa and adds the results. Stale entries are
+still returned, flagged, so the caller can serve them while it refreshes.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from catalog import normalize_topic
+from storage import SQLiteStore, data_path
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_INDEX_PATH = os.getenv('RESOURCE_INDEX_PATH') or data_path('resources.db')
+RESOURCE_INDEX_ENABLED = os.getenv('RESOURCE_INDEX_ENABLED', '1') == '1'
+# Entries older than this are refreshed from Exa (served meanwhile)
+RESOURCE_TTL = float(os.getenv('RESOURCE_TTL', str(14 * 86400)))
+RESOURCE_RESULTS = 5
+# Keyword matches needed to answer a topic that was never searched itself
+RESOURCE_MIN_MATCHES = int(os.getenv('RESOURCE_MIN_MATCHES', '3'))
+
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|ref|ref_src|fbclid|gclid|mc_cid|mc_eid|source)$', re.IGNORECASE)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+_WORD_RE = re.compile(r'[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]', re.UNICODE)
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'best', 'by', 'for', 'from', 'how', 'in', 'into', 'is', 'it', 'of',
+    'on', 'or', 'resources', 'the', 'to', 'tutorial', 'tutorials', 'vs', 'what', 'with', 'your',
+}
+
+
+def canonical_url(url):
+    """Scheme-less, lowercased-host URL without www., fragment, default port or tracking parameters"""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not TRACKING_PARAMS.match(key))
+    return host + path + (f"?{urlencode(query)}" if query else '')
+
+
+def clean_url(url):
+    """The URL as returned, minus tracking parameters"""
+    parts = urlsplit(url.strip())
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not TRACKING_PARAMS.match(key)]
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+def url_domain(url):
+    host = (urlsplit(url.strip()).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def singular(word):
+    """Rough singular of an English plural; names like node.js and words like analysis are kept"""
+    if len(word) <= 3 or not word.isalpha() or not word.endswith('s') or word.endswith(('ss', 'us', 'sis')):
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'xes', 'shes')):
+        return word[:-2]
+    return word[:-1]
+
+
+def terms(text):
+    """Index terms of a topic or title: lowercased words, stopwords dropped, plurals folded"""
+    found = [singular(word) for word in _WORD_RE.findall(str(text).lower()) if word not in STOPWORDS]
+    return list(dict.fromkeys(found))
+
+
+class ResourceLookup:
+    """Resources found for a topic, where they came from and whether they need a refresh"""
+
+    def __init__(self, resources=None, source=None, stale=False):
+        self.resources = resources or []
+        self.source = source
+        self.stale = stale
+
+    @property
+    def hit(self):
+        return bool(self.resources) and not self.stale
+
+
+class ResourceIndex(SQLiteStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS resources (
+        url_key TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        title TEXT NOT NULL,
+        domain TEXT NOT NULL,
+        author TEXT,
+        published_date TEXT,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        seen_count INTEGER NOT NULL DEFAULT 1
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS resource_terms (
+        term TEXT NOT NULL,
+        url_key TEXT NOT NULL,
+        weight INTEGER NOT NULL,
+        PRIMARY KEY (term, url_key)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS topic_searches (
+        topic_key TEXT PRIMARY KEY,
+        topic TEXT NOT NULL,
+        url_keys TEXT NOT NULL,
+        searched_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    """
+
+    # Terms of the topic a resource was found for count more than words of its title; a term in both counts most
+    TOPIC_WEIGHT = 2
+    TITLE_WEIGHT = 1
+
+    def __init__(self, path=RESOURCE_INDEX_PATH, enabled=RESOURCE_INDEX_ENABLED, ttl=RESOURCE_TTL,
+                 min_matches=RESOURCE_MIN_MATCHES):
+        super().__init__(path)
+        self.enabled = enabled
+        self.ttl = ttl
+        self.min_matches = min_matches
+        self.refreshing = set()
+        self.refresh_lock = threading.Lock()
+        self.counters = {'topic': 0, 'terms': 0, 'stale': 0, 'miss': 0, 'added': 0, 'known': 0, 'duplicates': 0}
+
+    def _resources(self, url_keys):
+        """Stored resources in the given order"""
+        if not url_keys:
+            return []
+        rows = self.execute(
+            "SELECT url_key, url, title, domain FROM resources "
+            f"WHERE url_key IN ({','.join('?' * len(url_keys))})", list(url_keys)
+        ).fetchall()
+        by_key = {row['url_key']: row for row in rows}
+        return [{"title": by_key[key]['title'], "url": by_key[key]['url'], "domain": by_key[key]['domain']}
+                for key in url_keys if key in by_key]
+
+    def _by_topic(self, topic_key, limit):
+        row = self.execute('SELECT url_keys, searched_at FROM topic_searches WHERE topic_key = ?',
+                           (topic_key,)).fetchone()
+        if row is None:
+            return None
+        resources = self._resources(json.loads(row['url_keys'])[:limit])
+        return ResourceLookup(resources, 'topic', stale=time.time() - row['searched_at'] > self.ttl)
+
+    def _by_terms(self, topic, limit):
+        topic_terms = terms(topic)
+        if not topic_terms:
+            return None
+        # Resources indexed under every term of the topic, best matches first
+        rows = self.execute(
+            "SELECT t.url_key FROM resource_terms t JOIN resources r ON r.url_key = t.url_key "
+            f"WHERE t.term IN ({','.join('?' * len(topic_terms))}) AND r.last_seen > ? "
+            "GROUP BY t.url_key HAVING COUNT(*) = ? "
+            "ORDER BY SUM(t.weight) DESC, MAX(r.seen_count) DESC, MAX(r.last_seen) DESC LIMIT ?",
+            [*topic_terms, time.time() - self.ttl, len(topic_terms), limit]
+        ).fetchall()
+        if len(rows) < min(self.min_matches, limit):
+            return None
+        resources = self._resources([row['url_key'] for row in rows])
+        return ResourceLookup(resources, 'terms')
+
+    def lookup(self, topic, limit=RESOURCE_RESULTS):
+        """Resources for a topic: searched for it before, or matching all of its terms"""
+        if not self.enabled:
+            return ResourceLookup()
+        try:
+            found = self._by_topic(normalize_topic(topic), limit)
+            if found is None or found.stale or not found.resources:
+                by_terms = self._by_terms(topic, limit)
+                # Stale results of the topic itself still beat a miss
+                found = by_terms or found
+        except Exception as e:
+            # The index is an optimisation; a failed lookup is a miss
+            logger.error(f"Resource index lookup failed: {str(e)}")
+            found = None
+        if found is None or not found.resources:
+            self.counters['miss'] += 1
+            return ResourceLookup()
+        self.counters['stale' if found.stale else found.source] += 1
+        return found
+
+    def add(self, topic, results):
+        """Store search results for a topic; returns them as resources, duplicates merged"""
+        now = time.time()
+        topic_terms = terms(topic)
+        url_keys, resources = [], []
+        conn = self.connection()
+        with conn:
+            for result in results:
+                url = clean_url(result.get('url') or '')
+                if not url:
+                    continue
+                url_key = canonical_url(url)
+                if url_key in url_keys:
+                    self.counters['duplicates'] += 1
+                    continue
+                title = (result.get('title') or '').strip() or url_domain(url)
+                existing = conn.execute('SELECT 1 FROM resources WHERE url_key = ?', (url_key,)).fetchone()
+                if existing is not None:
+                    self.counters['known'] += 1
+                conn.execute(
+                    'INSERT INTO resources (url_key, url, title, domain, author, published_date, first_seen, '
+                    'last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (url_key) DO UPDATE SET url = excluded.url, title = excluded.title, '
+                    'author = COALESCE(excluded.author, author), '
+                    'published_date = COALESCE(excluded.published_date, published_date), '
+                    'last_seen = excluded.last_seen, seen_count = seen_count + 1',
+                    (url_key, url, title, url_domain(url), result.get('author'), result.get('published_date'),
+                     now, now)
+                )
+                weights = {term: self.TITLE_WEIGHT for term in terms(title)}
+                for term in topic_terms:
+                    weights[term] = weights.get(term, 0) + self.TOPIC_WEIGHT
+                conn.executemany(
+                    'INSERT INTO resource_terms (term, url_key, weight) VALUES (?, ?, ?) '
+                    'ON CONFLICT (term, url_key) DO UPDATE SET weight = MAX(weight, excluded.weight)',
+                    [(term, url_key, weight) for term, weight in weights.items()]
+                )
+                url_keys.append(url_key)
+                resources.append({"title": title, "url": url, "domain": url_domain(url)})
+            conn.execute(
+                'INSERT OR REPLACE INTO topic_searches (topic_key, topic, url_keys, searched_at) VALUES (?, ?, ?, ?)',
+                (normalize_topic(topic), topic, json.dumps(url_keys), now)
+            )
+        self.counters['added'] += len(url_keys)
+        return resources
+
+    def claim_refresh(self, topic):
+        """True for the one caller that should refresh a stale topic"""
+        with self.refresh_lock:
+            if topic in self.refreshing:
+                return False
+            self.refreshing.add(topic)
+            return True
+
+    def release_refresh(self, topic):
+        with self.refresh_lock:
+            self.refreshing.discard(topic)
+
+    def stats(self):
+        counts = self.execute(
+            'SELECT (SELECT COUNT(*) FROM resources) AS resources, '
+            '(SELECT COUNT(DISTINCT domain) FROM resources) AS domains, '
+            '(SELECT COUNT(*) FROM resource_terms) AS terms, '
+            '(SELECT COUNT(*) FROM topic_searches) AS topics'
+        ).fetchone()
+        return {
+            **dict(counts),
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "min_matches": self.min_matches,
+            "lookups": dict(self.counters),
+        }
+
+
+resource_index = ResourceIndex()
@@ -0,0 +1,201 @@
+import logging
+import os
+import time
+
+from library import content_key
+from storage import SQLiteStore, data_path
+
+logger = logging.getLogger(__name__)
+
+REVIEW_PATH = os.getenv('REVIEW_PATH') or data_path('review.db')
+REVIEW_KINDS = ('question', 'explanation')
+DEFAULT_QUEUE_SIZE = 20
+MAX_QUEUE_SIZE = 100
+DAY = 86400.0
+
+# SM-2 parameters
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+# Grades 0-5; below this the item counts as forgotten and starts over
+PASSING_GRADE = 3
+# Button names the frontend can send instead of numeric grades
+GRADE_NAMES = {'again': 1, 'hard': 3, 'good': 4, 'easy': 5}
+# Forgotten items come back after ten minutes rather than tomorrow
+RELEARN_INTERVAL = 10 * 60 / DAY
+
+
+def parse_grade(value):
+    """A 0-5 grade from a number or a button name; ValueError otherwise"""
+    if isinstance(value, str) and value.lower() in GRADE_NAMES:
+        return GRADE_NAMES[value.lower()]
+    grade = int(value)
+    if not 0 <= grade <= 5:
+        raise ValueError('grade must be between 0 and 5')
+    return grade
+
+
+def schedule(ease, interval, repetitions, lapses, grade):
+    """SM-2: the next (ease, interval in days, repetitions, lapses) after a review"""
+    ease = max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    if grade < PASSING_GRADE:
+        return ease, RELEARN_INTERVAL, 0, lapses + 1
+    if repetitions == 0:
+        interval = 1.0
+    elif repetitions == 1:
+        interval = 6.0
+    else:
+        interval = interval * ease
+    # "Hard" answers grow the interval less than the ease alone would
+    if grade == PASSING_GRADE and repetitions > 1:
+        interval = max(1.0, interval / ease * 1.2)
+    return ease, interval, repetitions + 1, lapses
+
+
+class ReviewStore(SQLiteStore):
+    """Per-learner review schedule over generated questions and explanations.
+
+    Rows are clustered by (user_id, item_id) and the (user_id, due) index
+    answers "what is due now" with one index range scan, so a learner's queue
+    costs O(log n + k) however many items are stored. Due counts are range
+    scans of the same index; totals are kept per learner by triggers.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS review_items (
+        user_id TEXT NOT NULL,
+        item_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        prompt TEXT NOT NULL,
+        answer TEXT NOT NULL DEFAULT '',
+        ease REAL NOT NULL,
+        interval REAL NOT NULL DEFAULT 0,
+        repetitions INTEGER NOT NULL DEFAULT 0,
+        lapses INTEGER NOT NULL DEFAULT 0,
+        due REAL NOT NULL,
+        reviewed_at REAL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (user_id, item_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS review_items_due ON review_items (user_id, due);
+    CREATE TABLE IF NOT EXISTS review_totals (
+        user_id TEXT PRIMARY KEY,
+        total INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    -- Stores created before the totals existed count their items once
+    INSERT INTO review_totals (user_id, total)
+    SELECT user_id, COUNT(*) FROM review_items
+    WHERE NOT EXISTS (SELECT 1 FROM review_totals) GROUP BY user_id;
+    -- Upserts that hit an existing item are updates and leave the total alone
+    CREATE TRIGGER IF NOT EXISTS review_items_added AFTER INSERT ON review_items BEGIN
+        INSERT INTO review_totals (user_id, total) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET total = total + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS review_items_removed AFTER DELETE ON review_items BEGIN
+        UPDATE review_totals SET total = total - 1 WHERE user_id = OLD.user_id;
+    END;
+    """
+
+    def __init__(self, path=REVIEW_PATH):
+        super().__init__(path)
+
+    @staticmethod
+    def _row_to_item(row):
+        return {
+            "itemId": row['item_id'],
+            "kind": row['kind'],
+            "topic": row['topic'],
+            "prompt": row['prompt'],
+            "answer": row['answer'],
+            "ease": round(row['ease'], 3),
+            "intervalDays": round(row['interval'], 3),
+            "repetitions": row['repetitions'],
+            "lapses": row['lapses'],
+            "due": row['due'],
+            "reviewedAt": row['reviewed_at'],
+        }
+
+    def enroll(self, user_id, items):
+        """Add (kind, topic, prompt, answer) items, due now; items already scheduled keep their schedule"""
+        now = time.time()
+        rows = []
+        for kind, topic, prompt, answer in items:
+            if kind not in REVIEW_KINDS:
+                raise ValueError(f"Unknown review kind: {kind}")
+            rows.append((user_id, content_key(kind, topic, prompt), kind, topic, prompt, answer or '',
+                         INITIAL_EASE, now, now))
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO review_items (user_id, item_id, kind, topic, prompt, answer, ease, due, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (user_id, item_id) DO UPDATE SET answer = excluded.answer '
+                "WHERE excluded.answer != ''",
+                rows
+            )
+        return [row[1] for row in rows]
+
+    def record(self, user_id, items):
+        """Enroll generated content without failing the request that produced it"""
+        if not user_id or not items:
+            return None
+        try:
+            return self.enroll(user_id, items)
+        except Exception as e:
+            logger.error(f"Review enrollment failed: {str(e)}")
+            return None
+
+    def queue(self, user_id, now=None, limit=DEFAULT_QUEUE_SIZE, topic=None):
+        """Items due for review, most overdue first"""
+        now = now or time.time()
+        limit = max(1, min(int(limit), MAX_QUEUE_SIZE))
+        if topic:
+            rows = self.execute(
+                'SELECT * FROM review_items WHERE user_id = ? AND due <= ? AND topic = ? ORDER BY due LIMIT ?',
+                (user_id, now, topic, limit)
+            ).fetchall()
+        else:
+            rows = self.execute(
+                'SELECT * FROM review_items WHERE user_id = ? AND due <= ? ORDER BY due LIMIT ?',
+                (user_id, now, limit)
+            ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def counts(self, user_id, now=None):
+        """Due now, due within a day and total items for a learner"""
+        now = now or time.time()
+        # Only the items due within a day are scanned, not all of the learner's items
+        row = self.execute(
+            'SELECT COUNT(*) AS due_today, COALESCE(SUM(due <= ?), 0) AS due '
+            'FROM review_items WHERE user_id = ? AND due <= ?',
+            (now, user_id, now + DAY)
+        ).fetchone()
+        total = self.execute('SELECT total FROM review_totals WHERE user_id = ?', (user_id,)).fetchone()
+        return {"due": row['due'], "dueToday": row['due_today'], "total": total['total'] if total else 0}
+
+    def grade(self, user_id, item_id, grade, now=None):
+        """Apply a 0-5 grade and return the rescheduled item, or None if it does not exist"""
+        now = now or time.time()
+        conn = self.connection()
+        with conn:
+            row = conn.execute('SELECT * FROM review_items WHERE user_id = ? AND item_id = ?',
+                               (user_id, item_id)).fetchone()
+            if row is None:
+                return None
+            ease, interval, repetitions, lapses = schedule(
+                row['ease'], row['interval'], row['repetitions'], row['lapses'], grade)
+            conn.execute(
+                'UPDATE review_items SET ease = ?, interval = ?, repetitions = ?, lapses = ?, due = ?, '
+                'reviewed_at = ? WHERE user_id = ? AND item_id = ?',
+                (ease, interval, repetitions, lapses, now + interval * DAY, now, user_id, item_id)
+            )
+            row = conn.execute('SELECT * FROM review_items WHERE user_id = ? AND item_id = ?',
+                               (user_id, item_id)).fetchone()
+        return self._row_to_item(row)
+
+    def delete(self, user_id, item_id):
+        return self.write('DELETE FROM review_items WHERE user_id = ? AND item_id = ?',
+                          (user_id, item_id)).rowcount > 0
+
+
+review_store = ReviewStore()
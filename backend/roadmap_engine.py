@@ -0,0 +1,315 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import time
+import uuid
+
+from library import content_key
+from storage import SQLiteStore, data_path
+import tracing
+
+logger = logging.getLogger(__name__)
+
+ROADMAP_PATH = os.getenv('ROADMAP_PATH') or data_path('roadmaps.db')
+# Five sections for each of the six roadmaps the heavy admission class runs at once
+ROADMAP_SECTION_WORKERS = int(os.getenv('ROADMAP_SECTION_WORKERS', '30'))
+# Bump when the section prompt changes so stored sections are regenerated
+SECTION_PROMPT_VERSION = '2'
+# Id prefix of roadmaps adopted from the catalog; edits fork them into a roadmap of their own
+ADOPTED_PREFIX = 'catalog-'
+
+# Inputs each roadmap section is generated from, and the only ones its prompt
+# is given. Sections that only depend on the topic and level survive goal
+# edits untouched and are shared between everyone learning the topic.
+SECTION_INPUTS = {
+    "Fundamentals & Prerequisites": ('topic', 'proficiency'),
+    "Core Concepts": ('topic', 'proficiency', 'goals'),
+    "Advanced Topics": ('topic', 'proficiency'),
+    "Practical Applications": ('topic', 'proficiency', 'goals'),
+    "Final Projects": ('topic', 'proficiency', 'goals'),
+}
+
+
+def section_inputs(section):
+    return SECTION_INPUTS.get(section, ('topic', 'proficiency', 'goals'))
+
+
+def uses_goals(section):
+    """Whether the section's prompt includes the goals"""
+    return 'goals' in section_inputs(section)
+
+
+def section_input_hash(section, topic, proficiency, goals_text):
+    """Hash of exactly the inputs a section depends on"""
+    inputs = {'topic': topic, 'proficiency': proficiency, 'goals': goals_text}
+    return content_key(SECTION_PROMPT_VERSION, section, *(inputs[name] for name in section_inputs(section)))
+
+
+def placeholder_section(title):
+    return f"## {title}\n\n_This section could not be generated. Refresh it to try again._"
+
+
+def assemble_roadmap(sections):
+    """The markdown roadmap the frontend renders, one header per section"""
+    return '\n\n'.join(section['content'].strip() for section in sections)
+
+
+class RoadmapStore(SQLiteStore):
+    """Roadmaps stored section by section with the hash of each section's inputs"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS roadmaps (
+        roadmap_id TEXT PRIMARY KEY,
+        user_id TEXT,
+        topic TEXT NOT NULL,
+        proficiency TEXT NOT NULL,
+        goals_text TEXT NOT NULL,
+        resources TEXT NOT NULL DEFAULT '[]',
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS roadmap_sections (
+        roadmap_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        input_hash TEXT NOT NULL,
+        content TEXT NOT NULL,
+        generated_at REAL NOT NULL,
+        PRIMARY KEY (roadmap_id, position)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS roadmaps_topic ON roadmaps (topic, updated_at DESC);
+    CREATE INDEX IF NOT EXISTS roadmap_sections_hash ON roadmap_sections (input_hash, generated_at DESC);
+    """
+
+    def __init__(self, path=ROADMAP_PATH):
+        super().__init__(path)
+
+    def load(self, roadmap_id):
+        row = self.execute('SELECT * FROM roadmaps WHERE roadmap_id = ?', (roadmap_id,)).fetchone()
+        if row is None:
+            return None
+        sections = self.execute(
+            'SELECT title, input_hash, content, generated_at FROM roadmap_sections '
+            'WHERE roadmap_id = ? ORDER BY position', (roadmap_id,)
+        ).fetchall()
+        roadmap = dict(row)
+        roadmap['resources'] = json.loads(roadmap['resources'])
+        roadmap['sections'] = [dict(section) for section in sections]
+        return roadmap
+
+    def exists(self, roadmap_id):
+        return self.execute('SELECT 1 FROM roadmaps WHERE roadmap_id = ?', (roadmap_id,)).fetchone() is not None
+
+    def find_section(self, input_hash):
+        """Newest content generated from the same inputs by any roadmap"""
+        row = self.execute(
+            'SELECT content FROM roadmap_sections WHERE input_hash = ? ORDER BY generated_at DESC LIMIT 1',
+            (input_hash,)
+        ).fetchone()
+        return None if row is None else row['content']
+
+    def find_resources(self, topic):
+        """Resources most recently fetched for the same topic, or an empty list"""
+        row = self.execute(
+            "SELECT resources FROM roadmaps WHERE topic = ? AND resources != '[]' "
+            'ORDER BY updated_at DESC LIMIT 1', (topic,)
+        ).fetchone()
+        return [] if row is None else json.loads(row['resources'])
+
+    def save(self, roadmap_id, user_id, topic, proficiency, goals_text, resources, sections):
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO roadmaps (roadmap_id, user_id, topic, proficiency, goals_text, resources, '
+                'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (roadmap_id) DO UPDATE SET topic = excluded.topic, '
+                'proficiency = excluded.proficiency, goals_text = excluded.goals_text, '
+                'resources = excluded.resources, updated_at = excluded.updated_at',
+                (roadmap_id, user_id, topic, proficiency, goals_text, json.dumps(resources), now, now)
+            )
+            conn.execute('DELETE FROM roadmap_sections WHERE roadmap_id = ? AND position >= ?',
+                         (roadmap_id, len(sections)))
+            conn.executemany(
+                'INSERT OR REPLACE INTO roadmap_sections '
+                '(roadmap_id, position, title, input_hash, content, generated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(roadmap_id, position, section['title'], section['input_hash'], section['content'],
+                  section.get('generated_at') or now)
+                 for position, section in enumerate(sections)]
+            )
+
+
+class RoadmapEngine:
+    """Regenerates only the roadmap sections whose inputs changed"""
+
+    def __init__(self, store, generate_section, sections=tuple(SECTION_INPUTS), max_workers=ROADMAP_SECTION_WORKERS):
+        # generate_section(title, topic, proficiency, goals_text) -> markdown for that section
+        self.store = store
+        self.generate_section = generate_section
+        self.sections = list(sections)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='roadmap-section')
+
+    def _submit(self, titles, topic, proficiency, goals_text):
+        """Start generating several sections in parallel, so an edit costs one section's latency"""
+        return {title: self.executor.submit(tracing.bind(self.generate_section), title, topic, proficiency,
+                                            goals_text)
+                for title in titles}
+
+    @staticmethod
+    def _collect(futures, topic):
+        """The generated sections and the errors of the ones that failed"""
+        generated, errors = {}, {}
+        for title, future in futures.items():
+            try:
+                generated[title] = future.result()
+            except Exception as e:
+                logger.error(f"Roadmap section {title!r} for {topic} failed: {str(e)}")
+                errors[title] = e
+        return generated, errors
+
+    def _response(self, roadmap_id, resources, sections, regenerated, failed=()):
+        return {
+            "roadmapId": roadmap_id,
+            "roadmap": assemble_roadmap(sections),
+            "resources": resources,
+            "sections": [{"title": section['title'], "content": section['content'],
+                          "inputHash": section['input_hash'], "needsRefresh": not section['input_hash']}
+                         for section in sections],
+            "regenerated": regenerated,
+            "failed": list(failed),
+        }
+
+    def get(self, roadmap_id, user_id=None):
+        roadmap = self.load_owned(roadmap_id, user_id)
+        if roadmap is None:
+            return None
+        failed = [section['title'] for section in roadmap['sections'] if not section['input_hash']]
+        return self._response(roadmap_id, roadmap['resources'], roadmap['sections'], [], failed)
+
+    def load_owned(self, roadmap_id, user_id):
+        """A stored roadmap, unless it belongs to someone else"""
+        roadmap = self.store.load(roadmap_id)
+        if roadmap is None or (roadmap['user_id'] and roadmap['user_id'] != user_id):
+            return None
+        return roadmap
+
+    def generate(self, topic, proficiency, goals_text, fetch_resources, roadmap_id=None, user_id=None):
+        """Create or update a roadmap; unchanged sections are kept, stored ones are reused"""
+        existing = self.load_owned(roadmap_id, user_id) if roadmap_id else None
+        previous = {section['title']: section for section in (existing or {}).get('sections', [])}
+        # Fallbacks for sections that fail: what the roadmap had, even if its inputs changed
+        fallback = {title: section['content'] for title, section in previous.items()}
+
+        sections, missing = [], []
+        for title in self.sections:
+            input_hash = section_input_hash(title, topic, proficiency, goals_text)
+            section = {"title": title, "input_hash": input_hash, "content": None}
+            kept = previous.get(title)
+            if kept is not None and kept['input_hash'] == input_hash:
+                section.update(content=kept['content'], generated_at=kept['generated_at'])
+            else:
+                section['content'] = self.store.find_section(input_hash)
+            if section['content'] is None:
+                missing.append(title)
+            sections.append(section)
+
+        futures = self._submit(missing, topic, proficiency, goals_text)
+        # Resources only depend on the topic; this thread fetches them while the sections generate
+        if existing is not None and existing['topic'] == topic and existing['resources']:
+            resources = existing['resources']
+        else:
+            resources = fetch_resources(topic)
+
+        generated, errors = self._collect(futures, topic)
+        if len(errors) == len(sections) and not fallback:
+            # Nothing to show at all
+            raise next(iter(errors.values()))
+        for section in sections:
+            title = section['title']
+            if title in generated:
+                section['content'] = generated[title]
+                section['generated_at'] = time.time()
+            elif title in errors:
+                # An empty input hash never matches, so the next generate or refresh retries it
+                section.update(content=fallback.get(title) or placeholder_section(title), input_hash='')
+
+        roadmap_id = self._writable_id(existing)
+        self.store.save(roadmap_id, user_id, topic, proficiency, goals_text, resources, sections)
+        logger.debug(f"Roadmap {roadmap_id}: regenerated {len(generated)}/{len(sections)} sections, "
+                     f"{len(errors)} failed")
+        return self._response(roadmap_id, resources, sections, list(generated), list(errors))
+
+    @staticmethod
+    def _writable_id(existing):
+        """Id to save an edit under; adopted catalog roadmaps are shared and never edited in place"""
+        if existing is None or existing['roadmap_id'].startswith(ADOPTED_PREFIX):
+            return uuid.uuid4().hex
+        return existing['roadmap_id']
+
+    def plan_batch(self, roadmaps):
+        """Stored content, or the section to generate, for several roadmaps built together.
+
+        roadmaps maps a key to (topic, proficiency, goals_text). Returns
+        plans[key][title] = (content or None, request id or None) and the
+        sections to generate by request id; a section shared by several
+        roadmaps is requested once.
+        """
+        plans, missing, requested = {}, {}, {}
+        for key, (topic, proficiency, goals_text) in roadmaps.items():
+            plans[key] = {}
+            for position, title in enumerate(self.sections):
+                input_hash = section_input_hash(title, topic, proficiency, goals_text)
+                content = self.store.find_section(input_hash)
+                if content is None and input_hash not in requested:
+                    requested[input_hash] = f"{key}-roadmap-{position}"
+                    missing[requested[input_hash]] = (title, topic, proficiency, goals_text)
+                plans[key][title] = (content, requested.get(input_hash) if content is None else None)
+        return plans, missing
+
+    def save_generated(self, topic, proficiency, goals_text, resources, contents, user_id=None):
+        """Store sections generated elsewhere (the catalog's batch build) as a new roadmap"""
+        sections = [{"title": title, "content": contents[title],
+                     "input_hash": section_input_hash(title, topic, proficiency, goals_text)}
+                    for title in self.sections]
+        roadmap_id = uuid.uuid4().hex
+        self.store.save(roadmap_id, user_id, topic, proficiency, goals_text, resources, sections)
+        return self._response(roadmap_id, resources, sections, list(self.sections))
+
+    def adopt(self, topic, proficiency, goals_text, payload, user_id=None):
+        """Store a roadmap served from elsewhere (e.g. the catalog) so its sections can be refreshed"""
+        titles = [section.get('title') for section in payload.get('sections') or []]
+        if titles != self.sections:
+            return None
+        sections = [{"title": section['title'], "content": section['content'],
+                     "input_hash": section_input_hash(section['title'], topic, proficiency, goals_text)}
+                    for section in payload['sections']]
+        # One row per catalog roadmap and user: repeated hits only read
+        roadmap_id = ADOPTED_PREFIX + content_key(user_id or '', *(section['input_hash'] for section in sections))
+        if not self.store.exists(roadmap_id):
+            self.store.save(roadmap_id, user_id, topic, proficiency, goals_text, payload.get('resources', []),
+                            sections)
+        return roadmap_id
+
+    def refresh_section(self, roadmap_id, position, user_id=None):
+        """Regenerate one section of a stored roadmap on request, or None if it does not exist"""
+        roadmap = self.load_owned(roadmap_id, user_id)
+        if roadmap is None or not 0 <= position < len(roadmap['sections']):
+            return None
+        topic, proficiency, goals_text = roadmap['topic'], roadmap['proficiency'], roadmap['goals_text']
+        sections = roadmap['sections']
+        title = sections[position]['title']
+        sections[position] = {
+            "title": title,
+            "input_hash": section_input_hash(title, topic, proficiency, goals_text),
+            "content": self.generate_section(title, topic, proficiency, goals_text),
+            "generated_at": time.time(),
+        }
+        roadmap_id = self._writable_id(roadmap)
+        self.store.save(roadmap_id, roadmap['user_id'] or user_id, topic, proficiency, goals_text,
+                        roadmap['resources'], sections)
+        failed = [section['title'] for section in sections if not section['input_hash']]
+        return self._response(roadmap_id, roadmap['resources'], sections, [title], failed)
+
+
+roadmap_store = RoadmapStore()
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import re
+import time
+
+from storage import SQLiteStore, data_path
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PATH = os.getenv('SEARCH_PATH') or data_path('search.db')
+SEARCH_KINDS = ('roadmap', 'module', 'explanation', 'example', 'question')
+MAX_RESULTS = 50
+# Shorter trailing words are matched exactly; a one- or two-letter prefix expands to too many terms
+MIN_PREFIX_LENGTH = 3
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Owner token of documents every user sees
+SHARED_OWNER = 'ownershared'
+
+
+def owner_token(user_id):
+    """Single FTS token for a user id, so ownership is part of the MATCH"""
+    if not user_id:
+        return SHARED_OWNER
+    return 'owner' + hashlib.sha1(str(user_id).encode('utf-8')).hexdigest()[:20]
+
+
+def build_match_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix (search-as-you-type)"""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) >= MIN_PREFIX_LENGTH:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class SearchIndex(SQLiteStore):
+    """Incremental FTS5 index over generated learning content"""
+
+    # The topic and owner columns are indexed so topic and user filters are
+    # answered by the FTS index itself: bm25 only ranks the user's matches
+    # instead of every match in the corpus. The prefix indexes keep
+    # search-as-you-type queries off a full term scan
+    SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS user_documents USING fts5(
+        title, body, topic, owner,
+        kind UNINDEXED, user_id UNINDEXED, ref UNINDEXED, created_at UNINDEXED,
+        tokenize = 'porter unicode61', prefix = '3 4'
+    );
+    CREATE TABLE IF NOT EXISTS user_document_keys (
+        user_id TEXT NOT NULL,
+        doc_key TEXT NOT NULL,
+        doc_rowid INTEGER NOT NULL,
+        PRIMARY KEY (user_id, doc_key)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path=SEARCH_PATH):
+        super().__init__(path)
+        self._migrated = False
+
+    def connection(self):
+        conn = super().connection()
+        if not self._migrated:
+            with self._init_lock:
+                if not self._migrated:
+                    self._migrate(conn)
+                    self._migrated = True
+        return conn
+
+    def _migrate(self, conn):
+        """Move documents of the first schema (keys without the user, user_id unindexed) over"""
+        old = conn.execute("SELECT name FROM sqlite_master WHERE name = 'documents'").fetchone()
+        if old is None:
+            return
+        with conn:
+            rows = conn.execute('SELECT d.title, d.body, d.topic, d.kind, d.user_id, d.ref, d.created_at, k.doc_key '
+                                'FROM document_keys k JOIN documents d ON d.rowid = k.doc_rowid').fetchall()
+            for row in rows:
+                cursor = conn.execute(
+                    'INSERT INTO user_documents (title, body, topic, owner, kind, user_id, ref, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (row['title'], row['body'], row['topic'], owner_token(row['user_id']), row['kind'],
+                     row['user_id'], row['ref'], row['created_at'])
+                )
+                conn.execute('INSERT OR REPLACE INTO user_document_keys (user_id, doc_key, doc_rowid) '
+                             'VALUES (?, ?, ?)', (row['user_id'], row['doc_key'], cursor.lastrowid))
+            conn.execute('DROP TABLE documents')
+            conn.execute('DROP TABLE document_keys')
+        logger.info(f"Migrated {len(rows)} search documents to per-user keys")
+
+    def add(self, doc_key, kind, title, body, topic='', user_id='', ref=''):
+        """Index or re-index one document of a user; their regenerated content replaces the old copy"""
+        if kind not in SEARCH_KINDS:
+            raise ValueError(f"Unknown search kind: {kind}")
+        user_id = user_id or ''
+        conn = self.connection()
+        with conn:
+            previous = conn.execute('SELECT doc_rowid FROM user_document_keys WHERE user_id = ? AND doc_key = ?',
+                                    (user_id, doc_key)).fetchone()
+            if previous is not None:
+                conn.execute('DELETE FROM user_documents WHERE rowid = ?', (previous['doc_rowid'],))
+            cursor = conn.execute(
+                'INSERT INTO user_documents (title, body, topic, owner, kind, user_id, ref, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (title, body, topic or '', owner_token(user_id), kind, user_id, ref, time.time())
+            )
+            conn.execute('INSERT OR REPLACE INTO user_document_keys (user_id, doc_key, doc_rowid) VALUES (?, ?, ?)',
+                         (user_id, doc_key, cursor.lastrowid))
+
+    def record(self, doc_key, kind, title, body, topic='', user_id='', ref=''):
+        """Index content as it is generated; failures never reach the request"""
+        try:
+            self.add(doc_key, kind, title, body, topic=topic, user_id=user_id, ref=ref)
+        except Exception as e:
+            logger.error(f"Search indexing failed: {str(e)}")
+
+    def search(self, text, user_id=None, topic=None, kind=None, limit=20, offset=0):
+        """Ranked matches visible to the user (their own plus shared documents)"""
+        query = build_match_query(text)
+        if query is None:
+            return []
+        # Never match the owner column with the user's words
+        query = f'{{title body topic}} : ({query})'
+        if topic:
+            topic_terms = ' '.join(f'"{word}"' for word in _WORD_RE.findall(topic.lower()))
+            if topic_terms:
+                query = f'({query}) AND topic : ({topic_terms})'
+        owners = {SHARED_OWNER, owner_token(user_id)}
+        query = f"({query}) AND owner : ({' OR '.join(sorted(owners))})"
+        clauses = ['user_documents MATCH ?']
+        params = [query]
+        if kind:
+            clauses.append('kind = ?')
+            params.append(kind)
+        limit = max(1, min(int(limit), MAX_RESULTS))
+        rows = self.execute(
+            "SELECT title, topic, kind, ref, created_at, "
+            "snippet(user_documents, 1, '<mark>', '</mark>', '…', 16) AS snippet, "
+            # Title matches count more than body matches, topic matches least; the owner term not at all
+            "bm25(user_documents, 4.0, 1.0, 0.5, 0.0) AS score "
+            f"FROM user_documents WHERE {' AND '.join(clauses)} "
+            "ORDER BY score LIMIT ? OFFSET ?",
+            params + [limit, max(0, int(offset))]
+        ).fetchall()
+        return [{
+            "title": row['title'],
+            "topic": row['topic'],
+            "kind": row['kind'],
+            "ref": row['ref'],
+            "createdAt": row['created_at'],
+            "snippet": row['snippet'],
+            "score": round(-row['score'], 4),
+        } for row in rows]
+
+    def count(self):
+        return self.execute('SELECT COUNT(*) AS n FROM user_document_keys').fetchone()['n']
+
+
+search_index = SearchIndex()
@@ -0,0 +1,333 @@
+"""Session channel for interactive traffic: one event stream per browser tab.
+
+The client opens a session (POST /session), keeps one EventSource on
+/session/<id>/events and posts explain/examples/questions requests to
+/session/<id>/requests as text/plain, which browsers send without a CORS
+preflight. Results stream back as events tagged with the request id:
+
+    event: delta     {"id": ..., "text": ...}      streamed text
+    event: result    {"id": ..., "result": {...}}  same body as the HTTP route
+    event: error     {"id": ..., "error": ...}
+    event: cancelled {"id": ..., "reason": "superseded" | "cancelled"}
+
+A request posted on a channel (e.g. "explain") supersedes the one still running
+on that channel, so clicking a new sentence stops the old explanation.
+
+Every open stream holds a server thread, so at most SESSION_MAX_STREAMS are
+open at once; past that /events answers 503 and the client uses the plain HTTP
+routes. A session has one stream: a reconnect ends the one it replaces.
+Requests are admitted on the thread that posts them and run on the session
+pool, not on the pool shared with deadline parking and resource refreshes.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Sessions without an open stream or request for this long are dropped
+SESSION_IDLE_TIMEOUT = float(os.getenv('SESSION_IDLE_TIMEOUT', '900'))
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', '2000'))
+# Seconds between keepalive comments on an idle stream
+SESSION_HEARTBEAT = float(os.getenv('SESSION_HEARTBEAT', '15'))
+# A stream is closed after this long; EventSource reconnects with Last-Event-ID
+SESSION_STREAM_SECONDS = float(os.getenv('SESSION_STREAM_SECONDS', '300'))
+# Open streams per worker process; keep well below gunicorn --threads so plain routes always get a thread
+SESSION_MAX_STREAMS = int(os.getenv('SESSION_MAX_STREAMS', '16'))
+# Seconds a client turned away at SESSION_MAX_STREAMS should wait before trying again
+SESSION_STREAM_RETRY = 30
+# Threads running session requests
+SESSION_WORKERS = int(os.getenv('SESSION_WORKERS', '8'))
+# Events kept per session so a reconnecting stream misses nothing
+SESSION_BACKLOG = 256
+# Explain exchanges kept as context for the next explanation on the same topic
+CONTEXT_TURNS = int(os.getenv('CONTEXT_TURNS', '3'))
+MAX_CONTEXTS = 10000
+
+
+def format_event(seq, event, data):
+    return f"id: {seq}\nevent: {event}\ndata: {data}\n\n"
+
+
+class ConversationContext:
+    """Recent explain exchanges per learner, replacing the process-wide last conversation"""
+
+    def __init__(self, max_entries=MAX_CONTEXTS, turns=CONTEXT_TURNS):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.turns = turns
+        self.lock = threading.Lock()
+
+    def history(self, key, topic):
+        """Messages of the last exchanges on this topic, oldest first"""
+        if not key:
+            return []
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['topic'] != topic:
+                return []
+            self.entries.move_to_end(key)
+            return list(entry['messages'])
+
+    def remember(self, key, topic, messages):
+        if not key:
+            return
+        with self.lock:
+            self.entries[key] = {'topic': topic, 'messages': messages[-2 * self.turns:]}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SessionRequest:
+    def __init__(self, request_id, kind, channel):
+        self.id = request_id
+        self.kind = kind
+        self.channel = channel
+        self.cancelled = threading.Event()
+        # Id of the request this one superseded on its channel, if any
+        self.superseded = None
+
+
+class Session:
+    """Event backlog, requests in flight and context of one client session"""
+
+    def __init__(self, session_id, user_id):
+        self.id = session_id
+        self.user_id = user_id
+        self.events = deque(maxlen=SESSION_BACKLOG)
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.requests = {}
+        # channel -> id of the request running on it
+        self.channels = {}
+        self.streams = 0
+        # Bumped by each new stream; an older stream of the session stops when it changes
+        self.stream_generation = 0
+        self.last_seen = time.time()
+        self.closed = False
+
+    @property
+    def context_key(self):
+        return self.user_id or f"session:{self.id}"
+
+    def touch(self):
+        self.last_seen = time.time()
+
+    def emit(self, event, data):
+        with self.condition:
+            self.seq += 1
+            self.events.append((self.seq, event, json.dumps(data)))
+            self.condition.notify_all()
+
+    def wait_events(self, last_id, timeout, generation=None):
+        """Events after last_id, waiting up to timeout for the first one"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > last_id or self.closed or self.replaced(generation), timeout)
+            return [entry for entry in self.events if entry[0] > last_id]
+
+    def replaced(self, generation):
+        return generation is not None and generation != self.stream_generation
+
+    def start(self, request_id, kind, channel=None):
+        with self.condition:
+            if request_id in self.requests:
+                raise ValueError(f"Request {request_id} is already running")
+            superseded = self.channels.get(channel) if channel else None
+            session_request = SessionRequest(request_id, kind, channel)
+            session_request.superseded = superseded
+            self.requests[request_id] = session_request
+            if channel:
+                self.channels[channel] = request_id
+        if superseded:
+            self.cancel(superseded, 'superseded')
+        self.touch()
+        return session_request
+
+    def cancel(self, request_id, reason='cancelled'):
+        with self.condition:
+            session_request = self.requests.get(request_id)
+        if session_request is None or session_request.cancelled.is_set():
+            return False
+        session_request.cancelled.set()
+        self.emit('cancelled', {'id': request_id, 'reason': reason})
+        return True
+
+    def finish(self, session_request):
+        with self.condition:
+            self.requests.pop(session_request.id, None)
+            if self.channels.get(session_request.channel) == session_request.id:
+                del self.channels[session_request.channel]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            pending = list(self.requests)
+            self.condition.notify_all()
+        for request_id in pending:
+            self.cancel(request_id)
+
+    def idle(self, now):
+        return not self.streams and not self.requests and now - self.last_seen > SESSION_IDLE_TIMEOUT
+
+
+class SessionStream:
+    """SSE lines of one open stream; holds one of the manager's stream slots until closed"""
+
+    def __init__(self, manager, session, last_id):
+        self.manager = manager
+        self.session = session
+        self.last_id = last_id
+        self.released = False
+        with session.condition:
+            session.streams += 1
+            session.stream_generation += 1
+            self.generation = session.stream_generation
+            # Wake the stream this one replaces
+            session.condition.notify_all()
+
+    def __iter__(self):
+        session = self.session
+        yield 'retry: 2000\n\n'
+        deadline = time.monotonic() + SESSION_STREAM_SECONDS
+        while not session.closed and not session.replaced(self.generation) and time.monotonic() < deadline:
+            events = session.wait_events(self.last_id, SESSION_HEARTBEAT, self.generation)
+            if session.replaced(self.generation):
+                break
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for seq, event, data in events:
+                yield format_event(seq, event, data)
+                self.last_id = seq
+            session.touch()
+
+    def close(self):
+        """Called by the WSGI server when the response ends, even if it was never iterated"""
+        if self.released:
+            return
+        self.released = True
+        with self.session.condition:
+            self.session.streams -= 1
+        self.session.touch()
+        self.manager._release_stream()
+
+
+class SessionManager:
+    def __init__(self, max_sessions=MAX_SESSIONS, max_streams=SESSION_MAX_STREAMS, workers=SESSION_WORKERS):
+        self.sessions = {}
+        self.max_sessions = max_sessions
+        self.max_streams = max_streams
+        self.open_streams = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='session')
+        self.lock = threading.Lock()
+        self.stats = {'created': 0, 'requests': 0, 'superseded': 0, 'cancelled': 0, 'expired': 0,
+                      'streams_refused': 0}
+
+    def create(self, user_id=None):
+        session = Session(uuid.uuid4().hex, user_id)
+        with self.lock:
+            self._expire()
+            if len(self.sessions) >= self.max_sessions:
+                # Drop the least recently seen session rather than refuse a new tab
+                oldest = min(self.sessions.values(), key=lambda s: s.last_seen)
+                self.sessions.pop(oldest.id).close()
+            self.sessions[session.id] = session
+            self.stats['created'] += 1
+        return session
+
+    def _expire(self):
+        now = time.time()
+        for session in [s for s in self.sessions.values() if s.idle(now)]:
+            self.sessions.pop(session.id).close()
+            self.stats['expired'] += 1
+
+    def get(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    def close(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def submit(self, session, request_id, kind, channel, run, admit=None):
+        """Run run(session_request, ticket) on the session pool and send its result as an event.
+
+        admit() is called on the posting thread and may wait for, or raise
+        instead of, the ticket run gets; run releases it. run returns the
+        result body, or None when it stopped because the request was cancelled.
+        """
+        session_request = session.start(request_id, kind, channel)
+        try:
+            ticket = admit() if admit is not None else None
+        except Exception:
+            session.finish(session_request)
+            raise
+        with self.lock:
+            self.stats['requests'] += 1
+            if session_request.superseded:
+                self.stats['superseded'] += 1
+
+        def task():
+            try:
+                if session_request.cancelled.is_set():
+                    return
+                result = run(session_request, ticket)
+                if result is not None and not session_request.cancelled.is_set():
+                    session.emit('result', {'id': request_id, 'type': kind, 'result': result})
+            except Exception as e:
+                logger.error(f"Session request {kind} {request_id} failed: {str(e)}")
+                session.emit('error', {'id': request_id, 'type': kind, 'error': str(e),
+                                       'retryAfter': getattr(e, 'retry_after', None)})
+            finally:
+                session.finish(session_request)
+
+        self.executor.submit(tracing.bind(task))
+        return session_request
+
+    def cancel(self, session, request_id):
+        cancelled = session.cancel(request_id)
+        if cancelled:
+            with self.lock:
+                self.stats['cancelled'] += 1
+        return cancelled
+
+    def stream(self, session, last_id=0):
+        """A SessionStream of the session's events, or None when SESSION_MAX_STREAMS are open"""
+        with self.lock:
+            if self.open_streams >= self.max_streams:
+                self.stats['streams_refused'] += 1
+                return None
+            self.open_streams += 1
+        return SessionStream(self, session, last_id)
+
+    def _release_stream(self):
+        with self.lock:
+            self.open_streams -= 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "streams": self.open_streams,
+                "maxStreams": self.max_streams,
+                "inflight": sum(len(session.requests) for session in self.sessions.values()),
+                **self.stats,
+            }
+
+
+sessions = SessionManager()
+conversations = ConversationContext()
@@ -0,0 +1,52 @@
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('GYAAN_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+
+def data_path(name):
+    """Absolute path of a file inside the backend data directory"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+class SQLiteStore:
+    """Base class for SQLite-backed stores with one connection per thread"""
+
+    SCHEMA = ""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # WAL lets gunicorn workers read while another worker writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(self.SCHEMA)
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def write(self, sql, params=()):
+        conn = self.connection()
+        with conn:
+            return conn.execute(sql, params)
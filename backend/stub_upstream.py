@@ -0,0 +1,279 @@
+"""Local stand-in for the Anthropic Messages API, Exa search and Perplexity.
+
+Returns deterministic responses so the catalog builder, the load tests and
+the Flask app can be exercised without spending API credits:
+
+    python stub_upstream.py --port 8765 --latency 0.8 --rate-limit-rate 0.05
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 EXA_BASE_URL=http://127.0.0.1:8765 \
+        PERPLEXITY_BASE_URL=http://127.0.0.1:8765 python app.py
+
+Latency, streaming speed, 429s and malformed model output are configurable
+so tests can reproduce slow or misbehaving upstreams.
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from offline_responses import fake_message, malform, prompt_text
+
+logger = logging.getLogger(__name__)
+
+_ids = itertools.count(1)
+
+
+def fake_search_results(query, num_results=5):
+    slug = re.sub(r'[^a-z0-9]+', '-', query.lower()).strip('-')[:40]
+    return {"results": [
+        {"id": f"{slug}-{i}", "url": f"https://example.com/{slug}/{i}", "title": f"Resource {i} for {query}",
+         "score": 1.0 - i / 10, "publishedDate": None, "author": None, "text": ""}
+        for i in range(1, num_results + 1)
+    ]}
+
+
+def fake_perplexity(body, malformed=False):
+    prompt = prompt_text(body)
+    text = f"A real-world example: {prompt[:120]} [1][2]"
+    if malformed:
+        text = malform(text)
+    return {
+        "id": f"pplx_stub_{next(_ids)}",
+        "model": body.get('model', 'stub'),
+        "object": "chat.completion",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+        "citations": ["https://www.example.com/a", "https://example.org/b"],
+        "usage": {"prompt_tokens": max(1, len(prompt) // 4), "completion_tokens": max(1, len(text) // 4),
+                  "total_tokens": max(1, len(prompt) // 4) + max(1, len(text) // 4)},
+    }
+
+
+def _chunks(text, size=16):
+    return [text[i:i + size] for i in range(0, len(text), size)] or ['']
+
+
+class StubState:
+    """Fault/latency knobs plus batches kept in memory for /results"""
+
+    def __init__(self, latency=0.0, jitter=0.0, ttft=0.0, chunk_delay=0.0,
+                 rate_limit_rate=0.0, malformed_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.batches = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def delay(self):
+        with self.lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + extra
+
+    def count(self, path):
+        with self.lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = StubState()
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self._read_json()
+        self.state.count(path)
+        if self.state.roll(self.state.rate_limit_rate):
+            return self._rate_limited(path)
+        if path == '/v1/messages/batches':
+            return self._create_batch(body)
+
+        delay = self.state.delay()
+        malformed = self.state.roll(self.state.malformed_rate)
+        if path == '/v1/messages':
+            message = fake_message(body, malformed)
+            if body.get('stream'):
+                return self._stream_anthropic(message, delay)
+            time.sleep(delay)
+            return self._send_json(message)
+        if path in ('/chat/completions', '/v1/chat/completions'):
+            completion = fake_perplexity(body, malformed)
+            if body.get('stream'):
+                return self._stream_openai(completion, delay,
+                                           bool((body.get('stream_options') or {}).get('include_usage')))
+            time.sleep(delay)
+            return self._send_json(completion)
+        if path == '/search':
+            time.sleep(delay)
+            return self._send_json(fake_search_results(body.get('query', ''), int(body.get('numResults') or 5)))
+        self._send_json({"type": "error", "error": {"type": "not_found_error", "message": path}}, 404)
+
+    def _rate_limited(self, path):
+        if path.startswith('/v1/messages'):
+            payload = {"type": "error", "error": {"type": "rate_limit_error", "message": "stub rate limit"}}
+        else:
+            payload = {"error": {"message": "stub rate limit", "type": "rate_limit_exceeded"}}
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(429)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+    def _event(self, data, event=None):
+        lines = f"event: {event}\n" if event else ""
+        self.wfile.write(f"{lines}data: {json.dumps(data) if not isinstance(data, str) else data}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _stream_anthropic(self, message, delay):
+        """Messages API server-sent events: the first token arrives after ttft"""
+        time.sleep(self.state.ttft or delay)
+        text = message['content'][0]['text']
+        self._start_stream()
+        start = {**message, "content": [], "stop_reason": None,
+                 "usage": {"input_tokens": message['usage']['input_tokens'], "output_tokens": 1}}
+        self._event({"type": "message_start", "message": start}, 'message_start')
+        self._event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                    'content_block_start')
+        for chunk in _chunks(text):
+            self._event({"type": "content_block_delta", "index": 0,
+                         "delta": {"type": "text_delta", "text": chunk}}, 'content_block_delta')
+            if self.state.chunk_delay:
+                time.sleep(self.state.chunk_delay)
+        self._event({"type": "content_block_stop", "index": 0}, 'content_block_stop')
+        self._event({"type": "message_delta",
+                     "delta": {"stop_reason": message['stop_reason'], "stop_sequence": None},
+                     "usage": {"output_tokens": message['usage']['output_tokens']}}, 'message_delta')
+        self._event({"type": "message_stop"}, 'message_stop')
+
+    def _stream_openai(self, completion, delay, include_usage=False):
+        """OpenAI-style chat completion chunks terminated by [DONE]; usage in a chunk of its own if asked"""
+        time.sleep(self.state.ttft or delay)
+        self._start_stream()
+        text = completion['choices'][0]['message']['content']
+        for chunk in _chunks(text):
+            self._event({"id": completion['id'], "object": "chat.completion.chunk", "model": completion['model'],
+                         "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]})
+            if self.state.chunk_delay:
+                time.sleep(self.state.chunk_delay)
+        self._event({"id": completion['id'], "object": "chat.completion.chunk", "model": completion['model'],
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                     "citations": completion['citations'],
+                     **({} if include_usage else {"usage": completion['usage']})})
+        if include_usage:
+            self._event({"id": completion['id'], "object": "chat.completion.chunk", "model": completion['model'],
+                         "choices": [], "usage": completion['usage']})
+        self._event('[DONE]')
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        match = re.match(r'^/v1/messages/batches/([^/]+)(/results)?$', path)
+        if not match or match.group(1) not in self.state.batches:
+            return self._send_json({"type": "error", "error": {"type": "not_found_error", "message": path}}, 404)
+        batch, results = self.state.batches[match.group(1)]
+        if not match.group(2):
+            return self._send_json(batch)
+        body = '\n'.join(json.dumps(line) for line in results).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/binary')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _create_batch(self, body):
+        batch_id = f"msgbatch_stub_{next(_ids)}"
+        results = [
+            {"custom_id": item['custom_id'],
+             "result": {"type": "succeeded", "message": fake_message(item['params'])}}
+            for item in body.get('requests', [])
+        ]
+        now = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        host = self.headers.get('Host', '127.0.0.1')
+        batch = {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended",
+            "request_counts": {"processing": 0, "succeeded": len(results), "errored": 0,
+                               "canceled": 0, "expired": 0},
+            "created_at": now,
+            "ended_at": now,
+            "expires_at": now,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"http://{host}/v1/messages/batches/{batch_id}/results",
+        }
+        with self.state.lock:
+            self.state.batches[batch_id] = (batch, results)
+        self._send_json(batch)
+
+
+def serve(host='127.0.0.1', port=8765, **knobs):
+    """Start the stub in a background thread and return the server"""
+    StubHandler.state = StubState(**knobs)
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    """Stub knobs shared by this script and the load tests"""
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--ttft', type=float, default=0.0, help='time to first token for streamed responses')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='seconds between streamed chunks')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='share of responses with broken JSON')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def knobs_from_args(args):
+    return {
+        "latency": args.latency, "jitter": args.jitter, "ttft": args.ttft, "chunk_delay": args.chunk_delay,
+        "rate_limit_rate": args.rate_limit_rate, "malformed_rate": args.malformed_rate, "seed": args.seed,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    StubHandler.state = StubState(**knobs_from_args(args))
+    print(f'[stub_upstream] listening on http://{args.host}:{args.port}')
+    ThreadingHTTPServer((args.host, args.port), StubHandler).serve_forever()
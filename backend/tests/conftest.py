@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Stores create their databases at import; keep them out of backend/data
+os.environ.setdefault('GYAAN_DATA_DIR', tempfile.mkdtemp(prefix='gyaan-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,52 @@
+import pytest
+
+from admission import AdmissionController, Rejected
+
+CLASSES = {
+    "interactive": {"reserved": 0, "limit": 8, "queue": 4, "max_wait": 0.05},
+    "heavy": {"reserved": 2, "limit": 6, "queue": 4, "max_wait": 0.05},
+}
+
+
+def controller():
+    return AdmissionController(classes=CLASSES, route_classes={}, concurrency=6)
+
+
+def test_released_reserved_slots_are_reusable_while_shared_are_held():
+    admission = controller()
+    heavy = admission.classes["heavy"]
+    tickets = [admission.acquire(heavy) for _ in range(6)]
+    assert [ticket.shared for ticket in tickets] == [False, False, True, True, True, True]
+
+    for ticket in tickets[:2]:
+        ticket.release()
+    assert heavy.reserved_used == 0 and admission.shared_used == 4
+
+    again = admission.acquire(heavy)
+    assert not again.shared
+    assert heavy.reserved_used == 1 and heavy.running == 5
+
+
+def test_release_returns_slot_to_its_pool():
+    admission = controller()
+    heavy = admission.classes["heavy"]
+    reserved, shared = [admission.acquire(heavy) for _ in range(3)][1:]
+    assert not reserved.shared and shared.shared
+
+    shared.release()
+    assert admission.shared_used == 0 and heavy.reserved_used == 2
+    reserved.release()
+    assert heavy.reserved_used == 1
+    reserved.release()
+    assert heavy.reserved_used == 1
+
+
+def test_limit_and_shared_exhaustion_time_out():
+    admission = controller()
+    heavy, interactive = admission.classes["heavy"], admission.classes["interactive"]
+    [admission.acquire(heavy) for _ in range(6)]
+    with pytest.raises(Rejected, match='timed out'):
+        admission.acquire(heavy)
+    with pytest.raises(Rejected, match='timed out'):
+        admission.acquire(interactive)
+    assert heavy.rejected["timeout"] == 1
@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import json
+import os
+
+import pytest
+
+from bundle_files import (BUNDLE_VERSION, MANIFEST_NAME, bundle_key, load_manifest, normalize_key, prune,
+                          write_bundle, write_manifest)
+
+
+def bundle(topic, proficiency='beginner', goals=('Learn the basics',)):
+    return {"version": BUNDLE_VERSION, "topic": topic, "proficiency": proficiency, "goals": list(goals)}
+
+
+def export(out_dir, bundles, rendered):
+    """export_bundles.export without the rendering: write, merge into the manifest, write it"""
+    for item in rendered:
+        bundles[bundle_key(item['topic'], item['proficiency'])] = write_bundle(out_dir, item)
+    write_manifest(out_dir, bundles)
+    return bundles
+
+
+def assert_consistent(out_dir):
+    bundles = load_manifest(out_dir)
+    for key, entry in bundles.items():
+        with open(os.path.join(out_dir, entry['file']), 'rb') as f:
+            data = f.read()
+        assert hashlib.sha256(data).hexdigest() == entry['sha256']
+        with open(os.path.join(out_dir, entry['file'] + '.gz'), 'rb') as f:
+            assert gzip.decompress(f.read()) == data
+        assert bundle_key(entry['topic'], entry['proficiency']) == key
+    return bundles
+
+
+def test_unchanged_content_keeps_its_file_and_changes_get_a_new_one(tmp_path):
+    out_dir = str(tmp_path)
+    first = write_bundle(out_dir, bundle('Machine Learning'))
+    assert first['file'].startswith('machine-learning-beginner.')
+    assert write_bundle(out_dir, bundle('Machine Learning'))['file'] == first['file']
+    changed = write_bundle(out_dir, bundle('Machine Learning', goals=['Train a model']))
+    assert changed['file'] != first['file']
+    assert changed['gzipBytes'] == os.path.getsize(os.path.join(out_dir, changed['file'] + '.gz'))
+
+
+def test_prune_keeps_exactly_what_the_manifest_lists(tmp_path):
+    out_dir = str(tmp_path)
+    bundles = export(out_dir, {}, [bundle('Python'), bundle('Rust')])
+    old_python = bundles[bundle_key('Python', 'beginner')]['file']
+    bundles = export(out_dir, load_manifest(out_dir), [bundle('Python', goals=['Write a CLI tool'])])
+    (tmp_path / 'notes.txt').write_text('not a bundle')
+
+    assert prune(out_dir, bundles) == 2
+    assert not os.path.exists(os.path.join(out_dir, old_python))
+    assert not os.path.exists(os.path.join(out_dir, old_python + '.gz'))
+    assert os.path.exists(os.path.join(out_dir, MANIFEST_NAME + '.gz'))
+    assert os.path.exists(os.path.join(out_dir, 'notes.txt'))
+    assert sorted(assert_consistent(out_dir)) == ['python|beginner', 'rust|beginner']
+    assert prune(out_dir, load_manifest(out_dir)) == 0
+
+
+def test_manifest_of_another_version_or_broken_is_ignored(tmp_path):
+    assert load_manifest(str(tmp_path)) == {}
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps({"version": BUNDLE_VERSION + 1, "bundles": {"a|b": {}}}))
+    assert load_manifest(str(tmp_path)) == {}
+    (tmp_path / MANIFEST_NAME).write_text('{"version": ')
+    assert load_manifest(str(tmp_path)) == {}
+
+
+# Expected values are what the frontend's
+# normalizeKey = (value) => String(value).replace(/\s+/g, ' ').trim().toLowerCase() returns
+@pytest.mark.parametrize('value, expected', [
+    ('  Machine\n\tLearning ', 'machine learning'),
+    ('C++  Programming', 'c++ programming'),
+    ('﻿Python Basics　', 'python basics'),
+    ('Py\x1fthon', 'py\x1fthon'),
+    ('İstanbul', 'i̇stanbul'),
+    ('ΣΙΣΥΦΟΣ', 'σισυφος'),
+    (3, '3'),
+])
+def test_bundle_keys_match_the_frontend(value, expected):
+    assert normalize_key(value) == expected
+    assert bundle_key(value, ' Beginner') == f"{expected}|beginner"
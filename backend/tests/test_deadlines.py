@@ -0,0 +1,75 @@
+from concurrent.futures import Future
+import threading
+import time
+
+from deadlines import Deadline, PendingJobs
+
+
+def jobs(**kwargs):
+    return PendingJobs(max_workers=4, **kwargs)
+
+
+def failing():
+    raise RuntimeError('upstream down')
+
+
+def test_deadline_returns_what_finished_and_parks_the_rest():
+    pending = jobs()
+    release = threading.Event()
+    finished = []
+    completed = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return 'practice'
+
+    started = time.monotonic()
+    results, failed, running = pending.gather(
+        {'firstPrinciples': lambda: 'principles', 'keyInformation': failing, 'practiceExercise': slow},
+        Deadline(0.1))
+    assert time.monotonic() - started < 1
+    assert results == {'firstPrinciples': 'principles'}
+    assert list(failed) == ['keyInformation']
+    assert list(running) == ['practiceExercise']
+
+    job_id = pending.park(running['practiceExercise'], 'module')
+    pending.when_all(list(running.values()), lambda values: (finished.append(values), completed.set()))
+    assert pending.status(job_id) == {"status": "pending", "kind": "module"}
+
+    release.set()
+    assert completed.wait(5)
+    assert pending.status(job_id) == {"status": "done", "kind": "module", "result": 'practice'}
+    assert finished == [['practice']]
+
+
+def test_failed_and_expired_jobs():
+    pending = jobs(ttl=0.2)
+    job_id = pending.park(pending.submit(failing), 'roadmap_resources')
+    pending.executor.shutdown(wait=True)
+    assert pending.status(job_id) == {"status": "failed", "kind": "roadmap_resources", "error": 'upstream down'}
+    assert pending.status('unknown') is None
+
+    time.sleep(0.3)
+    # Expired jobs are dropped the next time one is parked
+    done = Future()
+    done.set_result(None)
+    pending.park(done, 'module')
+    assert pending.status(job_id) is None
+
+
+def test_completion_callback_skips_failures():
+    pending = jobs()
+    called = []
+    futures = [pending.submit(lambda: 1), pending.submit(failing)]
+    pending.when_all(futures, called.append)
+    pending.executor.shutdown(wait=True)
+    assert called == []
+
+
+def test_deadline_upstream_timeout_outlives_the_response():
+    deadline = Deadline(0.05, grace=10)
+    time.sleep(0.1)
+    assert deadline.expired() and deadline.remaining() == 0
+    assert 9 < deadline.upstream_timeout() <= 10
+    assert deadline.upstream_timeout(cap=3) == 3
+
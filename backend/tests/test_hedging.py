@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+import hedging
+from hedging import Hedger
+from providers import Completion, LLMProvider, ProviderRouter
+
+
+class Provider(LLMProvider):
+    """Answers after delay seconds, or fails with error"""
+
+    def __init__(self, name, delay=0.0, error=None):
+        super().__init__(name)
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate(self, request):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return Completion(f"from {self.name}", self.name, request.get('model'), output_tokens=3)
+
+
+def hedger(*providers, threshold=0.2):
+    router = ProviderRouter(providers, routes={'*': [provider.name for provider in providers]})
+    hedge = Hedger(router, endpoints=['explain'])
+    hedge._stats('explain').threshold = lambda: threshold
+    return hedge
+
+
+@pytest.fixture(autouse=True)
+def burst(monkeypatch):
+    monkeypatch.setattr(hedging, 'HEDGE_BURST', 5)
+
+
+def test_early_failure_goes_to_the_next_provider_without_waiting():
+    primary, backup = Provider('a', error=RuntimeError('down')), Provider('b')
+    hedge = hedger(primary, backup, threshold=5)
+    start = time.monotonic()
+    assert hedge.generate('explain', {'model': 'm'}).text == 'from b'
+    assert time.monotonic() - start < 1
+    stats = hedge.settings()['endpoints']['explain']
+    assert stats['failovers'] == 1 and stats['hedged'] == 0 and stats['cancelled'] == 0
+
+
+def test_all_attempts_failing_falls_back_to_router_failover():
+    providers = [Provider('a', error=RuntimeError('a down')), Provider('b', error=RuntimeError('b down')),
+                 Provider('c')]
+    hedge = hedger(*providers)
+    assert hedge.generate('explain', {'model': 'm'}).text == 'from c'
+    assert [provider.calls for provider in providers] == [1, 1, 1]
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    primary, backup = Provider('a', delay=1.0), Provider('b')
+    hedge = hedger(primary, backup, threshold=0.1)
+    assert hedge.generate('explain', {'model': 'm'}).text == 'from b'
+    stats = hedge.settings()['endpoints']['explain']
+    assert stats['hedged'] == 1 and stats['hedge_wins'] == 1 and stats['cancelled'] == 1
+
+
+def test_failed_attempt_is_not_counted_as_cancelled():
+    primary, backup = Provider('a', delay=0.3, error=RuntimeError('late failure')), Provider('b', delay=0.5)
+    hedge = hedger(primary, backup, threshold=0.1)
+    assert hedge.generate('explain', {'model': 'm'}).text == 'from b'
+    stats = hedge.settings()['endpoints']['explain']
+    assert stats['hedged'] == 1 and stats['cancelled'] == 0
+
+
+def test_single_provider_failure_is_raised():
+    hedge = hedger(Provider('a', error=RuntimeError('down')))
+    with pytest.raises(RuntimeError, match='down'):
+        hedge.generate('explain', {'model': 'm'})
@@ -0,0 +1,51 @@
+import pytest
+from flask import Flask
+
+from http_cache import COMPRESS_MIN_SIZE, finalize_response
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    body = {'sections': ['x' * COMPRESS_MIN_SIZE]}
+
+    @app.route('/roadmap/<roadmap_id>')
+    def get_roadmap(roadmap_id):
+        return body
+
+    @app.route('/generate_roadmap', methods=['POST'])
+    def generate_roadmap():
+        return body
+
+    app.after_request(finalize_response)
+    return app.test_client()
+
+
+def test_matching_if_none_match_gets_a_304(client):
+    first = client.get('/roadmap/r1')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    again = client.get('/roadmap/r1', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    stale = client.get('/roadmap/r1', headers={'If-None-Match': 'W/"other"'})
+    assert stale.status_code == 200
+
+
+def test_compressed_body_keeps_its_etag(client):
+    plain = client.get('/roadmap/r1')
+    gzipped = client.get('/roadmap/r1', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] == plain.headers['ETag']
+    assert client.get('/roadmap/r1', headers={'Accept-Encoding': 'gzip',
+                                              'If-None-Match': plain.headers['ETag']}).status_code == 304
+
+
+def test_posts_get_no_etag(client):
+    response = client.post('/generate_roadmap')
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-store'
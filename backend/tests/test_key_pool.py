@@ -0,0 +1,102 @@
+import anthropic
+import httpx
+import openai
+import pytest
+
+import key_pool
+from key_pool import KeyPool, KeysExhausted, retryable
+
+REQUEST = httpx.Request('POST', 'https://api.example.com/v1/messages')
+
+
+def status_error(sdk, status, headers=None):
+    response = httpx.Response(status, request=REQUEST, headers=headers or {})
+    return sdk.APIStatusError(f"status {status}", response=response, body=None)
+
+
+@pytest.mark.parametrize('sdk', [anthropic, openai])
+def test_retryable_classification(sdk):
+    assert retryable(sdk.APIConnectionError(request=REQUEST))
+    assert retryable(sdk.APITimeoutError(request=REQUEST))
+    for status in (429, 401, 403, 500, 529):
+        assert retryable(status_error(sdk, status)), status
+    for status in (400, 404, 422):
+        assert not retryable(status_error(sdk, status)), status
+    assert not retryable(ValueError('bad output'))
+
+
+class Client:
+    def __init__(self, key):
+        self.key = key
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(key_pool, 'KEY_CONNECTION_RETRY_DELAY', 0.0)
+
+
+def test_connection_errors_are_retried_on_the_same_key():
+    pool = KeyPool('test', ['k1'], Client)
+    calls = []
+
+    def fn(client):
+        calls.append(client.key)
+        if len(calls) == 1:
+            raise anthropic.APITimeoutError(request=REQUEST)
+        return 'ok'
+
+    assert pool.call(fn) == 'ok'
+    assert calls == ['k1', 'k1']
+    # Not the key's fault, so it does not sit out
+    assert pool.snapshot()[0]['cooling_s'] == 0
+
+
+def test_rate_limited_key_sits_out_and_another_key_is_used():
+    pool = KeyPool('test', ['k1', 'k2'], Client)
+    calls = []
+
+    def fn(client):
+        calls.append(client.key)
+        if client.key == 'k1':
+            raise status_error(anthropic, 429, {'retry-after': '30'})
+        return client.key
+
+    assert pool.call(fn) == 'k2'
+    assert calls == ['k1', 'k2']
+    assert pool.call(fn) == 'k2'
+    assert calls == ['k1', 'k2', 'k2']
+    cooling = {entry['key']: entry['cooling_s'] for entry in pool.snapshot()}
+    assert cooling['k1'] > 25 and cooling['k2'] == 0
+
+
+def test_client_errors_are_not_retried():
+    pool = KeyPool('test', ['k1', 'k2'], Client)
+    calls = []
+
+    def fn(client):
+        calls.append(client.key)
+        raise status_error(openai, 400)
+
+    with pytest.raises(openai.APIStatusError):
+        pool.call(fn)
+    assert len(calls) == 1
+
+
+def test_attempts_are_bounded():
+    pool = KeyPool('test', ['k1'], Client)
+    calls = []
+
+    def fn(client):
+        calls.append(client.key)
+        raise openai.APIConnectionError(request=REQUEST)
+
+    with pytest.raises(openai.APIConnectionError):
+        pool.call(fn)
+    assert len(calls) == pool.attempts() == 2
+
+
+def test_exhausted_pool_raises_when_the_wait_is_too_long():
+    pool = KeyPool('test', ['k1'], Client)
+    pool.keys[0].cooldown_until = float('inf')
+    with pytest.raises(KeysExhausted):
+        pool.call(lambda client: 'never')
@@ -0,0 +1,29 @@
+from library import ContentLibrary, content_key
+
+
+def test_content_found_under_another_user_is_recorded_for_the_requester(tmp_path):
+    library = ContentLibrary(str(tmp_path / 'library.db'))
+    key = content_key('python', 'closures')
+    library.record('a', 'explanations', 'python', {'content': 'capture'}, key)
+    shared = []
+
+    payload = library.find('explanations', key, 'b', on_shared=lambda payload, topic: shared.append(topic))
+
+    assert payload == {'content': 'capture'}
+    assert shared == ['python']
+    items, _ = library.list('b', 'explanations')
+    assert [item['topic'] for item in items] == ['python']
+
+    # The requester's own row is found next time, without recording again
+    library.find('explanations', key, 'b', on_shared=lambda payload, topic: shared.append(topic))
+    assert shared == ['python']
+    assert len(library.list('b', 'explanations')[0]) == 1
+
+
+def test_anonymous_lookup_records_nothing(tmp_path):
+    library = ContentLibrary(str(tmp_path / 'library.db'))
+    key = content_key('python', 'closures')
+    library.record('a', 'explanations', 'python', {'content': 'capture'}, key)
+
+    assert library.find('explanations', key) == {'content': 'capture'}
+    assert library.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 1
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from mini_modules import MiniModuleStore, card_module_id
+
+pool = ThreadPoolExecutor(1)
+
+
+def start(store, topic, card, generate):
+    module_id = store.start(topic, card, generate, pool.submit)
+    future = store.future(module_id)
+    if future is not None:
+        wait([future])
+    return module_id
+
+
+def test_modules_are_keyed_by_card_context():
+    first = card_module_id('python', {'title': 'python', 'description': 'for data analysis'})
+    second = card_module_id('python', {'title': 'python', 'description': 'for web backends'})
+
+    assert first != second
+
+
+def test_stale_module_is_served_while_it_regenerates(tmp_path):
+    store = MiniModuleStore(str(tmp_path / 'mini.db'), ttl=60)
+    card = {'title': 'Closures', 'description': 'functions that capture'}
+    generations = []
+
+    def generate(topic, card):
+        generations.append(card['title'])
+        return {'summary': f"v{len(generations)}"}
+
+    module_id = start(store, 'python', card, generate)
+    assert store.fresh(store.get(module_id))
+    start(store, 'python', card, generate)
+    assert generations == ['Closures']
+
+    store.write('UPDATE mini_modules SET updated_at = updated_at - 120')
+    assert not store.fresh(store.get(module_id))
+
+    def fail(topic, card):
+        raise RuntimeError('upstream down')
+
+    start(store, 'python', card, fail)
+    assert store.get(module_id)['content'] == {'summary': 'v1'}
+
+    start(store, 'python', card, generate)
+    stored = store.get(module_id)
+    assert store.fresh(stored) and stored['content'] == {'summary': 'v2'}
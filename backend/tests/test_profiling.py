@@ -0,0 +1,13 @@
+from profiling import PROFILE_MAX_INTERVAL_MS, PROFILE_MAX_SECONDS, StackSampler
+
+
+def test_unbounded_durations_are_clamped():
+    sampler = StackSampler()
+    try:
+        profile = sampler.start('inf', 'inf')
+        assert profile.seconds == PROFILE_MAX_SECONDS
+        assert profile.interval_ms == PROFILE_MAX_INTERVAL_MS
+        assert sampler.status()['running']
+    finally:
+        sampler.stop()
+    assert not sampler.running
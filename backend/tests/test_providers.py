@@ -0,0 +1,35 @@
+import pytest
+
+import stub_upstream
+from offline_responses import fake_message
+from providers import OfflineProvider, OpenAICompatibleProvider
+
+
+@pytest.fixture
+def upstream():
+    server = stub_upstream.serve(port=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_openai_stream_is_charged_the_usage_the_server_reports(upstream):
+    provider = OpenAICompatibleProvider('openai', ['key'], base_url=upstream)
+    request = {"model": "gpt-4o", "system": "Be brief.", "max_tokens": 200,
+               "messages": [{"role": "user", "content": "Explain closures in Python in a few sentences."}]}
+    deltas = []
+
+    completion = provider.stream_complete(request, on_text=deltas.append)
+
+    reported = stub_upstream.fake_perplexity(provider._params(request))['usage']
+    assert ''.join(deltas) == completion.text
+    assert completion.input_tokens == reported['prompt_tokens'] > 0
+    assert completion.output_tokens == reported['completion_tokens']
+
+
+def test_offline_provider_does_not_need_the_stub_server():
+    request = {"model": "offline", "messages": [{"role": "user", "content": "Write a mini learning module"}]}
+
+    completion = OfflineProvider().generate(request)
+
+    assert completion.text == fake_message(request)['content'][0]['text']
+    assert completion.input_tokens > 0
@@ -0,0 +1,13 @@
+import question_bank
+from question_bank import QuestionBank, module_hash
+
+
+def test_section_questions_from_an_older_prompt_are_not_reused(tmp_path, monkeypatch):
+    bank = QuestionBank(str(tmp_path / 'questions.db'))
+    sections = [('keyInformation', 'Closures capture variables from the enclosing scope.')]
+    bank.put(module_hash('python', sections), 'python', sections, {'keyInformation': ['What is captured?']})
+
+    assert bank.find_section(sections[0][1]) == ['What is captured?']
+
+    monkeypatch.setattr(question_bank, 'QUESTIONS_PROMPT_VERSION', '2')
+    assert bank.find_section(sections[0][1]) is None
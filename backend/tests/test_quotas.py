@@ -0,0 +1,83 @@
+import threading
+
+from quotas import QuotaLedger
+
+
+def ledger(tmp_path, **kwargs):
+    # A long interval, so only the flushes the tests make count
+    return QuotaLedger(str(tmp_path / 'quotas.db'), enabled=True, window=3600, budget=1000,
+                       flush_interval=3600, **kwargs)
+
+
+def test_used_is_unchanged_by_a_flush(tmp_path):
+    quotas = ledger(tmp_path)
+    quotas.charge(300, account='a')
+    quotas.charge(200, account='a')
+    assert quotas.used('a') == 500
+
+    quotas.flush()
+    assert quotas.used('a') == 500
+    quotas.flush()
+    assert quotas.used('a') == 500
+
+    quotas.charge(100, account='a')
+    assert quotas.used('a') == 600
+    quotas.flush()
+    assert quotas.used('a') == 600
+    assert quotas.used('b') == 0
+
+
+def test_charges_from_every_thread_are_counted_once(tmp_path):
+    quotas = ledger(tmp_path)
+
+    def work():
+        for _ in range(50):
+            quotas.charge(2, account='a')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert quotas.used('a') == 400
+    quotas.flush()
+    assert quotas.used('a') == 400
+    row = quotas.execute('SELECT tokens, calls FROM usage WHERE account = ?', ('a',)).fetchone()
+    assert (row['tokens'], row['calls']) == (400, 200)
+
+
+def test_flushed_totals_are_shared_with_other_workers(tmp_path):
+    first, second = ledger(tmp_path), ledger(tmp_path)
+    first.charge(700, account='a')
+    first.flush()
+    second.charge(400, account='a')
+
+    second.flush()
+    assert second.used('a') == 1100
+    assert second.over_budget('a')
+    first.flush()
+    assert first.used('a') == 1100
+
+
+def test_shards_of_exited_threads_are_dropped_after_a_flush(tmp_path):
+    quotas = ledger(tmp_path)
+
+    def request():
+        quotas.charge(5, account='a')
+
+    for _ in range(50):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    assert quotas.used('a') == 250
+
+    quotas.flush()
+    assert quotas.shards == []
+    assert quotas.flushed == {}
+    assert quotas.used('a') == 250
+
+    request()
+    assert quotas.used('a') == 255
+    quotas.flush()
+    assert len(quotas.shards) == 1 and quotas.used('a') == 255
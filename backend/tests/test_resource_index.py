@@ -0,0 +1,98 @@
+import pytest
+
+import resource_index as resource_index_module
+from resource_index import ResourceIndex, canonical_url, clean_url, singular, terms
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resource_index_module.time, 'time', clock.time)
+    return clock
+
+
+def index(tmp_path, **kwargs):
+    return ResourceIndex(str(tmp_path / 'resources.db'), **{'enabled': True, 'ttl': 100, 'min_matches': 2, **kwargs})
+
+
+def results(*names):
+    return [{"url": f"https://www.example.com/{name}?utm_source=exa", "title": f"{name.title()} guide"}
+            for name in names]
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.Example.com/a//b/?utm_source=x&b=2&a=1#intro', 'example.com/a/b?a=1&b=2'),
+    ('http://example.com:80', 'example.com/'),
+    ('https://example.com:8443/docs/', 'example.com:8443/docs'),
+    ('https://example.com/?fbclid=1&ref=hn', 'example.com/'),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+
+def test_clean_url_keeps_the_url_but_drops_tracking():
+    assert clean_url('https://www.example.com/a?utm_medium=x&page=2#top') == 'https://www.example.com/a?page=2#top'
+
+
+def test_terms_fold_plurals_and_drop_stopwords():
+    assert terms('The Best Python Decorators tutorials') == ['python', 'decorator']
+    assert terms('Classes and CSS basics for node.js') == ['class', 'css', 'basic', 'node.js']
+    assert terms('C++ vs C# data structures') == ['c++', 'c#', 'data', 'structure']
+    assert terms('Libraries, boxes and hashes') == ['library', 'box', 'hash']
+    assert terms('Data analysis with pandas status codes 1990s') == [
+        'data', 'analysis', 'panda', 'status', 'code', '1990s']
+    assert terms('decorator decorators') == ['decorator']
+    assert [singular(word) for word in ('class', 'gas', 'news', 'apis')] == ['class', 'gas', 'new', 'api']
+
+
+def test_duplicates_in_one_search_are_merged(tmp_path, clock):
+    resources = index(tmp_path)
+    added = resources.add('python', [*results('a'), {"url": "http://example.com/a#x", "title": "Again"}])
+    assert added == [{"title": "A guide", "url": "https://www.example.com/a", "domain": "example.com"}]
+    assert resources.counters['duplicates'] == 1
+
+
+def test_other_topics_need_min_matches_on_every_term(tmp_path, clock):
+    resources = index(tmp_path)
+    resources.add('advanced python decorators', results('closures'))
+    assert not resources.lookup('python decorator').hit
+
+    resources.add('python decorators in depth', results('wraps'))
+    resources.add('python basics', results('lists'))
+    found = resources.lookup('Python  decorator')
+    assert found.hit and found.source == 'terms'
+    assert sorted(resource['title'] for resource in found.resources) == ['Closures guide', 'Wraps guide']
+    # A term only one resource matches is not enough
+    assert not resources.lookup('python closures').hit
+
+
+def test_searched_topics_go_stale_after_the_ttl(tmp_path, clock):
+    resources = index(tmp_path)
+    resources.add('rust ownership', results('borrowing', 'lifetimes'))
+    found = resources.lookup('Rust Ownership')
+    assert found.hit and found.source == 'topic'
+
+    clock.now += 101
+    stale = resources.lookup('rust ownership')
+    assert stale.stale and not stale.hit and len(stale.resources) == 2
+    # Stale resources never answer other topics by their terms
+    assert not resources.lookup('ownership rust').resources
+
+    resources.add('ownership', results('borrowing', 'moves'))
+    assert resources.lookup('rust ownership').stale
+    assert resources.lookup('ownership').hit
+    assert resources.counters['stale'] == 2
+
+
+def test_disabled_index_always_misses(tmp_path, clock):
+    resources = index(tmp_path, enabled=False)
+    resources.add('python', results('a', 'b', 'c'))
+    assert resources.lookup('python').resources == []
@@ -0,0 +1,51 @@
+import sqlite3
+
+from review import DAY, ReviewStore, parse_grade
+
+ITEMS = [('question', 'Python', f'Question {i}', 'Answer') for i in range(5)]
+
+
+def test_counts_follow_enrollment_grades_and_deletes(tmp_path):
+    store = ReviewStore(str(tmp_path / 'review.db'))
+    item_ids = store.enroll('u1', ITEMS)
+    store.enroll('u1', ITEMS[:2])
+    store.enroll('u2', ITEMS[:1])
+    now = store.queue('u1')[0]['due'] + 1
+    assert store.counts('u1', now=now) == {"due": 5, "dueToday": 5, "total": 5}
+
+    # Six days out after two passing reviews; the forgotten one is back in ten minutes
+    store.grade('u1', item_ids[0], parse_grade('good'), now=now)
+    store.grade('u1', item_ids[0], parse_grade('good'), now=now)
+    store.grade('u1', item_ids[1], parse_grade('again'), now=now)
+    assert store.counts('u1', now=now) == {"due": 3, "dueToday": 4, "total": 5}
+    assert store.counts('u1', now=now + DAY) == {"due": 4, "dueToday": 4, "total": 5}
+
+    assert store.delete('u1', item_ids[2])
+    assert not store.delete('u1', item_ids[2])
+    assert store.counts('u1', now=now) == {"due": 2, "dueToday": 3, "total": 4}
+    assert store.counts('u2', now=now)['total'] == 1
+    assert store.counts('nobody') == {"due": 0, "dueToday": 0, "total": 0}
+
+
+def test_due_counts_scan_the_due_index():
+    store = ReviewStore(':memory:')
+    plan = store.execute('EXPLAIN QUERY PLAN SELECT COUNT(*) FROM review_items WHERE user_id = ? AND due <= ?',
+                         ('u1', 0)).fetchall()
+    assert 'COVERING INDEX review_items_due' in plan[0]['detail']
+
+
+def test_totals_are_backfilled_for_existing_stores(tmp_path):
+    path = str(tmp_path / 'review.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(ReviewStore.SCHEMA.split('CREATE TABLE IF NOT EXISTS review_totals')[0])
+    conn.executemany('INSERT INTO review_items (user_id, item_id, kind, topic, prompt, ease, due, created_at) '
+                     "VALUES (?, ?, 'question', 'Python', 'Prompt', 2.5, 0, 0)",
+                     [('u1', 'a'), ('u1', 'b'), ('u2', 'c')])
+    conn.commit()
+    conn.close()
+
+    store = ReviewStore(path)
+    assert store.counts('u1')['total'] == 2
+    store.enroll('u1', ITEMS[:1])
+    assert store.counts('u1')['total'] == 3
+    assert store.counts('u2')['total'] == 1
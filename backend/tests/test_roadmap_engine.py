@@ -0,0 +1,161 @@
+import threading
+import time
+
+import pytest
+
+from roadmap_engine import (ADOPTED_PREFIX, SECTION_INPUTS, RoadmapEngine, RoadmapStore, section_input_hash,
+                            uses_goals)
+
+SECTIONS = tuple(SECTION_INPUTS)
+
+
+class Sections:
+    """generate_section stand-in that records calls and fails the titles in fail"""
+
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+
+    def __call__(self, title, topic, proficiency, goals_text):
+        with self.lock:
+            self.calls.append(title)
+        if title in self.fail:
+            raise RuntimeError(f"{title} failed")
+        return f"## {title}\n\n{topic} {proficiency} {goals_text if uses_goals(title) else ''}"
+
+
+def engine(tmp_path, generate):
+    return RoadmapEngine(RoadmapStore(str(tmp_path / 'roadmaps.db')), generate, sections=SECTIONS)
+
+
+def resources(topic):
+    return [{"title": topic, "url": "https://example.com"}]
+
+
+def test_section_hash_covers_exactly_the_inputs_its_prompt_uses():
+    for title in SECTIONS:
+        same_goals = section_input_hash(title, 'python', 'beginner', '- a')
+        other_goals = section_input_hash(title, 'python', 'beginner', '- b')
+        assert (same_goals != other_goals) == uses_goals(title)
+        assert section_input_hash(title, 'rust', 'beginner', '- a') != same_goals
+        assert section_input_hash(title, 'python', 'advanced', '- a') != same_goals
+    assert section_input_hash(SECTIONS[0], 'python', 'beginner', '') != section_input_hash(
+        SECTIONS[1], 'python', 'beginner', '')
+
+
+def test_goal_edit_regenerates_only_goal_sections(tmp_path):
+    generate = Sections()
+    roadmaps = engine(tmp_path, generate)
+    first = roadmaps.generate('python', 'beginner', '- a', resources)
+    assert sorted(first['regenerated']) == sorted(SECTIONS)
+
+    generate.calls.clear()
+    edited = roadmaps.generate('python', 'beginner', '- b', resources, roadmap_id=first['roadmapId'])
+    assert sorted(generate.calls) == sorted(title for title in SECTIONS if uses_goals(title))
+    assert edited['roadmapId'] == first['roadmapId']
+
+
+def test_failed_section_falls_back_and_is_retried(tmp_path):
+    roadmaps = engine(tmp_path, Sections(fail={'Advanced Topics'}))
+    response = roadmaps.generate('python', 'beginner', '- a', resources)
+
+    assert response['failed'] == ['Advanced Topics']
+    failed = next(section for section in response['sections'] if section['title'] == 'Advanced Topics')
+    assert failed['needsRefresh'] and 'could not be generated' in failed['content']
+    assert len([section for section in response['sections'] if not section['needsRefresh']]) == len(SECTIONS) - 1
+
+    roadmaps.generate_section = Sections()
+    retried = roadmaps.generate('python', 'beginner', '- a', resources, roadmap_id=response['roadmapId'])
+    assert retried['regenerated'] == ['Advanced Topics'] and retried['failed'] == []
+
+
+def test_failed_section_keeps_the_previous_content(tmp_path):
+    roadmaps = engine(tmp_path, Sections())
+    first = roadmaps.generate('python', 'beginner', '- a', resources)
+    roadmaps.generate_section = Sections(fail={'Core Concepts'})
+    edited = roadmaps.generate('python', 'beginner', '- b', resources, roadmap_id=first['roadmapId'])
+
+    core = next(section for section in edited['sections'] if section['title'] == 'Core Concepts')
+    assert core['content'].endswith('- a') and core['needsRefresh']
+
+
+def test_every_section_failing_raises(tmp_path):
+    roadmaps = engine(tmp_path, Sections(fail=SECTIONS))
+    with pytest.raises(RuntimeError):
+        roadmaps.generate('python', 'beginner', '- a', resources)
+
+
+def test_adopt_is_idempotent_per_user_and_edits_fork(tmp_path):
+    roadmaps = engine(tmp_path, Sections())
+    payload = roadmaps.generate('python', 'beginner', '- a', resources)
+
+    adopted = roadmaps.adopt('python', 'beginner', '- a', payload, user_id='u1')
+    assert adopted.startswith(ADOPTED_PREFIX)
+    assert roadmaps.adopt('python', 'beginner', '- a', payload, user_id='u1') == adopted
+    assert roadmaps.adopt('python', 'beginner', '- a', payload, user_id='u2') != adopted
+
+    refreshed = roadmaps.refresh_section(adopted, 0, user_id='u1')
+    assert refreshed['roadmapId'] != adopted
+    assert roadmaps.get(adopted, 'u1') is not None
+
+
+def test_concurrent_roadmaps_generate_in_parallel_and_fetch_resources_at_once(tmp_path):
+    def slow_section(title, topic, proficiency, goals_text):
+        time.sleep(0.2)
+        return f"## {title}\n\n{topic}"
+
+    # Room for the sections of one roadmap only
+    roadmaps = RoadmapEngine(RoadmapStore(str(tmp_path / 'roadmaps.db')), slow_section, sections=SECTIONS,
+                             max_workers=len(SECTIONS))
+    start = time.monotonic()
+    fetch_started = []
+
+    def fetch(topic):
+        fetch_started.append(time.monotonic() - start)
+        return resources(topic)
+
+    threads = [threading.Thread(target=roadmaps.generate, args=(topic, 'beginner', '- a', fetch))
+               for topic in ('python', 'rust')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The second roadmap's sections queue, but neither lookup waits behind them
+    assert len(fetch_started) == 2 and max(fetch_started) < 0.1
+
+    roadmaps = RoadmapEngine(RoadmapStore(str(tmp_path / 'wide.db')), slow_section, sections=SECTIONS,
+                             max_workers=2 * len(SECTIONS))
+    start = time.monotonic()
+    threads = [threading.Thread(target=roadmaps.generate, args=(topic, 'beginner', '- a', resources))
+               for topic in ('python', 'rust')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start < 0.35
+
+
+def test_batch_plan_requests_shared_sections_once(tmp_path):
+    roadmaps = engine(tmp_path, Sections())
+    stored = roadmaps.generate('python', 'beginner', '- a', resources)
+    plans, missing = roadmaps.plan_batch({
+        'p0': ('python', 'beginner', '- b'),
+        'p1': ('python', 'beginner', '- c'),
+        'p2': ('rust', 'beginner', '- b'),
+        'p3': ('rust', 'beginner', '- b'),
+    })
+
+    goal_sections = [title for title in SECTIONS if uses_goals(title)]
+    shared_sections = [title for title in SECTIONS if not uses_goals(title)]
+    # Python's shared sections are stored; Rust's are requested once for both of its pairs
+    for title in shared_sections:
+        assert plans['p0'][title] == plans['p1'][title] == (
+            next(s['content'] for s in stored['sections'] if s['title'] == title), None)
+        assert plans['p2'][title][1] == plans['p3'][title][1] is not None
+    assert [plans['p3'][title] for title in goal_sections] == [plans['p2'][title] for title in goal_sections]
+    assert len({plans[key][title][1] for key in ('p0', 'p1', 'p2') for title in goal_sections}) == 3 * len(
+        goal_sections)
+    assert len(missing) == 3 * len(goal_sections) + len(shared_sections)
+    assert all(missing[plans['p2'][title][1]] == (title, 'rust', 'beginner', '- b') for title in SECTIONS)
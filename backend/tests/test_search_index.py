@@ -0,0 +1,82 @@
+import sqlite3
+
+from search_index import SearchIndex, build_match_query
+
+
+def index(tmp_path):
+    return SearchIndex(str(tmp_path / 'search.db'))
+
+
+def titles(results):
+    return sorted(result['title'] for result in results)
+
+
+def test_same_key_is_kept_per_user(tmp_path):
+    search = index(tmp_path)
+    search.add('python:decorators', 'explanation', 'Decorators', 'wrap functions', topic='python', user_id='a')
+    search.add('python:decorators', 'explanation', 'Decorators', 'wrap functions', topic='python', user_id='b')
+
+    assert len(search.search('wrap', user_id='a')) == 1
+    assert len(search.search('wrap', user_id='b')) == 1
+    assert search.count() == 2
+
+
+def test_reindex_replaces_only_the_users_own_copy(tmp_path):
+    search = index(tmp_path)
+    search.add('k', 'module', 'Old', 'closures explained', user_id='a')
+    search.add('k', 'module', 'Old', 'closures explained', user_id='b')
+    search.add('k', 'module', 'New', 'closures revisited', user_id='b')
+
+    assert titles(search.search('closures', user_id='a')) == ['Old']
+    assert titles(search.search('closures', user_id='b')) == ['New']
+
+
+def test_users_see_their_own_and_shared_documents_only(tmp_path):
+    search = index(tmp_path)
+    search.add('mine', 'module', 'Mine', 'recursion basics', user_id='a')
+    search.add('theirs', 'module', 'Theirs', 'recursion basics', user_id='b')
+    search.add('shared', 'roadmap', 'Shared', 'recursion basics')
+
+    assert titles(search.search('recursion', user_id='a')) == ['Mine', 'Shared']
+    assert titles(search.search('recursion')) == ['Shared']
+
+
+def test_owner_tokens_are_not_matched_by_query_words(tmp_path):
+    search = index(tmp_path)
+    search.add('k', 'module', 'Title', 'body text', user_id='a')
+    assert search.search('ownershared', user_id='a') == []
+
+
+def test_topic_and_kind_filters(tmp_path):
+    search = index(tmp_path)
+    search.add('1', 'module', 'Loops', 'iteration', topic='python', user_id='a')
+    search.add('2', 'example', 'Loops', 'iteration', topic='rust', user_id='a')
+
+    assert [r['topic'] for r in search.search('iteration', user_id='a', topic='python')] == ['python']
+    assert [r['kind'] for r in search.search('iteration', user_id='a', kind='example')] == ['example']
+
+
+def test_documents_of_the_first_schema_are_migrated(tmp_path):
+    path = str(tmp_path / 'search.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+    CREATE VIRTUAL TABLE documents USING fts5(title, body, topic, kind UNINDEXED, user_id UNINDEXED,
+                                              ref UNINDEXED, created_at UNINDEXED);
+    CREATE TABLE document_keys (doc_key TEXT PRIMARY KEY, doc_rowid INTEGER NOT NULL) WITHOUT ROWID;
+    INSERT INTO documents (rowid, title, body, topic, kind, user_id, ref, created_at)
+        VALUES (1, 'Generators', 'lazy sequences', 'python', 'module', 'a', 'r', 0);
+    INSERT INTO document_keys VALUES ('k', 1);
+    """)
+    conn.commit()
+    conn.close()
+
+    search = SearchIndex(path)
+    assert titles(search.search('lazy', user_id='a')) == ['Generators']
+    assert search.search('lazy', user_id='b') == []
+    assert search.execute("SELECT name FROM sqlite_master WHERE name = 'documents'").fetchone() is None
+
+
+def test_match_query_prefixes_the_last_word():
+    assert build_match_query('Python deco') == '"python" "deco"*'
+    assert build_match_query('a b') == '"a" "b"'
+    assert build_match_query('!!') is None
@@ -0,0 +1,140 @@
+import json
+import threading
+
+import pytest
+
+from sessions import ConversationContext, SessionManager
+
+
+def wait_for(session, event, timeout=5):
+    """Data of the first `event` in the session's backlog, waiting for it if needed"""
+    last_id = 0
+    while True:
+        entries = session.wait_events(last_id, timeout)
+        assert entries, f"no {event} event"
+        for seq, name, data in entries:
+            if name == event:
+                return json.loads(data)
+            last_id = seq
+
+
+def test_results_stream_as_events_and_replay_after_reconnect():
+    manager = SessionManager(workers=2)
+    session = manager.create('u1')
+
+    def run(session_request, ticket):
+        session.emit('delta', {'id': session_request.id, 'text': 'Hel'})
+        return {'explanation': 'Hello'}
+
+    manager.submit(session, 'r1', 'explain', 'explain', run)
+    assert wait_for(session, 'result') == {'id': 'r1', 'type': 'explain', 'result': {'explanation': 'Hello'}}
+
+    stream = manager.stream(session)
+    lines = iter(stream)
+    assert next(lines) == 'retry: 2000\n\n'
+    assert next(lines).startswith('id: 1\nevent: delta\n')
+    assert next(lines).startswith('id: 2\nevent: result\n')
+    stream.close()
+
+    # A reconnect with Last-Event-ID gets only what it missed
+    stream = manager.stream(session, last_id=1)
+    lines = iter(stream)
+    next(lines)
+    assert next(lines).startswith('id: 2\nevent: result\n')
+    stream.close()
+    assert manager.snapshot()['streams'] == 0
+
+
+def test_new_request_supersedes_the_one_on_its_channel():
+    manager = SessionManager(workers=2)
+    session = manager.create()
+    started = threading.Event()
+
+    def slow(session_request, ticket):
+        started.set()
+        session_request.cancelled.wait(5)
+        return None if session_request.cancelled.is_set() else {'explanation': 'stale'}
+
+    manager.submit(session, 'r1', 'explain', 'explain', slow)
+    assert started.wait(5)
+    second = manager.submit(session, 'r2', 'explain', 'explain', lambda request, ticket: {'explanation': 'new'})
+    assert second.superseded == 'r1'
+    assert wait_for(session, 'cancelled') == {'id': 'r1', 'reason': 'superseded'}
+    assert wait_for(session, 'result')['id'] == 'r2'
+
+    manager.executor.shutdown(wait=True)
+    assert [name for _, name, _ in session.events] == ['cancelled', 'result']
+    assert session.requests == {} and session.channels == {}
+    assert manager.snapshot()['superseded'] == 1
+
+
+def test_failed_admission_frees_the_request_id():
+    manager = SessionManager(workers=1)
+    session = manager.create()
+
+    def refuse():
+        raise RuntimeError('overloaded')
+
+    with pytest.raises(RuntimeError):
+        manager.submit(session, 'r1', 'examples', None, lambda request, ticket: {}, admit=refuse)
+    assert session.requests == {}
+    manager.submit(session, 'r1', 'examples', None, lambda request, ticket: {'examples': []})
+    assert wait_for(session, 'result')['result'] == {'examples': []}
+
+
+def test_run_errors_are_sent_as_events():
+    manager = SessionManager(workers=1)
+    session = manager.create()
+
+    def fail(session_request, ticket):
+        raise RuntimeError('upstream down')
+
+    manager.submit(session, 'r1', 'questions', None, fail)
+    assert wait_for(session, 'error') == {'id': 'r1', 'type': 'questions', 'error': 'upstream down',
+                                          'retryAfter': None}
+
+
+def test_stream_slots_are_limited_and_a_reconnect_replaces_the_old_stream():
+    manager = SessionManager(max_streams=2)
+    session = manager.create()
+    first = manager.stream(session)
+    first_lines = iter(first)
+    next(first_lines)
+
+    second = manager.stream(session)
+    assert manager.stream(manager.create()) is None
+    assert manager.snapshot()['streams_refused'] == 1
+    # The replaced stream ends instead of holding its slot until it times out
+    assert list(first_lines) == []
+    first.close()
+    first.close()
+    assert manager.snapshot()['streams'] == 1
+    assert manager.stream(manager.create()) is not None
+    second.close()
+
+
+def test_closing_a_session_cancels_its_requests():
+    manager = SessionManager(workers=1)
+    session = manager.create()
+    release = threading.Event()
+    manager.submit(session, 'r1', 'explain', 'explain',
+                   lambda request, ticket: release.wait(5) and None)
+    assert manager.close(session.id)
+    assert wait_for(session, 'cancelled') == {'id': 'r1', 'reason': 'cancelled'}
+    assert manager.get(session.id) is None
+    release.set()
+
+
+def test_context_is_per_topic_and_keeps_the_last_turns():
+    conversations = ConversationContext(max_entries=2, turns=1)
+    conversations.remember('u1', 'python', [{'role': 'user', 'content': 'a'},
+                                            {'role': 'assistant', 'content': 'b'},
+                                            {'role': 'user', 'content': 'c'},
+                                            {'role': 'assistant', 'content': 'd'}])
+    assert [message['content'] for message in conversations.history('u1', 'python')] == ['c', 'd']
+    assert conversations.history('u1', 'rust') == []
+    assert conversations.history(None, 'python') == []
+
+    conversations.remember('u2', 'python', [])
+    conversations.remember('u3', 'python', [])
+    assert conversations.history('u1', 'python') == []
@@ -0,0 +1,73 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from deadlines import Deadline, PendingJobs
+from stub_upstream import serve
+from utils import extract_json_object
+
+CARDS_PROMPT = {"model": "stub", "max_tokens": 1000,
+                "messages": [{"role": "user", "content": "Create learning cards for Python at a beginner level."}]}
+
+
+@pytest.fixture
+def upstream():
+    servers = []
+
+    def start(**knobs):
+        server = serve(port=0, **knobs)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(base_url, path, body):
+    request = urllib.request.Request(base_url + path, data=json.dumps(body).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_messages_are_deterministic_and_well_formed(upstream):
+    base_url = upstream()
+    first = post(base_url, '/v1/messages', CARDS_PROMPT)
+    assert first['content'][0]['text'] == post(base_url, '/v1/messages', CARDS_PROMPT)['content'][0]['text']
+    assert len(json.loads(first['content'][0]['text'])['cards']) == 3
+    assert post(base_url, '/search', {"query": "python", "numResults": 2})['results'][1]['url'] == (
+        'https://example.com/python/2')
+
+
+def test_rate_limits_carry_retry_after(upstream):
+    base_url = upstream(rate_limit_rate=1.0)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(base_url, '/v1/messages', CARDS_PROMPT)
+    assert error.value.code == 429
+    assert error.value.headers['Retry-After'] == '1'
+    assert json.loads(error.value.read())['error']['type'] == 'rate_limit_error'
+
+
+def test_malformed_output_is_repaired_by_the_parser(upstream):
+    text = post(upstream(malformed_rate=1.0), '/v1/messages', CARDS_PROMPT)['content'][0]['text']
+    with pytest.raises(ValueError):
+        json.loads(text)
+    assert len(extract_json_object(text)['cards']) == 3
+
+
+def test_slow_upstream_is_left_running_past_the_deadline(upstream):
+    base_url = upstream(latency=0.4)
+    pending = PendingJobs(max_workers=2)
+    started = time.monotonic()
+    results, failed, running = pending.gather({
+        'search': lambda: post(base_url, '/search', {"query": "python"}),
+        'local': lambda: 'cached',
+    }, Deadline(0.1))
+    assert time.monotonic() - started < 0.3
+    assert results == {'local': 'cached'} and not failed
+    assert len(running['search'].result(timeout=5)['results']) == 5
@@ -0,0 +1,48 @@
+import pytest
+
+from topic_index import TopicIndex, tokenize
+
+THRESHOLD = 0.85
+
+
+@pytest.fixture
+def index():
+    topics = TopicIndex()
+    for topic in ['machine learning', 'music theory', 'python', 'rust', 'linear algebra']:
+        topics.add(topic, 'beginner')
+    return topics
+
+
+def test_learning_is_kept_in_compound_topics():
+    assert tokenize('machine learning') == ['machine', 'learning']
+    assert tokenize('learning python') == ['python']
+    assert tokenize('I want to learn machine learning') == ['machine', 'learning']
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('python programming', 'python'),
+    ('learn python basics', 'python'),
+    ('machine learning', 'machine learning'),
+    ('learn machine learning', 'machine learning'),
+    ('music theory basics', 'music theory'),
+])
+def test_near_duplicates_match(index, query, expected):
+    assert index.match(query, 'beginner', THRESHOLD)[0] == expected
+
+
+@pytest.mark.parametrize('query', ['machine', 'music', 'algebra', 'rust programming language design'])
+def test_other_subjects_do_not_match(index, query):
+    assert index.match(query, 'beginner', THRESHOLD) is None
+
+
+def test_matches_stay_within_the_proficiency(index):
+    assert index.match('python', 'advanced', THRESHOLD) is None
+
+
+def test_incremental_adds_grow_the_index(index):
+    for i in range(600):
+        index.add(f"topic {i}", 'beginner')
+    index.add('python', 'beginner')
+    assert len(index) == 605
+    assert index.match('topic 599', 'beginner', THRESHOLD)[0] == 'topic 599'
+    assert index.match('learn python', 'beginner', THRESHOLD)[0] == 'python'
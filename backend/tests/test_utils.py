@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from utils import MarkdownStream, parse_goals, parse_markdown_content
+
+PIECES = ['#', '##', 'Title', ' ', '  ', '\t', '\n', '\n\n', ' \n', '-', '---', '*', '**bold**',
+          '1.', '1.5', 'hours', 'C#', 'word', '12.', '2)']
+
+
+def streamed(text, rng):
+    stream = MarkdownStream()
+    shown = []
+    start = 0
+    while start < len(text):
+        size = rng.randint(1, 6)
+        shown.append(stream.feed(text[start:start + size]))
+        start += size
+    shown.append(stream.flush())
+    return ''.join(shown)
+
+
+def test_stream_matches_the_whole_text_however_it_is_chunked():
+    rng = random.Random(0)
+    for _ in range(5000):
+        text = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 30)))
+        assert streamed(text, rng) == parse_markdown_content(text), repr(text)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('C# and F# are languages', 'C# and F# are languages'),
+    ('**bold** text', '**bold** text'),
+    ('Above\n---\nBelow', 'Above\n---\nBelow'),
+    ('Takes 1.5 hours', 'Takes 1.5 hours'),
+    ('1.5 hours', '1.5 hours'),
+    ('##Title\n-item\n1.  Step', '## Title\n- item\n1. Step'),
+    ('One\n\n\n\nTwo', 'One\n\nTwo'),
+])
+def test_markdown_fixes(text, expected):
+    assert parse_markdown_content(text) == expected
+    assert streamed(text, random.Random(1)) == expected
+
+
+def test_stream_shows_a_paragraph_before_it_ends():
+    stream = MarkdownStream()
+    assert stream.feed('Recursion is ') == 'Recursion is'
+    assert stream.feed('a function calling itself') == ' a function calling itself'
+    assert stream.flush() == ''
+
+
+def test_goals_skip_intros_and_fragments():
+    content = ('Here are your learning goals:\n'
+               '1. Understand how recursion unwinds the stack\n'
+               '- Key learning goals for the week\n'
+               '- Base cases\n'
+               '* Write a recursive tree traversal')
+    assert parse_goals(content) == ['Understand how recursion unwinds the stack',
+                                    'Write a recursive tree traversal']
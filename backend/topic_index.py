@@ -0,0 +1,189 @@
+import logging
+import re
+import threading
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Words that say how someone wants to learn, not what they want to learn
+STOPWORDS = {
+    'a', 'an', 'and', 'the', 'of', 'to', 'for', 'in', 'on', 'with', 'how', 'what', 'is',
+    'learn', 'learning', 'study', 'studying', 'understand', 'understanding', 'master', 'mastering',
+    'intro', 'introduction', 'introductory', 'basic', 'basics', 'fundamental', 'fundamentals',
+    'beginner', 'beginners', 'advanced', 'intermediate', 'guide', 'tutorial', 'course', 'crash',
+    'overview', 'essentials', 'getting', 'started', 'start', 'i', 'want', 'about',
+}
+
+# Stopwords that name the subject when they follow another word: "machine learning", "language understanding"
+COMPOUND_WORDS = {'learning', 'understanding', 'study'}
+
+# Kept, but weighted down and not needed for a match: "python programming" is still mostly "python".
+# Words that make a different subject ("music theory") do not belong here
+GENERIC_WORDS = {
+    'programming', 'language', 'languages', 'development', 'skills', 'concepts', 'principles',
+}
+GENERIC_WEIGHT = 0.3
+# A content word counts as present in the other topic at this trigram (Dice) similarity, so typos still match
+WORD_MATCH_SIMILARITY = 0.5
+# Rows allocated at a time, so adding topics one by one is not quadratic
+GROWTH_ROWS = 256
+CHAR_NGRAM_WEIGHT = 0.5
+VECTOR_DIM = 1024
+
+_TOKEN_RE = re.compile(r"[a-z0-9+#]+")
+
+
+def tokenize(topic):
+    """Lowercased content words of a topic with plural 's' stripped"""
+    tokens = []
+    after_content = False
+    for token in _TOKEN_RE.findall(str(topic).lower()):
+        if token in STOPWORDS and not (after_content and token in COMPOUND_WORDS):
+            after_content = False
+            continue
+        after_content = True
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _trigrams(word):
+    padded = f' {word} '
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _similar(a, b):
+    if a == b:
+        return True
+    grams_a, grams_b = set(_trigrams(a)), set(_trigrams(b))
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b)) >= WORD_MATCH_SIMILARITY
+
+
+def content_words(tokens):
+    return [token for token in tokens if token not in GENERIC_WORDS]
+
+
+def covers(tokens, other):
+    """Every content word of tokens has a (possibly misspelt) counterpart in other"""
+    other = content_words(other)
+    return all(any(_similar(word, candidate) for candidate in other) for word in content_words(tokens))
+
+
+def features(topic):
+    """Weighted word and character-trigram features of a topic"""
+    weights = {}
+    for token in tokenize(topic):
+        weight = GENERIC_WEIGHT if token in GENERIC_WORDS else 1.0
+        weights['w:' + token] = weights.get('w:' + token, 0.0) + weight
+        grams = _trigrams(token)
+        for gram in grams:
+            key = 'c:' + gram
+            weights[key] = weights.get(key, 0.0) + weight * CHAR_NGRAM_WEIGHT / len(grams)
+    return weights
+
+
+def _bucket(feature):
+    return zlib.crc32(feature.encode('utf-8')) % VECTOR_DIM
+
+
+class TopicIndex:
+    """Hashed TF-IDF vectors of known topics with cosine nearest-neighbour lookup"""
+
+    def __init__(self, dim=VECTOR_DIM):
+        self.dim = dim
+        self._topics = []
+        self._tokens = []
+        self._proficiencies = []
+        self._known = set()
+        # Preallocated rows; only the first len(self._topics) are in use
+        self._tf = np.zeros((0, dim), dtype=np.float32)
+        self._matrix = None
+        self._idf = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._topics)
+
+    def _vector(self, topic):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in features(topic).items():
+            vec[_bucket(feature)] += weight
+        return vec
+
+    def _append(self, pairs):
+        """Add new (topic, proficiency) pairs; the caller holds the lock"""
+        n = len(self._topics)
+        needed = n + len(pairs)
+        if needed > self._tf.shape[0]:
+            grown = np.zeros((max(needed, 2 * self._tf.shape[0], GROWTH_ROWS), self.dim), dtype=np.float32)
+            grown[:n] = self._tf[:n]
+            self._tf = grown
+        for row, (topic, proficiency) in enumerate(pairs, start=n):
+            self._tf[row] = self._vector(topic)
+            self._topics.append(topic)
+            self._tokens.append(tokenize(topic))
+            self._proficiencies.append(proficiency)
+        self._known.update(pairs)
+        self._matrix = None
+
+    def add(self, topic, proficiency):
+        self.add_many([(topic, proficiency)])
+
+    def add_many(self, pairs):
+        with self._lock:
+            new = [pair for pair in dict.fromkeys(pairs) if pair not in self._known]
+            if new:
+                self._append(new)
+
+    def _normalized(self):
+        """Row-normalised TF-IDF matrix, rebuilt lazily after additions"""
+        if self._matrix is None:
+            tf = self._tf[:len(self._topics)]
+            n = tf.shape[0]
+            df = np.count_nonzero(tf, axis=0)
+            self._idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+            weighted = tf * self._idf
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._matrix = weighted / norms
+        return self._matrix
+
+    def _search(self, topic, proficiency, limit):
+        """(row, score) of the most similar known topics at the same proficiency; the caller holds the lock"""
+        if not self._topics:
+            return []
+        matrix = self._normalized()
+        query = self._vector(topic) * self._idf
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = matrix @ (query / norm)
+        same_level = np.fromiter((p == proficiency for p in self._proficiencies), dtype=bool,
+                                 count=len(self._proficiencies))
+        scores = np.where(same_level, scores, -1.0)
+        order = np.argsort(-scores)[:limit]
+        return [(i, float(scores[i])) for i in order if scores[i] > 0]
+
+    def search(self, topic, proficiency, limit=3):
+        """Most similar known topics at the same proficiency as (topic, score) pairs"""
+        with self._lock:
+            return [(self._topics[i], score) for i, score in self._search(topic, proficiency, limit)]
+
+    def match(self, topic, proficiency, threshold, candidates=5):
+        """Best known topic above the similarity threshold that names the same subject, or None.
+
+        Similar vectors are not enough: each topic's content words must all
+        have a counterpart in the other, so "machine" never matches "machine
+        learning" and "music" never matches "music theory".
+        """
+        tokens = tokenize(topic)
+        with self._lock:
+            for i, score in self._search(topic, proficiency, candidates):
+                if score < threshold:
+                    break
+                if covers(tokens, self._tokens[i]) and covers(self._tokens[i], tokens):
+                    return self._topics[i], score
+        return None
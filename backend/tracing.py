@@ -0,0 +1,312 @@
+"""Lightweight request tracing: nested timed spans exported as JSONL.
+
+Every request gets a root span, and the work under it (admission wait, prompt
+rendering, each upstream call and retry, parsing, serialization) gets child
+spans with timing and attributes:
+
+    with tracing.span('parse', endpoint='first_principles') as span:
+        ...
+        span.set(items=len(items))
+
+A sampled share of traces (TRACE_SAMPLE_RATE) is written span by span to
+TRACE_PATH, one JSON object per line in an OTLP-like shape. Requests slower
+than TRACE_SLOW_MS are written whole to TRACE_SLOW_PATH, sampled at
+TRACE_SLOW_SAMPLE_RATE, and the latest are kept for GET /api/traces/slow.
+Spans outside a trace are no-ops, so library code can open spans freely.
+"""
+from collections import deque
+import contextvars
+from functools import partial
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+from storage import data_path
+
+logger = logging.getLogger(__name__)
+
+TRACING = os.getenv('TRACING', '1') == '1'
+TRACE_PATH = os.getenv('TRACE_PATH') or data_path('traces.jsonl')
+TRACE_SLOW_PATH = os.getenv('TRACE_SLOW_PATH') or data_path('slow_requests.jsonl')
+# Share of traces whose spans are exported
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+# Requests slower than this are logged whole, at TRACE_SLOW_SAMPLE_RATE
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '5000'))
+TRACE_SLOW_SAMPLE_RATE = float(os.getenv('TRACE_SLOW_SAMPLE_RATE', '1.0'))
+# An export file is rotated to <path>.1 once it grows past this
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', str(50 * 1024 * 1024)))
+SLOW_TRACES_KEPT = 50
+MAX_SPANS_PER_TRACE = 500
+
+_current = contextvars.ContextVar('current_span', default=None)
+# thread id -> (root span name, trace id) of the request the thread is working for,
+# so a stack sampler can attribute what each thread is doing to a route
+active_threads = {}
+
+
+class JsonlExporter:
+    """Appends records to a JSONL file from a background thread, off the request path"""
+
+    def __init__(self, path, max_bytes=TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def export(self, records):
+        if self.thread is None:
+            self._start()
+        for record in records:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < 500:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(records)
+            except Exception as e:
+                logger.error(f"Could not write traces to {self.path}: {str(e)}")
+
+    def _write(self, records):
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+        except OSError:
+            pass
+        with open(self.path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+
+class Trace:
+    def __init__(self, name, sampled):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.sampled = sampled
+        self.spans = []
+        self.lock = threading.Lock()
+        self.finished = False
+
+
+class Span:
+    def __init__(self, tracer, trace, name, parent, attributes):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attributes = attributes
+        self.events = []
+        self.status = 'ok'
+        self.error = None
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_event(self, name, **attributes):
+        self.events.append({"name": name, "at_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                            **attributes})
+
+    def fail(self, error):
+        self.status = 'error'
+        self.error = f"{type(error).__name__}: {str(error)[:200]}"
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        if self.parent is None:
+            active_threads[threading.get_ident()] = (self.trace.name, self.trace.id)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.fail(exc)
+        if self.parent is None:
+            active_threads.pop(threading.get_ident(), None)
+        self.end()
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # Ended in another context (a root span closed by a teardown hook)
+            _current.set(self.parent)
+        return False
+
+    def end(self):
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self.started) * 1000, 2)
+            self.tracer._finished(self)
+
+    def record(self):
+        return {
+            "trace_id": self.trace.id,
+            "span_id": self.id,
+            "parent_id": self.parent.id if self.parent is not None else None,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class NoopSpan:
+    """Stands in for a span when there is no trace to attach it to"""
+
+    trace = None
+    id = None
+
+    def set(self, **attributes):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def fail(self, error):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    def __init__(self, enabled=TRACING, sample_rate=TRACE_SAMPLE_RATE, slow_ms=TRACE_SLOW_MS,
+                 slow_sample_rate=TRACE_SLOW_SAMPLE_RATE):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.slow_sample_rate = slow_sample_rate
+        self.exporter = JsonlExporter(TRACE_PATH)
+        self.slow_exporter = JsonlExporter(TRACE_SLOW_PATH)
+        self.slow = deque(maxlen=SLOW_TRACES_KEPT)
+        self.stats = {"traces": 0, "sampled": 0, "slow": 0}
+
+    def start_trace(self, name, **attributes):
+        """A root span; enter it (or use it as a context manager) to make it current"""
+        if not self.enabled:
+            return NOOP_SPAN
+        trace = Trace(name, sampled=random.random() < self.sample_rate)
+        self.stats["traces"] += 1
+        if trace.sampled:
+            self.stats["sampled"] += 1
+        return Span(self, trace, name, None, attributes)
+
+    def span(self, name, **attributes):
+        """A child of the current span, or a no-op outside a trace"""
+        parent = _current.get()
+        if parent is None or parent.trace is None:
+            return NOOP_SPAN
+        return Span(self, parent.trace, name, parent, attributes)
+
+    def _finished(self, span):
+        trace = span.trace
+        with trace.lock:
+            if len(trace.spans) < MAX_SPANS_PER_TRACE:
+                trace.spans.append(span)
+            late = trace.finished
+            if span.parent is None:
+                trace.finished = True
+        if late:
+            # Background work that outlived its request
+            if trace.sampled:
+                self.exporter.export([span.record()])
+            return
+        if span.parent is None:
+            self._trace_finished(span)
+
+    def _trace_finished(self, root):
+        trace = root.trace
+        with trace.lock:
+            records = [span.record() for span in trace.spans]
+        if trace.sampled:
+            self.exporter.export(records)
+        if root.duration_ms >= self.slow_ms and random.random() < self.slow_sample_rate:
+            self.stats["slow"] += 1
+            entry = {
+                "trace_id": trace.id,
+                "name": root.name,
+                "start": root.start,
+                "duration_ms": root.duration_ms,
+                "attributes": root.attributes,
+                "spans": records,
+            }
+            self.slow.append(entry)
+            self.slow_exporter.export([entry])
+
+    def current(self):
+        return _current.get() or NOOP_SPAN
+
+    def slow_traces(self, limit=SLOW_TRACES_KEPT):
+        return list(self.slow)[-limit:][::-1]
+
+    def settings(self):
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "slow_sample_rate": self.slow_sample_rate,
+            "path": TRACE_PATH,
+            "slow_path": TRACE_SLOW_PATH,
+            "dropped": self.exporter.dropped + self.slow_exporter.dropped,
+            **self.stats,
+        }
+
+
+def bind(fn):
+    """fn bound to the current context, so spans it opens on another thread join this trace"""
+    context = contextvars.copy_context()
+    parent = _current.get()
+    if parent is None or parent.trace is None:
+        return partial(context.run, fn)
+    label = (parent.trace.name, parent.trace.id)
+
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        active_threads[ident] = label
+        try:
+            return context.run(fn, *args, **kwargs)
+        finally:
+            active_threads.pop(ident, None)
+
+    return run
+
+
+tracer = Tracer()
+span = tracer.span
+start_trace = tracer.start_trace
+
+
+def add_event(name, **attributes):
+    """Record an event (a retry, a failover) on the current span"""
+    tracer.current().add_event(name, **attributes)
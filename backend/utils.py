@@ -1,5 +1,6 @@
 from functools import wraps
 from flask import jsonify, request
+import json
 import re
 
 def validate_request(required_fields):
@@ -24,6 +25,42 @@ def validate_request(required_fields):
         return decorated_function
     return decorator
 
+# TextBlock(text='...') reprs from older SDK responses
+TEXT_BLOCK = re.compile(r"text=[\"'](.*?)[\"']", re.DOTALL)
+
+# All markdown fixes in one pattern, so the text is scanned once. Every
+# alternative starts at a newline, which the regex engine can skip to
+# directly, and only matches text it changes:
+#   blank    - runs of blank or whitespace-only lines collapse to one blank line
+#   header   - "##Title" gets a space after the hashes (only at line start, so "C#" and URLs are left alone)
+#   bullet   - "-item", "-   item" and "* item" become "- item" ("**bold**" and "---" are left alone)
+#   number   - "1.item" and "1.   item" become "1. item" ("1.5 hours" is left alone)
+MARKDOWN_FIXES = re.compile(r"""
+    \n(?:
+        (?P<blank>[ \t]+(?:\n[ \t]*)*|(?:[ \t]*\n)+[ \t]*)(?=\n)
+      | (?P<indent>[ \t]*)(?:
+            (?P<hashes>\#{1,6})(?=[^\#\s])
+          | (?:-(?=[^\s-])|-[ \t]{2,}|\*[ \t]+)(?P<bullet>)
+          | (?P<number>\d+)\.(?:[ \t]{2,}|(?=[^\s\d]))
+        )
+    )
+""", re.VERBOSE)
+
+# A line whose first word is followed by more text: every fix of its start is decided
+LINE_START_DECIDED = re.compile(r'[ \t]*\S+[ \t]+\S')
+# List markers and intro lines in goals responses
+GOAL_MARKER = re.compile(r'^(?:[-*+\u2022]|\d+[.)])\s*')
+GOAL_INTRO = re.compile(r'\bhere (?:are|is)\b|learning goals|:$', re.IGNORECASE)
+# Goals of this many words or fewer are fragments, not goal statements
+GOAL_MIN_WORDS = 3
+# A JSON object inside model output, and the trailing commas models leave in it
+JSON_OBJECT = re.compile(r'\{.*\}', re.DOTALL)
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+# Numbered headings and list items in module sections
+SECTION_NUMBER = re.compile(r'^\d+\.\s')
+SECTION_ITEM = re.compile(r'^[-*]\s+')
+
+
 def extract_text_from_response(content):
     """Extract clean text from various response formats"""
     if not content:
@@ -31,54 +68,169 @@ def extract_text_from_response(content):
         
     # Handle TextBlock format
     if isinstance(content, str) and 'TextBlock' in content:
-        match = re.search(r"text=[\"'](.*?)[\"']", content, re.DOTALL)
+        match = TEXT_BLOCK.search(content)
         if match:
             return match.group(1)
     
     return str(content)
 
-def parse_goals(content):
-    """
-    Parse and clean goals from AI response
-    """
-    text = extract_text_from_response(content)
-    
-    # Split by newlines and clean each line
-    lines = text.split('\n')
+def clean_goal_lines(text):
+    """Goal statements from a block of text, without headers, intro lines or list markers"""
     goals = []
-    
-    for line in lines:
+    for line in text.split('\n'):
         line = line.strip()
-        # Skip empty lines, headers, and introductory text
-        if (not line or 
-            line.startswith('#') or 
-            'here are' in line.lower() or
-            'learning goals' in line.lower()):
+        if not line or line.startswith('#') or GOAL_INTRO.search(line):
             continue
-            
-        # Clean up list markers and numbers
-        cleaned = re.sub(r'^\d+\.\s*|-\s*|\*\s*', '', line).strip()
-        
-        # Only add if it's a substantial goal (more than just a few words)
-        if cleaned and len(cleaned.split()) > 3:
+        cleaned = GOAL_MARKER.sub('', line, count=1).strip()
+        if len(cleaned.split()) > GOAL_MIN_WORDS:
             goals.append(cleaned)
-    
     return goals
 
+def parse_goals(content):
+    """
+    Parse a goals response (a JSON list or numbered lines) into a list of goal strings
+    """
+    text = extract_text_from_response(content).replace('\\n', '\n')
+    if text.lstrip().startswith('['):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError:
+            items = None
+        if isinstance(items, list):
+            goals = []
+            for item in items:
+                goals.extend(clean_goal_lines(item['text'] if isinstance(item, dict) and 'text' in item else str(item)))
+            if goals:
+                return goals
+    return clean_goal_lines(text)
+
+def _fix_markdown(match):
+    if match.group('blank') is not None:
+        return '\n'
+    indent = match.group('indent')
+    if match.group('hashes') is not None:
+        return f"\n{indent}{match.group('hashes')} "
+    if match.group('bullet') is not None:
+        return f"\n{indent}- "
+    return f"\n{indent}{match.group('number')}. "
+
+def normalize_markdown(text):
+    """Apply MARKDOWN_FIXES in a single pass"""
+    if text.startswith('\n'):
+        return MARKDOWN_FIXES.sub(_fix_markdown, text)
+    # The first line has no newline before it; lend it one
+    return MARKDOWN_FIXES.sub(_fix_markdown, '\n' + text)[1:]
+
 def parse_markdown_content(content):
     """
     Parse and clean markdown content from AI response
     """
-    text = extract_text_from_response(content)
-    
-    # Remove duplicate newlines
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    
-    # Ensure headers have space after #
-    text = re.sub(r'#([^#\s])', r'# \1', text)
-    
-    # Ensure list items have space after marker
-    text = re.sub(r'^\s*[-*]\s*([^\s])', r'- \1', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*(\d+)\.\s*([^\s])', r'\1. \2', text, flags=re.MULTILINE)
-    
-    return text.strip()
\ No newline at end of file
+    return normalize_markdown(extract_text_from_response(content)).strip()
+
+class MarkdownStream:
+    """Incremental parse_markdown_content for streamed text.
+
+    feed() returns the normalized text that is safe to show so far; the
+    joined output of feed() and flush() equals parse_markdown_content()
+    of the whole text, however it was chunked.
+    """
+
+    def __init__(self):
+        self.pending = ''
+        # Normalized trailing spaces of the last line shown, dropped if the text ends there
+        self.trailing = ''
+        self.started = False
+        # Whether pending continues a line whose start has already been shown
+        self.mid_line = False
+
+    def feed(self, chunk):
+        self.pending += chunk
+        shown = ''
+        # Complete lines can be fixed; trailing blank lines are held back in
+        # case the run continues in the next chunk
+        last_newline = self.pending.rfind('\n')
+        if last_newline >= 0:
+            content_end = len(self.pending[:last_newline].rstrip())
+            if content_end:
+                cut = self.pending.index('\n', content_end)
+                shown += self._emit(self.pending[:cut], self.pending[cut:])
+                self.mid_line = False
+        # So can the line in progress once its first words show which fix its start needs
+        line = self.pending[self.pending.rfind('\n') + 1:]
+        if (self.mid_line and '\n' not in self.pending) or LINE_START_DECIDED.match(line):
+            content_end = len(self.pending.rstrip())
+            if content_end:
+                shown += self._emit(self.pending[:content_end], self.pending[content_end:])
+                self.mid_line = True
+        return shown
+
+    def flush(self):
+        return self._emit(self.pending, '', final=True)
+
+    def _emit(self, text, rest, final=False):
+        if self.mid_line:
+            # Not a line start, so no newline is lent to it
+            text = MARKDOWN_FIXES.sub(_fix_markdown, text)
+        else:
+            text = normalize_markdown(text)
+        self.pending = rest
+        if final:
+            text = text.rstrip()
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        if not text:
+            return ''
+        shown = text.rstrip(' \t')
+        text, self.trailing = self.trailing + shown, text[len(shown):]
+        return text
+
+def extract_json_object(text):
+    """
+    Parse the JSON object in a model response, tolerating extra text, single quotes and trailing commas
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    match = JSON_OBJECT.search(text)
+    if not match:
+        raise ValueError('AI response did not contain a valid JSON object')
+    json_text = TRAILING_COMMA.sub(r'\1', match.group(0))
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError:
+        pass
+    # Single-quoted JSON; only tried last since it breaks apostrophes
+    try:
+        return json.loads(json_text.replace("'", '"'))
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Invalid JSON format from AI response: {e}')
+
+def extract_section_items(content, heading):
+    """
+    List items under a numbered or markdown heading such as "1. Fundamental Truths"
+    """
+    text = extract_text_from_response(content).replace('\\n', '\n')
+    items = []
+    in_section = False
+    for line in text.split('\n'):
+        stripped = line.strip()
+        is_heading = stripped.startswith('#') or SECTION_NUMBER.match(stripped) or (
+            stripped.startswith('**') and stripped.endswith('**'))
+        if is_heading:
+            if in_section and items:
+                break
+            in_section = heading.lower() in stripped.lower()
+            continue
+        if in_section and SECTION_ITEM.match(stripped):
+            item = SECTION_ITEM.sub('', stripped, count=1).strip()
+            if item:
+                items.append(item)
+    return items
+
+def extract_fundamental_truths(content):
+    return extract_section_items(content, 'Fundamental Truths')
+
+def extract_cross_domain_connections(content):
+    return extract_section_items(content, 'Cross-Domain Connections')
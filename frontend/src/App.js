@@ -40,7 +40,7 @@ function App() {
         setLoading(true);
         setLoadingType('module');
         try {
-            const moduleResponse = await generateMiniModule(topic, proficiency);
+            const moduleResponse = await generateMiniModule(topic);
             setCurrentTopic(topic);
             setCurrentProficiency(proficiency);
             
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Box, Button } from '@mui/material';
 import HelpOutlineIcon from '@mui/icons-material/HelpOutline';
-import { explainSentence } from '../services/api';
+import { explainSentence, cancelSessionRequests } from '../services/session';
 import { formatMarkdownText } from '../utils/textFormatting';
 import SideWindow from './SideWindow';
 
@@ -77,14 +77,25 @@ const InteractiveText = ({ children, topic, level = 0 }) => {
     };
   }, []); // Empty dependency array to run only once
 
+  // Shows the explanation as it streams in
+  const showPartialExplanation = () => {
+    let streamed = '';
+    return (text) => {
+      streamed += text;
+      setLoading(false);
+      setExplanation(formatMarkdownText(streamed));
+    };
+  };
+
   const fetchExplanation = async (text) => {
     if (!effectiveTopic) {
       throw new Error('Cannot explain text: topic prop is missing.');
     }
     try {
-      const data = await explainSentence(text, effectiveTopic);
+      const data = await explainSentence(text, effectiveTopic, { onDelta: showPartialExplanation() });
       return formatMarkdownText(data.explanation);
     } catch (error) {
+      if (error.superseded) throw error;
       const errorMessage = error.message.includes('Explanation failed') 
         ? error.message 
         : 'Unable to connect to the server. Please check your connection and try again.';
@@ -104,11 +115,14 @@ const InteractiveText = ({ children, topic, level = 0 }) => {
     try {
       const explanation = await fetchExplanation(text);
       setExplanation(explanation);
+      setLoading(false);
     } catch (error) {
+      // A newer selection took over the panel
+      if (error.superseded) return;
       console.error('Error:', error);
       setExplanation('Failed to fetch explanation. Please try again.');
-    } finally {
       setLoading(false);
+    } finally {
       setShowAskButton(false);
       // Clear the text selection
       window.getSelection().removeAllRanges();
@@ -123,10 +137,11 @@ const InteractiveText = ({ children, topic, level = 0 }) => {
     setSelectedText(userQuestion);
     setExplainedText(userQuestion.trim());
     try {
-      const explanation = await explainSentence(userQuestion, effectiveTopic);
-      setExplanation(formatMarkdownText(explanation.explanation));
       setIsSidePanelOpen(true);
+      const explanation = await explainSentence(userQuestion, effectiveTopic, { onDelta: showPartialExplanation() });
+      setExplanation(formatMarkdownText(explanation.explanation));
     } catch (error) {
+      if (error.superseded) return;
       setExplanation('Sorry, there was an error getting the explanation.');
     } finally {
       setIsProcessing(false);
@@ -205,6 +220,8 @@ const InteractiveText = ({ children, topic, level = 0 }) => {
       <SideWindow
         open={isSidePanelOpen}
         onClose={() => {
+          // Stop an explanation that is still streaming into the closed panel
+          cancelSessionRequests('explain');
           setIsSidePanelOpen(false);
           setSelectedText('');
           setUserQuestion('');
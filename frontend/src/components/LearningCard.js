@@ -3,13 +3,13 @@ import { Card, CardContent, Typography, Box, Chip } from '@mui/material';
 import { useNavigate } from 'react-router-dom';
 import { generateMiniModule } from '../services/api';
 
-const LearningCard = ({ title, description, type, setMiniModuleLoading }) => {
+const LearningCard = ({ topic, title, description, type, moduleId, setMiniModuleLoading }) => {
   const navigate = useNavigate();
 
   const handleCardClick = async () => {
     setMiniModuleLoading(true);
     try {
-      const content = await generateMiniModule(title);
+      const content = await generateMiniModule(topic || title, moduleId, { title, description });
       // Save to localStorage
       const savedModules = JSON.parse(localStorage.getItem('savedModules') || '[]');
       const newModule = {
@@ -22,9 +22,6 @@ const LearningCard = ({ title, description, type, setMiniModuleLoading }) => {
       
       localStorage.setItem('savedModules', JSON.stringify([...savedModules, newModule]));
       
-      // Simulate loading delay
-      await new Promise((resolve) => setTimeout(resolve, 1000));
-      
       // Navigate to the new mini module
       navigate(`/mini-module/${newModule.id}`);
     } catch (error) {
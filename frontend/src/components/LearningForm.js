@@ -34,7 +34,7 @@ const LearningForm = ({ onSubmit }) => {
         setError('');
 
         try {
-            const response = await generateMiniModule(topic.trim(), proficiency);
+            const response = await generateMiniModule(topic.trim());
             
             const savedModules = JSON.parse(localStorage.getItem('savedModules') || '[]');
             const newModule = {
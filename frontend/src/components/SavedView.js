@@ -8,12 +8,28 @@ import {
     Button,
     Divider,
     Link,
+    TextField,
+    Chip,
 } from '@mui/material';
 import DeleteIcon from '@mui/icons-material/Delete';
 import { useNavigate } from 'react-router-dom';
 import ReactMarkdown from 'react-markdown';
+import { listAllLibrary, deleteFromLibrary, searchContent } from '../services/api';
+
+// Search snippets mark matched terms with <mark>; render them without innerHTML
+const Snippet = ({ text }) => (
+    <>
+        {text.split(/(<mark>.*?<\/mark>)/g).map((part, index) => (
+            part.startsWith('<mark>')
+                ? <mark key={index}>{part.slice(6, -7)}</mark>
+                : <React.Fragment key={index}>{part}</React.Fragment>
+        ))}
+    </>
+);
 
 const SavedView = () => {
+    const [query, setQuery] = useState('');
+    const [searchResults, setSearchResults] = useState(null);
     const [savedExplanations, setSavedExplanations] = useState({});
     const [savedExamples, setSavedExamples] = useState({});
     const [moduleIds, setModuleIds] = useState({});
@@ -28,81 +44,114 @@ const SavedView = () => {
         });
         setModuleIds(topicToId);
 
-        // Get all localStorage keys
-        const allKeys = Object.keys(localStorage);
-        
-        // Filter for explanation and example keys
-        const explanationKeys = allKeys.filter(key => key.startsWith('explanations-'));
-        const exampleKeys = allKeys.filter(key => key.startsWith('examples-'));
-        
-        // Build explanations object
-        const explanations = {};
-        explanationKeys.forEach(key => {
-            const topic = key.replace('explanations-', '');
-            try {
-                const topicExplanations = JSON.parse(localStorage.getItem(key) || '[]');
-                if (topicExplanations.length > 0) {
-                    explanations[topic] = topicExplanations;
+        const groupByTopic = (items) => items.reduce((groups, item) => {
+            (groups[item.topic] = groups[item.topic] || []).push(item);
+            return groups;
+        }, {});
+
+        const loadFromServer = async () => {
+            const [explanationItems, exampleItems] = await Promise.all([
+                listAllLibrary('explanations', { saved: true }),
+                listAllLibrary('examples')
+            ]);
+            setSavedExplanations(groupByTopic(explanationItems));
+            setSavedExamples(groupByTopic(exampleItems
+                .filter(item => item.examples && item.examples[0])
+                .map(item => ({
+                    ...item.examples[0],
+                    citations: item.citations || [],
+                    topic: item.topic,
+                    id: item.id
+                }))));
+        };
+
+        // Offline fallback: scan the keys this browser saved itself
+        const loadFromLocalStorage = () => {
+            const allKeys = Object.keys(localStorage);
+            const explanations = {};
+            const examples = {};
+            allKeys.forEach(key => {
+                const target = key.startsWith('explanations-') ? explanations
+                    : key.startsWith('examples-') ? examples : null;
+                if (!target) return;
+                const topic = key.slice(key.indexOf('-') + 1);
+                try {
+                    const items = JSON.parse(localStorage.getItem(key) || '[]');
+                    if (items.length > 0) {
+                        target[topic] = items;
+                    }
+                } catch (error) {
+                    console.error(`Error parsing ${key}:`, error);
                 }
-            } catch (error) {
-                console.error(`Error parsing explanations for ${topic}:`, error);
-            }
+            });
+            setSavedExplanations(explanations);
+            setSavedExamples(examples);
+        };
+
+        loadFromServer().catch((error) => {
+            console.error('Error loading library, using local copies:', error);
+            loadFromLocalStorage();
         });
-        
-        // Build examples object
-        const examples = {};
-        exampleKeys.forEach(key => {
-            const topic = key.replace('examples-', '');
-            try {
-                const topicExamples = JSON.parse(localStorage.getItem(key) || '[]');
-                if (topicExamples.length > 0) {
-                    examples[topic] = topicExamples;
-                }
-            } catch (error) {
-                console.error(`Error parsing examples for ${topic}:`, error);
+    }, []);
+
+    useEffect(() => {
+        if (!query.trim()) {
+            setSearchResults(null);
+            return undefined;
+        }
+        // Search as the user types, once they pause
+        const timer = setTimeout(() => {
+            searchContent(query)
+                .then(data => setSearchResults(data.results))
+                .catch(error => {
+                    console.error('Error searching saved content:', error);
+                    setSearchResults([]);
+                });
+        }, 250);
+        return () => clearTimeout(timer);
+    }, [query]);
+
+    const removeLocal = (storageKey, timestamp) => {
+        const items = JSON.parse(localStorage.getItem(storageKey) || '[]');
+        const remaining = items.filter(item => item.timestamp !== timestamp);
+        if (remaining.length === 0) {
+            localStorage.removeItem(storageKey);
+        } else {
+            localStorage.setItem(storageKey, JSON.stringify(remaining));
+        }
+    };
+
+    const removeFromState = (setter, topic, timestamp) => {
+        setter(prev => {
+            const next = { ...prev };
+            const remaining = (next[topic] || []).filter(item => item.timestamp !== timestamp);
+            if (remaining.length === 0) {
+                delete next[topic];
+            } else {
+                next[topic] = remaining;
             }
+            return next;
         });
-        
-        setSavedExplanations(explanations);
-        setSavedExamples(examples);
-    }, []);
+    };
 
     const handleDelete = (topic, timestamp) => {
-        const topicKey = `explanations-${topic}`;
-        const explanations = JSON.parse(localStorage.getItem(topicKey) || '[]');
-        const updatedExplanations = explanations.filter(exp => exp.timestamp !== timestamp);
-        
-        if (updatedExplanations.length === 0) {
-            localStorage.removeItem(topicKey);
-            const newSavedExplanations = { ...savedExplanations };
-            delete newSavedExplanations[topic];
-            setSavedExplanations(newSavedExplanations);
-        } else {
-            localStorage.setItem(topicKey, JSON.stringify(updatedExplanations));
-            setSavedExplanations(prev => ({
-                ...prev,
-                [topic]: updatedExplanations
-            }));
+        const explanation = (savedExplanations[topic] || []).find(exp => exp.timestamp === timestamp);
+        if (explanation && explanation.id) {
+            deleteFromLibrary('explanations', explanation.id).catch(error =>
+                console.error('Error deleting explanation:', error));
         }
+        removeLocal(`explanations-${topic}`, timestamp);
+        removeFromState(setSavedExplanations, topic, timestamp);
     };
 
     const handleDeleteExample = (topic, timestamp) => {
-        const topicKey = `examples-${topic}`;
-        const examples = JSON.parse(localStorage.getItem(topicKey) || '[]');
-        const updatedExamples = examples.filter(ex => ex.timestamp !== timestamp);
-        
-        if (updatedExamples.length === 0) {
-            localStorage.removeItem(topicKey);
-            const newSavedExamples = { ...savedExamples };
-            delete newSavedExamples[topic];
-            setSavedExamples(newSavedExamples);
-        } else {
-            localStorage.setItem(topicKey, JSON.stringify(updatedExamples));
-            setSavedExamples(prev => ({
-                ...prev,
-                [topic]: updatedExamples
-            }));
+        const example = (savedExamples[topic] || []).find(ex => ex.timestamp === timestamp);
+        if (example && example.id) {
+            deleteFromLibrary('examples', example.id).catch(error =>
+                console.error('Error deleting example:', error));
         }
+        removeLocal(`examples-${topic}`, timestamp);
+        removeFromState(setSavedExamples, topic, timestamp);
     };
 
     const formatDate = (dateString) => {
@@ -116,6 +165,37 @@ const SavedView = () => {
     return (
         <Container maxWidth="lg">
             <Box sx={{ mt: 4, mb: 4 }}>
+                <TextField
+                    fullWidth
+                    placeholder="Search roadmaps, modules, explanations, examples and questions"
+                    value={query}
+                    onChange={(e) => setQuery(e.target.value)}
+                    sx={{ mb: 4 }}
+                />
+
+                {searchResults && (
+                    <Box sx={{ mb: 6 }}>
+                        {searchResults.length === 0 ? (
+                            <Typography variant="body1" color="text.secondary" align="center">
+                                No matches
+                            </Typography>
+                        ) : searchResults.map((result, index) => (
+                            <Paper key={`${result.kind}-${result.ref}-${index}`} sx={{ p: 2, mb: 1 }}>
+                                <Box sx={{ display: 'flex', alignItems: 'center', gap: 1, mb: 1 }}>
+                                    <Chip label={result.kind} size="small" />
+                                    <Typography variant="subtitle1">{result.title}</Typography>
+                                    <Typography variant="caption" color="text.secondary" sx={{ ml: 'auto' }}>
+                                        {result.topic}
+                                    </Typography>
+                                </Box>
+                                <Typography variant="body2" color="text.secondary">
+                                    <Snippet text={result.snippet} />
+                                </Typography>
+                            </Paper>
+                        ))}
+                    </Box>
+                )}
+
                 <Typography variant="h3" gutterBottom align="center">
                     Saved Explanations
                 </Typography>
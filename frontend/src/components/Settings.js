@@ -9,7 +9,12 @@ import {
 
 import theme from './Theme';
 
+// /api/settings only answers requests carrying the server's ADMIN_TOKEN
+const ADMIN_TOKEN_KEY = 'gyaanAdminToken';
+
 const Settings = () => {
+    const [adminToken, setAdminToken] = useState(() => sessionStorage.getItem(ADMIN_TOKEN_KEY) || '');
+
     const [apiKeys, setApiKeys] = useState({
         perplexity: '',
         claude: ''
@@ -20,17 +25,26 @@ const Settings = () => {
         claude: ''
     });
 
+    const adminHeaders = () => ({ 'X-Admin-Token': adminToken });
+
+    const loadSettings = () => fetch('/api/settings', { headers: adminHeaders() })
+        .then(res => {
+            if (!res.ok) throw new Error(`Loading settings failed with ${res.status}`);
+            return res.json();
+        })
+        .then(data => {
+            setStoredKeys({
+                perplexity: data.perplexity,
+                claude: data.claude
+            });
+        });
+
     useEffect(() => {
-        fetch('/api/settings')
-            .then(res => res.json())
-            .then(data => {
-                setStoredKeys({
-                    perplexity: data.perplexity,
-                    claude: data.claude
-                });
-            })
-            .catch(err => console.error('Error loading settings:', err));
-    }, []);
+        if (!adminToken) return;
+        sessionStorage.setItem(ADMIN_TOKEN_KEY, adminToken);
+        loadSettings().catch(err => console.error('Error loading settings:', err));
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [adminToken]);
 
     const handleChange = (e) => {
         const { name, value } = e.target;
@@ -47,6 +61,7 @@ const Settings = () => {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    ...adminHeaders()
                 },
                 body: JSON.stringify({
                     perplexity: apiKeys.perplexity,
@@ -58,11 +73,7 @@ const Settings = () => {
                 throw new Error('Failed to save settings');
             }
 
-            const data = await fetch('/api/settings').then(res => res.json());
-            setStoredKeys({
-                perplexity: data.perplexity,
-                claude: data.claude
-            });
+            await loadSettings();
 
             setApiKeys({
                 perplexity: '',
@@ -91,6 +102,18 @@ const Settings = () => {
                     flexDirection: 'column', 
                     gap: 2 
                 }}>
+                    <TextField
+                        type="password"
+                        label="Admin Token"
+                        id="adminToken"
+                        name="adminToken"
+                        value={adminToken}
+                        onChange={(e) => setAdminToken(e.target.value)}
+                        fullWidth
+                        variant="outlined"
+                        placeholder="ADMIN_TOKEN of the server"
+                    />
+
                     <TextField
                         type="password"
                         label="Perplexity API Key"
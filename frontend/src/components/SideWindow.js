@@ -1,7 +1,8 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { formatMarkdownText } from '../utils/textFormatting';
 import InteractiveText from './InteractiveText';
-import { generateQuestions, generateExamples } from '../services/api';
+import { saveToLibrary } from '../services/api';
+import { generateQuestions, generateExamples } from '../services/session';
 import QuestionPanel from './QuestionPanel';
 import { Box, Typography, CircularProgress, IconButton, Link } from '@mui/material';
 import CloseIcon from '@mui/icons-material/Close';
@@ -91,6 +92,8 @@ const SideWindow = ({
       savedExplanations.push(newSavedItem);
       localStorage.setItem(`explanations-${topic}`, JSON.stringify(savedExplanations));
       setIsSaved(true);
+      saveToLibrary('explanations', topic, newSavedItem).catch(error =>
+        console.error('Error saving explanation to library:', error));
     }
   };
 
@@ -100,7 +103,7 @@ const SideWindow = ({
     setIsFetchingQuestions(true);
     setError(null);
     try {
-      const response = await generateQuestions(text);
+      const response = await generateQuestions(text, topic);
       setQuestions(response.questions || []);
     } catch (error) {
       console.error('Error fetching questions:', error);
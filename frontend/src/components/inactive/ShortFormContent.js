@@ -3,7 +3,7 @@ import { Box, MobileStepper, Button } from '@mui/material';
 import { KeyboardArrowLeft, KeyboardArrowRight } from '@mui/icons-material';
 import LearningCard from './LearningCard';
 
-const ShortFormContent = ({ learningCards, setMiniModuleLoading }) => {
+const ShortFormContent = ({ topic, learningCards, setMiniModuleLoading }) => {
   const [activeStep, setActiveStep] = useState(0);
   const maxSteps = learningCards.length;
 
@@ -18,9 +18,11 @@ const ShortFormContent = ({ learningCards, setMiniModuleLoading }) => {
   return (
     <Box sx={{ maxWidth: 400, flexGrow: 1, margin: 'auto', mt: 4 }}>
       <LearningCard
+        topic={topic}
         title={learningCards[activeStep].title}
         description={learningCards[activeStep].description}
         type={learningCards[activeStep].type}
+        moduleId={learningCards[activeStep].moduleId}
         setMiniModuleLoading={setMiniModuleLoading}
       />
 
@@ -1,10 +1,25 @@
 import axios from 'axios';
 import { formatMarkdownText } from '../utils/textFormatting';
 
-const baseURL = process.env.NODE_ENV === 'production'
+export const baseURL = process.env.NODE_ENV === 'production'
     ? 'https://gyaan-public.onrender.com'
     : 'http://localhost:5001';
 
+// Anonymous per-browser id that keys the server-side library. Copy it to
+// another browser's localStorage to share the same library there.
+const USER_ID_KEY = 'gyaanUserId';
+
+export const getUserId = () => {
+    let userId = localStorage.getItem(USER_ID_KEY);
+    if (!userId) {
+        userId = window.crypto?.randomUUID
+            ? window.crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem(USER_ID_KEY, userId);
+    }
+    return userId;
+};
+
 export const api = axios.create({
     baseURL,
     headers: {
@@ -12,8 +27,83 @@ export const api = axios.create({
     }
 });
 
+api.interceptors.request.use((config) => {
+    config.headers['X-Gyaan-User'] = getUserId();
+    return config;
+});
+
+// The server turns requests away with 429 + Retry-After when their class is
+// overloaded; retry once after the suggested delay if it is short
+const MAX_RETRY_AFTER_SECONDS = 5;
+
+api.interceptors.response.use(null, async (error) => {
+    const { config, response } = error;
+    const retryAfter = Number(response?.headers?.['retry-after']);
+    if (response?.status === 429 && config && !config.retriedAfter429
+        && retryAfter > 0 && retryAfter <= MAX_RETRY_AFTER_SECONDS) {
+        config.retriedAfter429 = true;
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+        return api(config);
+    }
+    return Promise.reject(error);
+});
+
+// Learning paths exported by backend/export_bundles.py to a static host. The
+// manifest is read once; a topic listed there loads in a single fetch and
+// never reaches the backend
+const BUNDLE_BASE_URL = process.env.REACT_APP_BUNDLE_BASE_URL?.replace(/\/+$/, '');
+const BUNDLE_VERSION = 1;
+let bundleManifest = null;
+const bundles = new Map();
+// Mini modules of cards served from a bundle, by moduleId
+const bundledMiniModules = new Map();
+
+// Same normalization as the backend's bundle keys (bundle_files.normalize_key)
+const normalizeKey = (value) => String(value).replace(/\s+/g, ' ').trim().toLowerCase();
+const normalizeGoal = (goal) => normalizeKey(String(goal).trim().replace(/^[-*]+/, ''));
+
+const sameGoals = (goals, bundledGoals) => Array.isArray(goals) && Array.isArray(bundledGoals)
+    && goals.length === bundledGoals.length
+    && goals.every((goal, i) => normalizeGoal(goal) === normalizeGoal(bundledGoals[i]));
+
+const fetchJson = async (url) => {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`${url} returned ${response.status}`);
+    }
+    return response.json();
+};
+
+const loadBundleManifest = () => {
+    if (!bundleManifest) {
+        bundleManifest = fetchJson(`${BUNDLE_BASE_URL}/manifest.json`)
+            .then(manifest => (manifest.version === BUNDLE_VERSION ? manifest.bundles : {}))
+            .catch((error) => {
+                console.warn('Bundle manifest unavailable:', error.message);
+                return {};
+            });
+    }
+    return bundleManifest;
+};
+
+// The exported learning path for a topic, or null when there is none
+export const getBundle = async (topic, proficiency) => {
+    if (!BUNDLE_BASE_URL || !topic || !proficiency) return null;
+    const entry = (await loadBundleManifest())[`${normalizeKey(topic)}|${normalizeKey(proficiency)}`];
+    if (!entry) return null;
+    if (!bundles.has(entry.file)) {
+        // Bundle names carry their content hash, so a fetched bundle never goes stale
+        bundles.set(entry.file, fetchJson(`${BUNDLE_BASE_URL}/${entry.file}`).catch(() => null));
+    }
+    return bundles.get(entry.file);
+};
+
 export const generateGoals = async (topic, proficiency) => {
     try {
+        const bundle = await getBundle(topic, proficiency);
+        if (bundle?.goals) {
+            return { goals: bundle.goals };
+        }
         const response = await api.post('/generate_goals', {
             topic,
             proficiency
@@ -25,12 +115,21 @@ export const generateGoals = async (topic, proficiency) => {
     }
 };
 
-export const generateRoadmap = async (topic, goals, proficiency) => {
+// Pass the roadmapId of an existing roadmap when its goals change; only the
+// sections that depend on the goals are regenerated
+export const generateRoadmap = async (topic, goals, proficiency, roadmapId) => {
     try {
+        if (Array.isArray(goals) && !roadmapId) {
+            const bundle = await getBundle(topic, proficiency);
+            if (bundle?.roadmap && sameGoals(goals, bundle.goals)) {
+                return bundle.roadmap;
+            }
+        }
         const response = await api.post('/generate_roadmap', {
             topic,
             goals,
-            proficiency
+            proficiency,
+            roadmapId
         });
         return response.data;
     } catch (error) {
@@ -39,13 +138,53 @@ export const generateRoadmap = async (topic, goals, proficiency) => {
     }
 };
 
-export const generateModuleContent = async (topic, goals, proficiency) => {
+export const refreshRoadmapSection = async (roadmapId, position) => {
+    try {
+        const response = await api.post(`/roadmap/${roadmapId}/sections/${position}/refresh`);
+        return response.data;
+    } catch (error) {
+        console.error('Error in refreshRoadmapSection:', error.response?.data || error.message);
+        throw error;
+    }
+};
+
+export const getPendingJob = async (jobId) => {
+    const response = await api.get(`/pending/${jobId}`);
+    return response.data;
+};
+
+// Polls a section that missed its request's deadline until it is done
+export const waitForPending = async (jobId, { interval = 1500, timeout = 60000 } = {}) => {
+    const giveUpAt = Date.now() + timeout;
+    while (Date.now() < giveUpAt) {
+        const job = await getPendingJob(jobId);
+        if (job.status === 'done') return job.result;
+        if (job.status === 'failed') throw new Error(job.error);
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+    throw new Error(`Timed out waiting for ${jobId}`);
+};
+
+// A partial response lists the sections still being generated under
+// `pending`; onSection receives each one as it arrives
+export const generateModuleContent = async (topic, goals, proficiency, onSection) => {
     try {
+        const bundle = await getBundle(topic, proficiency);
+        if (bundle?.module && sameGoals(goals, bundle.goals)) {
+            return bundle.module;
+        }
         const response = await api.post('/generate_module_content', {
             topic,
             goals,
             proficiency
         });
+        if (onSection && response.data.pending) {
+            Object.entries(response.data.pending).forEach(([section, jobId]) => {
+                waitForPending(jobId)
+                    .then(fields => onSection(section, fields))
+                    .catch(error => console.error(`Error loading ${section}:`, error.message));
+            });
+        }
         return response.data;
     } catch (error) {
         console.error('Error in generateModuleContent:', error.response?.data || error.message);
@@ -90,6 +229,13 @@ export const explainSentence = async (sentence, topic) => {
 
 export const generateLearningCards = async (topic, proficiency) => {
     try {
+        const bundle = await getBundle(topic, proficiency);
+        if (bundle?.cards) {
+            Object.entries(bundle.miniModules || {}).forEach(([moduleId, content]) => {
+                bundledMiniModules.set(moduleId, content);
+            });
+            return bundle.cards;
+        }
         const response = await api.post('/generate_learning_cards', {
             topic,
             proficiency
@@ -101,10 +247,18 @@ export const generateLearningCards = async (topic, proficiency) => {
     }
 };
 
-export const generateMiniModule = async (topic) => {
+// Cards come back with a moduleId whose mini module is already generating;
+// passing it returns the stored module (or waits for the one in flight)
+// card ({ title, description }) lets the server start a module the cards' response no longer has
+export const generateMiniModule = async (topic, moduleId, card) => {
     try {
+        if (bundledMiniModules.has(moduleId)) {
+            return bundledMiniModules.get(moduleId);
+        }
         const response = await api.post('/generate_mini_module', {
-            topic
+            topic,
+            moduleId,
+            card
         });
         return response.data;
     } catch (error) {
@@ -113,10 +267,11 @@ export const generateMiniModule = async (topic) => {
     }
 };
 
-export const generateQuestions = async (text) => {
+export const generateQuestions = async (text, topic) => {
     try {
         const response = await api.post('/generate_questions', {
-            text
+            text,
+            topic
         });
         return response.data;
     } catch (error) {
@@ -125,7 +280,36 @@ export const generateQuestions = async (text) => {
     }
 };
 
-export const generateExamples = async (text, topic, useCached = true) => {
+// Questions for every section of a module in one request, cached server-side by the module's content.
+// Returns { moduleHash, questions: { firstPrinciples: [...], keyInformation: [...], practiceExercise: [...] } }
+export const generateModuleQuestions = async (topic, module) => {
+    try {
+        const response = await api.post('/generate_module_questions', {
+            topic,
+            module: {
+                firstPrinciples: module.firstPrinciples,
+                keyInformation: module.keyInformation,
+                practiceExercise: module.practiceExercise
+            }
+        });
+        if (response.status === 202 && response.data.pending) {
+            const questions = await waitForPending(response.data.pending);
+            return { moduleHash: response.data.moduleHash, questions };
+        }
+        return response.data;
+    } catch (error) {
+        console.error('Error in generateModuleQuestions:', error.response?.data || error.message);
+        throw error;
+    }
+};
+
+const postExamples = async (payload) => {
+    const response = await api.post('/generate_examples', payload);
+    return response.data;
+};
+
+// send delivers the request; the session channel passes its own
+export const generateExamples = async (text, topic, useCached = true, send = postExamples) => {
     try {
         // Validate required parameters
         if (!text || !topic) {
@@ -141,14 +325,12 @@ export const generateExamples = async (text, topic, useCached = true) => {
             return { examples: [existingExample] };
         }
 
-        const response = await api.post('/generate_examples', { 
+        const exampleData = await send({
             text: text.trim(),
             topic: topic.trim(),
-            useCached 
+            useCached
         });
         
-        const exampleData = response.data;
-        
         // Add timestamp if not present
         if (exampleData.examples && exampleData.examples[0]) {
             exampleData.examples[0].timestamp = exampleData.examples[0].timestamp || new Date().toISOString();
@@ -175,4 +357,57 @@ export const generateExamples = async (text, topic, useCached = true) => {
         console.error('API Error:', error);
         throw error;
     }
-};
\ No newline at end of file
+};
+export const listLibrary = async (kind, { topic, saved, cursor, limit } = {}) => {
+    const response = await api.get(`/library/${kind}`, {
+        params: { topic, cursor, limit, saved: saved ? 1 : undefined }
+    });
+    return response.data;
+};
+
+// Follows the paging cursor; maxItems keeps a huge library from blocking the view
+export const listAllLibrary = async (kind, options = {}, maxItems = 1000) => {
+    const items = [];
+    let cursor;
+    do {
+        const page = await listLibrary(kind, { ...options, cursor, limit: 200 });
+        items.push(...page.items);
+        cursor = page.nextCursor;
+    } while (cursor && items.length < maxItems);
+    return items;
+};
+
+export const saveToLibrary = async (kind, topic, item) => {
+    const response = await api.post(`/library/${kind}`, { topic, item, saved: true });
+    return response.data;
+};
+
+export const deleteFromLibrary = async (kind, id) => {
+    const response = await api.delete(`/library/${kind}/${id}`);
+    return response.data;
+};
+
+// Ranked full-text search over generated content; kind is one of
+// roadmap, module, explanation, example, question
+export const searchContent = async (q, { topic, kind, limit } = {}) => {
+    const response = await api.get('/search', { params: { q, topic, kind, limit } });
+    return response.data;
+};
+
+// Spaced repetition over generated questions and explanations.
+// Returns { items, due, dueToday, total }
+export const getReviewQueue = async ({ topic, limit } = {}) => {
+    const response = await api.get('/review/queue', { params: { topic, limit } });
+    return response.data;
+};
+
+// grade is 0-5 or one of 'again', 'hard', 'good', 'easy'
+export const gradeReviewItem = async (itemId, grade) => {
+    const response = await api.post(`/review/items/${itemId}/grade`, { grade });
+    return response.data;
+};
+
+export const addReviewItems = async (items) => {
+    const response = await api.post('/review/items', { items });
+    return response.data;
+};
@@ -0,0 +1,146 @@
+import {
+    api,
+    baseURL,
+    explainSentence as explainOverHttp,
+    generateQuestions as questionsOverHttp,
+    generateExamples as examplesOverHttp
+} from './api';
+
+// One event stream per tab carries the results of explain, example and
+// question requests. Requests are posted as text/plain, which browsers send
+// without a CORS preflight, and a request on a channel supersedes the one
+// still running there. Falls back to the plain HTTP routes when the channel
+// cannot be opened.
+
+let session = null;
+let requestCounter = 0;
+
+const nextRequestId = () => `${Date.now().toString(36)}-${(requestCounter += 1)}`;
+
+const closeSession = (error) => {
+    if (!session) return;
+    const { source, pending } = session;
+    session = null;
+    source.close();
+    pending.forEach(({ reject }) => reject(error));
+};
+
+const openSession = () => {
+    if (session) return session.ready;
+    if (typeof window === 'undefined' || !window.EventSource) {
+        return Promise.reject(new Error('EventSource is not supported'));
+    }
+
+    const pending = new Map();
+    const current = { pending, source: null, id: null };
+    session = current;
+
+    current.ready = api.post('/session').then(({ data }) => new Promise((resolve, reject) => {
+        const source = new EventSource(`${baseURL}/session/${data.sessionId}/events`);
+        current.source = source;
+        current.id = data.sessionId;
+
+        const handle = (type) => (event) => {
+            const message = JSON.parse(event.data);
+            const entry = pending.get(message.id);
+            if (!entry) return;
+            if (type === 'delta') {
+                entry.onDelta?.(message.text);
+                return;
+            }
+            pending.delete(message.id);
+            if (type === 'result') {
+                entry.resolve(message.result);
+            } else if (type === 'cancelled') {
+                const error = new Error(`Request ${message.reason}`);
+                error.superseded = true;
+                entry.reject(error);
+            } else {
+                const error = new Error(message.error);
+                error.requestFailed = true;
+                entry.reject(error);
+            }
+        };
+        ['delta', 'result', 'error', 'cancelled'].forEach(type => source.addEventListener(type, handle(type)));
+
+        source.onopen = () => resolve(current);
+        source.onerror = () => {
+            // EventSource reconnects by itself (resuming from Last-Event-ID);
+            // once it gives up, fail what is pending and open a new session next time
+            if (source.readyState === EventSource.CLOSED) {
+                reject(new Error('Session stream closed'));
+                if (session === current) closeSession(new Error('Session stream closed'));
+            }
+        };
+    }));
+    current.ready.catch(() => {
+        if (session === current) session = null;
+    });
+    return current.ready;
+};
+
+const postRequest = (current, body) => fetch(`${baseURL}/session/${current.id}/requests`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'text/plain' },
+    body: JSON.stringify(body)
+});
+
+// Resolves with the same body the HTTP route returns; onDelta receives streamed text
+export const sessionRequest = async (type, payload, { channel, onDelta } = {}) => {
+    const current = await openSession();
+    const id = nextRequestId();
+    const result = new Promise((resolve, reject) => current.pending.set(id, { resolve, reject, onDelta, channel }));
+    const response = await postRequest(current, { id, type, channel, payload });
+    if (!response.ok) {
+        current.pending.delete(id);
+        if (response.status === 404) {
+            // The server dropped the session; the next request opens a new one
+            closeSession(new Error('Session expired'));
+        }
+        const data = await response.json().catch(() => ({}));
+        const error = new Error(data.error || `Session request failed with ${response.status}`);
+        // A busy server would turn the HTTP fallback away too
+        error.requestFailed = response.status === 400 || response.status === 429;
+        throw error;
+    }
+    return result;
+};
+
+// Stops the generations still running on a channel, e.g. when their panel is closed
+export const cancelSessionRequests = (channel) => {
+    if (!session?.id) return;
+    session.pending.forEach((entry, id) => {
+        if (entry.channel === channel) {
+            api.delete(`/session/${session.id}/requests/${id}`).catch(() => {});
+        }
+    });
+};
+
+const withFallback = async (viaSession, viaHttp) => {
+    try {
+        return await viaSession();
+    } catch (error) {
+        // Only fall back when the channel itself failed, not the generation
+        if (error.superseded || error.requestFailed) throw error;
+        console.warn('Session channel unavailable, using HTTP:', error.message);
+        return viaHttp();
+    }
+};
+
+// A newer explanation supersedes the one still streaming; the superseded
+// promise rejects with error.superseded set
+export const explainSentence = (sentence, topic, { onDelta } = {}) => withFallback(
+    () => sessionRequest('explain', { sentence, topic }, { channel: 'explain', onDelta }),
+    () => explainOverHttp(sentence, topic)
+);
+
+export const generateQuestions = (text, topic) => withFallback(
+    () => sessionRequest('questions', { text, topic }, { channel: 'questions' }),
+    () => questionsOverHttp(text, topic)
+);
+
+export const generateExamples = (text, topic, useCached = true) => withFallback(
+    () => examplesOverHttp(text, topic, useCached,
+        payload => sessionRequest('examples', payload, { channel: 'examples' })),
+    () => examplesOverHttp(text, topic, useCached)
+);